@@ -0,0 +1,46 @@
+from typing import Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.security import OAuth2PasswordBearer
+from jose import JWTError
+
+from app.core import security
+from app.services import user_service
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+
+_credentials_error = HTTPException(
+    status_code=status.HTTP_401_UNAUTHORIZED,
+    detail="Could not validate credentials",
+    headers={"WWW-Authenticate": "Bearer"},
+)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> dict:
+    """
+    Resolves the authenticated user's profile (with "id") from the bearer token.
+    FastAPI caches dependencies per request, so routes and their helpers share
+    one signature check (memoized across requests) and one profile read.
+    """
+    try:
+        claims = security.decode_access_token(token)
+    except JWTError:
+        raise _credentials_error
+
+    user_id = claims.get("sub")
+    if not user_id:
+        raise _credentials_error
+
+    user = await run_in_threadpool(user_service.get_user, user_id)
+    if not user:
+        raise _credentials_error
+    user["id"] = user_id
+    return user
+
+
+def check_user_id(user_id: Optional[str], current_user: dict) -> str:
+    """Routes still accept a user_id for older clients; it must be the caller's own."""
+    if user_id and user_id != current_user["id"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed to access another user")
+    return current_user["id"]
@@ -1,4 +1,7 @@
+from datetime import timedelta
+
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
 from app.services import user_service
 from app.core import security
@@ -7,22 +10,28 @@ from app.models.user import UserCreate
 router = APIRouter()
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = user_service.authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await user_service.authenticate_user_async(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username (email) or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = security.create_access_token(data={"sub": user["id"]})
+    access_token = security.create_access_token(
+        data={"sub": user["id"]},
+        expires_delta=timedelta(minutes=security.ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/register", response_model=dict)
-def register(user: UserCreate):
+async def register(user: UserCreate):
     # Check if email already exists
-    if user_service.get_user_by_email(user.email):
+    if await run_in_threadpool(user_service.get_user_by_email, user.email):
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    user_id = user_service.create_user(user)
+    # Hash on the password process pool, then store the already-hashed data
+    data = user.dict()
+    data["hashed_password"] = await security.get_password_hash_async(data.pop("password"))
+    user_id = await run_in_threadpool(user_service.create_user, data)
     return {"id": user_id, "message": "User created successfully"}
@@ -1,18 +1,24 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, BackgroundTasks, Depends
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from app.services.ai_chat import process_user_message
+from typing import Optional
+from app.api.deps import get_current_user, check_user_id
+from app.services.ai_chat import process_user_message_async, remember
 from app.services.nutrition_engine import update_latest_plan_meal
 
 router = APIRouter()
 
 class ChatRequest(BaseModel):
-    user_id: str
+    user_id: Optional[str] = None
     message: str
 
 @router.post("/")
-async def chat_endpoint(request: ChatRequest):
-    # 1. AI Processing
-    ai_response = process_user_message(request.message)
+async def chat_endpoint(request: ChatRequest, background_tasks: BackgroundTasks,
+                        current_user: dict = Depends(get_current_user)):
+    user_id = check_user_id(request.user_id, current_user)
+
+    # 1. AI Processing (with the user's plan and earlier turns as context)
+    ai_response = await process_user_message_async(request.message, user_id)
     
     # 2. Action Handling
     action_result = None
@@ -20,13 +26,17 @@ async def chat_endpoint(request: ChatRequest):
         entities = ai_response.get("entities", {})
         meal_type = entities.get("meal_type")
         keywords = entities.get("food_keywords") or []
+        exclude_keywords = entities.get("exclude_keywords") or []
         
         if meal_type:
             # Capitalize for matching (e.g. "dinner" -> "Dinner")
             meal_type = meal_type.capitalize() 
             
             # Execute change
-            action_result = update_latest_plan_meal(request.user_id, meal_type, keywords)
+            action_result = await run_in_threadpool(
+                update_latest_plan_meal, user_id, meal_type, keywords, exclude_keywords,
+                current_user.get("diet_type"),
+            )
             
             # Append result to AI message
             if action_result["success"]:
@@ -34,4 +44,6 @@ async def chat_endpoint(request: ChatRequest):
             else:
                  ai_response["message"] += f"\n\n(I tried to change it but: {action_result['message']})"
 
+    # 3. Memory, after the reply is sent
+    background_tasks.add_task(remember, user_id, request.message, ai_response)
     return ai_response
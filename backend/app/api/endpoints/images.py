@@ -0,0 +1,39 @@
+import re
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from app.core.config import settings
+from app.services import image_proxy
+
+router = APIRouter()
+
+_KEY_RE = re.compile(r"[0-9a-f]{32}")
+
+@router.get("/{key}")
+async def get_image(key: str, request: Request, name: Optional[str] = None, sig: Optional[str] = None):
+    """
+    Meal image by key (see image_proxy.image_url). No auth, since images are
+    loaded by <img> tags; instead, missing images are only fetched for a
+    name signed by the backend. An image never changes for its key, so
+    clients and CDNs may keep it for IMAGE_CACHE_MAX_AGE_SECONDS.
+    """
+    if not _KEY_RE.fullmatch(key):
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={settings.IMAGE_CACHE_MAX_AGE_SECONDS}, immutable"}
+    if etag in (tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        found = await image_proxy.get_image(key, name, sig)
+    except Exception as e:
+        print(f"Error fetching image {key}: {e}")
+        raise HTTPException(status_code=502, detail="Image unavailable", headers={"Cache-Control": "no-store"})
+    if found is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    path, content_type = found
+    return FileResponse(path, media_type=content_type, headers=headers)
@@ -1,52 +1,156 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from app.api.deps import get_current_user, check_user_id
+from app.core.responses import FastJSONResponse
+from app.services import ai_plan
+from app.services import image_proxy
 from app.services import nutrition_engine
-from app.services import user_service
-from app.db.firebase import get_db
+from app.services import plan_service
+from app.services import plan_jobs
 from app.models.user import UserBase, Gender
 
 router = APIRouter()
 
-@router.post("/generate")
-def generate_plan(user_id: str):
-    # 1. Fetch User
-    user_data = user_service.get_user(user_id)
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-    
+def _to_user(user_data: dict) -> UserBase:
     # Validation for missing Gender (legacy data support)
     if "gender" not in user_data:
         # Default or fail? Fails for now as required for Algo.
         # Ideally user should update profile.
         raise HTTPException(status_code=400, detail="User profile incomplete: missing gender")
 
-    user = UserBase(**user_data)
+    return UserBase(**user_data)
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@router.post("/generate")
+async def generate_plan(user_id: Optional[str] = None, job: bool = False, current_user: dict = Depends(get_current_user)):
+    # 1. User profile (already loaded by the auth dependency)
+    user_id = check_user_id(user_id, current_user)
+    user = _to_user(current_user)
+
+    # Job mode: queue the generation and let the client poll /jobs/{id}
+    if job:
+        plan_id, _ = await run_in_threadpool(plan_service.get_plan_pointer, user_id)
+        priority = plan_jobs.PRIORITY_NORMAL if plan_id else plan_jobs.PRIORITY_FIRST_PLAN
+        queued = await plan_jobs.submit(user_id, user, priority)
+        return JSONResponse(status_code=202, content=_job_status(queued))
+
+    # 2. Run Engine and save to Firestore. Double taps and retries share
+    # one generation and get the same plan_id.
+    try:
+        return await plan_jobs.generate_and_save(user_id, user)
+    except ai_plan.PlanGenerationError:
+        raise HTTPException(status_code=502, detail="Plan generation failed, please try again")
+
+def _job_status(job: dict) -> dict:
+    return {
+        "job_id": job["id"],
+        "status": job.get("status"),
+        "plan_id": job.get("plan_id"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "updated_at": job.get("updated_at"),
+    }
 
-    # 2. Run Engine
-    result = nutrition_engine.generate_weekly_plan(user)
+@router.get("/jobs/{job_id}")
+async def get_plan_job(job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await run_in_threadpool(plan_jobs.get_job, job_id)
+    if job is None or job.get("user_id") != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
 
-    # 3. Save to Firestore
-    db = get_db()
-    # Save as a subcollection 'meal_plans' for the user
-    # Or just a top level collection with userId. Subcollection is cleaner.
-    plan_ref = db.collection("users").document(user_id).collection("meal_plans").document()
-    plan_ref.set(result)
+    response = _job_status(job)
+    if job.get("status") == plan_jobs.DONE:
+        response["summary"] = await run_in_threadpool(plan_service.get_plan, job["user_id"], job["plan_id"])
+    return response
 
-    return {"plan_id": plan_ref.id, "summary": result}
+@router.post("/generate/stream")
+async def generate_plan_stream(user_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """
+    Server-Sent Events variant of /generate. Emits a `start` event with the
+    calorie targets, one `day` event per completed day and a final `done`
+    event with the plan_id once the plan has been saved.
+    """
+    user_id = check_user_id(user_id, current_user)
+    user = _to_user(current_user)
+    bmr, tdee, daily_target = nutrition_engine.calculate_targets(user)
+
+    async def events():
+        yield _sse("start", {"bmr": int(bmr), "tdee": int(tdee), "target_calories": daily_target})
+
+        days = []
+        try:
+            local = await run_in_threadpool(nutrition_engine.plan_locally, user, daily_target)
+            source = _iterate(local["plan"]) if local else ai_plan.stream_ai_weekly_plan(user, daily_target)
+            async for day in source:
+                days.append(day)
+                yield _sse("day", day)
+        except Exception as e:
+            print(f"Error streaming AI Plan: {e}")
+            yield _sse("error", {"detail": "Plan generation failed"})
+            return
+
+        # A failed save must end the stream too, or the client waits forever
+        try:
+            result = nutrition_engine.build_plan_result(bmr, tdee, daily_target, {"plan": days})
+            plan_id = await run_in_threadpool(plan_service.save_plan, user_id, result)
+        except Exception as e:
+            print(f"Error saving streamed plan: {e}")
+            yield _sse("error", {"detail": "Plan generation failed"})
+            return
+        image_proxy.prefetch_plan(result)
+        yield _sse("done", {"plan_id": plan_id})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _etag(plan_id: str, version: str) -> str:
+    # Weak, since compression changes the bytes on the wire
+    return f'W/"{plan_id}.{version}"'
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+def _not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
 
 @router.get("/latest")
-def get_latest_plan(user_id: str):
-    db = get_db()
-    plans_ref = db.collection("users").document(user_id).collection("meal_plans")
-    # Order by some timestamp ideally, but for now getting latest created
-    # Firestore auto-ids don't guarantee strict order, ideally we'd have a 'created_at' field.
-    # Assuming list returns in some order or we pick one. For robust implementation, add timestamp.
-    # Simple workaround: just stream and pick last? Or better, list(limit=1) if we had a query.
-    # Let's just getAll and pick last for now (simple mock behavior).
-    docs = plans_ref.stream()
-    all_plans = [doc.to_dict() for doc in docs]
-    
-    if not all_plans:
+def get_latest_plan(request: Request, user_id: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    user_id = check_user_id(user_id, current_user)
+
+    # Unchanged plan: the user document (read fresh, never from the cached
+    # profile) knows the latest version, so the plan is not read or serialized
+    plan_id, version = plan_service.get_plan_pointer(user_id)
+    if plan_id and version:
+        etag = _etag(plan_id, version)
+        if _etag_matches(request, etag):
+            return _not_modified(etag)
+
+    latest = plan_service.get_latest_plan(user_id, plan_id)
+    if latest is None:
         raise HTTPException(status_code=404, detail="No plan found for user")
-        
-    return {"summary": all_plans[-1]}
 
+    plan_id, plan = latest
+    etag = _etag(plan_id, plan_service.plan_version(plan))
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    return FastJSONResponse(
+        {"plan_id": plan_id, "summary": plan},
+        headers={"ETag": etag, "Cache-Control": "private, no-cache"},
+    )
@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
+from app.api.deps import get_current_user, check_user_id
 from app.models.user import UserBase, UserUpdate
 from app.services import user_service
 
@@ -13,14 +14,14 @@ def create_user_endpoint(user: UserBase):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/{user_id}", response_model=UserBase)
-def get_user_endpoint(user_id: str):
-    user_data = user_service.get_user(user_id)
-    if not user_data:
-        raise HTTPException(status_code=404, detail="User not found")
-    return user_data
+def get_user_endpoint(user_id: str, current_user: dict = Depends(get_current_user)):
+    # The profile was already loaded while authenticating the request
+    check_user_id(user_id, current_user)
+    return current_user
 
 @router.put("/{user_id}", response_model=dict)
-def update_user_endpoint(user_id: str, user: UserUpdate):
+def update_user_endpoint(user_id: str, user: UserUpdate, current_user: dict = Depends(get_current_user)):
+    check_user_id(user_id, current_user)
     try:
         user_service.update_user(user_id, user.dict(exclude_unset=True))
         return {"id": user_id, "message": "User updated successfully"}
@@ -1,11 +1,158 @@
+from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
 
+# Loaded once here so .env values (e.g. FIRESTORE_EMULATOR_HOST) reach the
+# libraries that read os.environ directly, not just Settings
+load_dotenv()
+
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Fitia Backend"
     API_V1_STR: str = "/api/v1"
+
+    # Request/dependency timing and GET /metrics (see app.core.metrics)
+    METRICS_ENABLED: bool = True
     FIREBASE_CREDENTIALS_PATH: str = ""
     FIREBASE_DATABASE_ID: str = "(default)" # Default database name
     GEMINI_API_KEY: str = ""
+
+    # Firestore client pool (see app.db.firebase)
+    FIRESTORE_POOL_SIZE: int = 1
+    FIRESTORE_KEEPALIVE_TIME_MS: int = 30000
+    FIRESTORE_KEEPALIVE_TIMEOUT_MS: int = 10000
+
+    # Password hashing (see app.core.security). Changing these rehashes
+    # existing passwords on their next successful login.
+    ARGON2_TIME_COST: int = 3
+    ARGON2_MEMORY_COST: int = 65536
+    ARGON2_PARALLELISM: int = 4
+    PASSWORD_HASH_WORKERS: int = 2
+
+    # User profile read-through cache (see app.services.user_service)
+    USER_CACHE_MAX_ENTRIES: int = 10000
+    USER_CACHE_TTL_SECONDS: int = 300
+    USER_CACHE_LISTENER: bool = False
+
+    # Decoded JWT claims cache (see security.decode_access_token)
+    TOKEN_CACHE_MAX_ENTRIES: int = 4096
+    TOKEN_CACHE_TTL_SECONDS: int = 300
+
+    # Chat messages the local intent classifier is at least this sure about
+    # skip Gemini (see app.services.intent_classifier); above 1.0 disables it
+    CHAT_INTENT_CONFIDENCE_THRESHOLD: float = 0.8
+
+    # Max concurrent Gemini calls per worker process (see app.services.ai_client)
+    AI_MAX_CONCURRENCY: int = 8
+
+    # Gemini call resilience (see app.services.ai_client). Deadlines cover a
+    # whole call, retries included. Retries and hedges are limited to
+    # AI_RETRY_BUDGET_RATIO of recent calls (plus a small floor per second).
+    # Hedging sends a second request once the first is slower than the
+    # AI_HEDGE_PERCENTILE latency. The breaker opens when
+    # AI_BREAKER_FAILURE_RATIO of the last AI_BREAKER_WINDOW calls failed.
+    AI_TIMEOUT_SECONDS: float = 60
+    AI_CHAT_TIMEOUT_SECONDS: float = 15
+    AI_PLAN_TIMEOUT_SECONDS: float = 90
+    AI_MAX_RETRIES: int = 2
+    AI_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    AI_RETRY_MAX_DELAY_SECONDS: float = 4
+    AI_RETRY_BUDGET_RATIO: float = 0.1
+    AI_RETRY_BUDGET_MIN_PER_SECOND: float = 0.2
+    AI_HEDGE_ENABLED: bool = False
+    AI_HEDGE_PERCENTILE: float = 0.95
+    AI_HEDGE_MIN_SAMPLES: int = 20
+    AI_BREAKER_FAILURE_RATIO: float = 0.5
+    AI_BREAKER_WINDOW: int = 20
+    AI_BREAKER_MIN_CALLS: int = 10
+    AI_BREAKER_COOLDOWN_SECONDS: float = 30
+
+    # Shared answers to recurring nutrition questions (see app.services.answer_cache).
+    # A question at least CHAT_ANSWER_CACHE_THRESHOLD similar (Jaccard over
+    # normalized words and trigrams) to a cached one gets its answer.
+    CHAT_ANSWER_CACHE_ENABLED: bool = True
+    CHAT_ANSWER_CACHE_THRESHOLD: float = 0.7
+    CHAT_ANSWER_CACHE_MAX_ENTRIES: int = 2000
+    CHAT_ANSWER_CACHE_TTL_SECONDS: int = 60 * 60 * 24
+
+    # Chat memory (see app.services.chat_memory): recent turns are kept up to
+    # CHAT_MEMORY_MAX_TOKENS (estimated); older ones are folded into a rolling
+    # summary of at most CHAT_SUMMARY_MAX_TOKENS
+    CHAT_MEMORY_ENABLED: bool = True
+    CHAT_MEMORY_FIRESTORE: bool = True
+    CHAT_MEMORY_MAX_TOKENS: int = 800
+    CHAT_SUMMARY_MAX_TOKENS: int = 200
+    CHAT_MEMORY_CACHE_MAX_ENTRIES: int = 10000
+    CHAT_MEMORY_CACHE_TTL_SECONDS: int = 1800
+
+    # Chat prompt prefix (system prompt + the user's plan) held in a Gemini
+    # context cache (see app.services.context_cache). Prefixes Gemini won't
+    # cache are sent inline instead.
+    CHAT_CONTEXT_CACHE_ENABLED: bool = True
+    CHAT_CONTEXT_CACHE_TTL_SECONDS: int = 3600
+    CHAT_CONTEXT_CACHE_MAX_ENTRIES: int = 4096
+    # Gemini's minimum size for explicit caching (4096 tokens for
+    # gemini-2.0-flash); smaller prefixes are sent inline without trying
+    CHAT_CONTEXT_CACHE_MIN_TOKENS: int = 4096
+
+    # Plan generation: "single" (one prompt for the week) or "fanout"
+    # (concurrent per-day prompts, see ai_plan._generate_fanout)
+    PLAN_GENERATION_MODE: str = "single"
+    AI_FANOUT_CONCURRENCY: int = 4
+
+    # Planning strategy: "ai" (always Gemini) or "local_first" (try the local
+    # optimizer on the recipe catalog, fall back to Gemini)
+    PLAN_STRATEGY: str = "ai"
+    PLAN_OPTIMIZER_CALORIE_TOLERANCE: float = 0.05
+    PLAN_OPTIMIZER_MACRO_TOLERANCE: float = 0.10
+
+    # Coalescing of concurrent /plans/generate calls (see app.services.plan_coalescing).
+    # Callers arriving within the window after a generation get that plan back;
+    # off by default, so a deliberate regenerate always makes a new plan.
+    PLAN_COALESCE_WINDOW_SECONDS: int = 0
+    PLAN_COALESCE_FIRESTORE: bool = True
+    PLAN_COALESCE_LEASE_SECONDS: int = 120
+    PLAN_COALESCE_POLL_SECONDS: float = 0.5
+
+    # Background plan jobs (POST /plans/generate?job=true, see app.services.plan_jobs)
+    PLAN_JOB_WORKERS: int = 2
+    PLAN_JOB_LEASE_SECONDS: int = 300
+    PLAN_JOB_RESUME: bool = True
+
+    # AI weekly plan cache (see app.services.plan_cache)
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_FIRESTORE: bool = True
+    PLAN_CACHE_MAX_ENTRIES: int = 512
+    PLAN_CACHE_TTL_SECONDS: int = 60 * 60 * 24
+    PLAN_CACHE_CALORIE_BUCKET: int = 50
+
+    # Recipe index used for meal swaps (see app.services.recipe_index)
+    RECIPE_INDEX_MAX_PLANS: int = 500
+    RECIPE_SWAP_CALORIE_TOLERANCE: float = 0.15
+
+    # Meal image proxy (see app.services.image_proxy): images are fetched once
+    # from IMAGE_UPSTREAM_URL, kept on disk up to IMAGE_CACHE_MAX_BYTES and
+    # served from GET /api/v1/images/{key}. Plans link to the proxy only once
+    # PUBLIC_BASE_URL (the backend's public origin, e.g. "https://api.example.com")
+    # is set, since the web client runs on another origin; until then they
+    # link to the upstream generator.
+    IMAGE_PROXY_ENABLED: bool = True
+    IMAGE_UPSTREAM_URL: str = "https://image.pollinations.ai/prompt/{prompt}"
+    IMAGE_CACHE_DIR: str = ""  # defaults to <tmp>/fitia-images
+    IMAGE_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+    IMAGE_CACHE_MAX_AGE_SECONDS: int = 60 * 60 * 24 * 365
+    IMAGE_FETCH_TIMEOUT_SECONDS: float = 60
+    IMAGE_FETCH_CONCURRENCY: int = 4
+    IMAGE_PREFETCH: bool = True
+    PUBLIC_BASE_URL: str = ""
+
+    # Response compression: brotli when brotli-asgi is installed, else gzip.
+    # Level 5 gets most of the size win at a fraction of level 9's CPU.
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_LEVEL: int = 5
+
+    # Startup: Firestore and Gemini clients are built on first use. WARMUP
+    # builds them and opens their connections in the background right after
+    # startup, so the first requests don't pay for it.
+    WARMUP: bool = False
     
     class Config:
         env_file = ".env"
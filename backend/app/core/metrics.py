@@ -0,0 +1,276 @@
+"""
+In-process metrics (histograms, counters, gauges) with Prometheus text
+output for GET /metrics, plus span() for timing calls to dependencies
+(Firestore, Gemini, argon2) and a timing middleware for requests. With
+METRICS_ENABLED off, span() returns a shared no-op context and the
+middleware is not installed.
+"""
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from app.core.config import settings
+
+# Latency buckets in seconds, from in-process fast paths up to slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+
+def _labels_tuple(value) -> tuple:
+    return value if isinstance(value, tuple) else (value,)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, description: str, label=()):
+        self.name = name
+        self.description = description
+        self.labels = _labels_tuple(label)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for values, value in sorted(self._series.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, label_value=(), amount: float = 1):
+        key = _labels_tuple(label_value)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def value(self, label_value=()) -> float:
+        with self._lock:
+            return self._series.get(_labels_tuple(label_value), 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, label_value, value: float):
+        with self._lock:
+            self._series[_labels_tuple(label_value)] = value
+
+    def dec(self, label_value=(), amount: float = 1):
+        self.inc(label_value, -amount)
+
+
+class Histogram(_Metric):
+    """
+    Thread-safe latency histogram with cumulative buckets (Prometheus style),
+    one series per label value (a string, or a tuple for several labels).
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, description: str, label=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, label)
+        self.buckets = tuple(buckets)
+
+    def observe(self, label_value, seconds: float):
+        key = _labels_tuple(label_value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    "buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series["buckets"][i] += 1
+            series["count"] += 1
+            series["sum"] += seconds
+
+    @contextmanager
+    def time(self, label_value):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(label_value, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """{label_value: {"buckets": {bound: count}, "count", "sum"}}"""
+        with self._lock:
+            return {
+                (key[0] if len(key) == 1 else key): {
+                    "buckets": dict(zip(self.buckets, series["buckets"])),
+                    "count": series["count"],
+                    "sum": series["sum"],
+                }
+                for key, series in self._series.items()
+            }
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labels, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {series['count']}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {series['sum']}")
+                lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, description: str, label, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, description, label, **kwargs)
+        return metric
+
+
+def histogram(name: str, description: str, label=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    """Returns the process-wide histogram called `name`, creating it on first use."""
+    return _get_or_create(Histogram, name, description, label, buckets=buckets)
+
+
+def counter(name: str, description: str, label=()) -> Counter:
+    return _get_or_create(Counter, name, description, label)
+
+
+def gauge(name: str, description: str, label=()) -> Gauge:
+    return _get_or_create(Gauge, name, description, label)
+
+
+def get_metrics() -> dict:
+    with _registry_lock:
+        return dict(_registry)
+
+
+def render_prometheus() -> str:
+    lines = []
+    for _, metric in sorted(get_metrics().items()):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Dependency spans --------------------------------------------------------
+
+dependency_latency = histogram(
+    "dependency_seconds", "Time spent in calls to Firestore, Gemini, argon2 and post-processing",
+    label=("dependency", "operation"),
+)
+dependency_errors = counter(
+    "dependency_errors_total", "Failed dependency calls", label=("dependency", "operation"),
+)
+dependency_in_flight = gauge(
+    "dependency_in_flight", "Dependency calls currently running", label=("dependency",),
+)
+
+
+@contextmanager
+def _span(dependency: str, operation: str):
+    key = (dependency, operation)
+    dependency_in_flight.inc(dependency)
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        dependency_errors.inc(key)
+        raise
+    finally:
+        dependency_latency.observe(key, time.perf_counter() - start)
+        dependency_in_flight.dec(dependency)
+
+
+def span(dependency: str, operation: str):
+    """
+    Times a block as one call to `dependency` (e.g. "firestore", "gemini"):
+        with metrics.span("firestore", "save_plan"): ...
+    """
+    if not settings.METRICS_ENABLED:
+        return _NOOP
+    return _span(dependency, operation)
+
+
+# --- Requests ----------------------------------------------------------------
+
+request_latency = histogram(
+    "http_request_seconds", "Request latency by route", label=("method", "route", "status"),
+)
+requests_in_flight = gauge("http_requests_in_flight", "Requests currently being served", label=("method",))
+request_errors = counter(
+    "http_request_errors_total", "Requests that failed with a 5xx or an exception", label=("method", "route"),
+)
+
+
+def _route_template(scope) -> str:
+    template = getattr(scope.get("route"), "path", None)
+    if template is None:
+        return "unmatched"
+    # Routes of included routers can be reported relative to the router
+    # prefix; take the prefix segments from the actual path.
+    path = scope["path"]
+    extra = path.rstrip("/").count("/") - template.rstrip("/").count("/")
+    if extra > 0:
+        template = "/".join(path.split("/")[:extra + 1]) + template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request, labelled with the route
+    template (e.g. /api/v1/plans/jobs/{job_id}) so ids don't blow up
+    cardinality. Streaming responses are timed until the last chunk.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        requests_in_flight.inc(method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException:
+            status["code"] = 500
+            raise
+        finally:
+            requests_in_flight.dec(method)
+            route = _route_template(scope)
+            request_latency.observe((method, route, str(status["code"])), time.perf_counter() - start)
+            if status["code"] >= 500:
+                request_errors.inc((method, route))
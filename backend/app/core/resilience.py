@@ -0,0 +1,133 @@
+"""
+Building blocks for calling a flaky upstream (Gemini): jittered backoff, a
+retry budget, a circuit breaker and a rolling latency window used to decide
+when to hedge. All are thread-safe, so the sync and async call paths can
+share them (see app.services.ai_client).
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open."""
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryBudget:
+    """
+    Token bucket that caps retries (and hedges) at `ratio` of recent calls,
+    plus `min_per_second` so a quiet process can still retry. When the
+    upstream is failing everywhere, retries stop instead of multiplying
+    its load.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 10.0, clock=time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._tokens = max_tokens
+        self._refilled_at = clock()
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        """Takes one token for a retry; False when the budget is exhausted."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.max_tokens, self._tokens + (now - self._refilled_at) * self.min_per_second)
+            self._refilled_at = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Opens when at least `failure_ratio` of the last `window` calls failed
+    (once `min_calls` have been seen). While open, allow() is False for
+    `cooldown_seconds`; then one probe call per cooldown is let through,
+    and its outcome closes or reopens the circuit.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_ratio: float, window: int, min_calls: int, cooldown_seconds: float,
+                 clock=time.monotonic):
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._outcomes = deque(maxlen=max(1, window))
+        self._state = self.CLOSED
+        self._next_probe = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            now = self._clock()
+            if now < self._next_probe:
+                return False
+            # One probe per cooldown; a probe that never reports back
+            # doesn't keep the circuit stuck
+            self._state = self.HALF_OPEN
+            self._next_probe = now + self.cooldown_seconds
+            return True
+
+    def record(self, success: bool):
+        with self._lock:
+            if self._state == self.OPEN:
+                return  # calls started before the circuit opened
+            if self._state == self.HALF_OPEN:
+                if success:
+                    self._state = self.CLOSED
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(success)
+            failures = self._outcomes.count(False)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._open()
+
+    def _open(self):
+        self._state = self.OPEN
+        self._next_probe = self._clock() + self.cooldown_seconds
+        self._outcomes.clear()
+
+
+class LatencyWindow:
+    """The last `size` latencies of successful calls, for percentile thresholds."""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float, min_samples: int = 1) -> float | None:
+        """The q-quantile (0..1) of the window, or None with fewer than min_samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
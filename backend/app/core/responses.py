@@ -0,0 +1,25 @@
+"""
+JSON encoding with orjson, several times faster than the stdlib encoder on
+plan-sized payloads. Values orjson doesn't know (Firestore timestamps,
+pydantic models) go through FastAPI's jsonable_encoder.
+"""
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(data, sort_keys: bool = False) -> bytes:
+    option = _OPTIONS | orjson.OPT_SORT_KEYS if sort_keys else _OPTIONS
+    return orjson.dumps(data, default=jsonable_encoder, option=option)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson. Return it directly from an endpoint
+    to also skip FastAPI's jsonable_encoder pass over the whole payload.
+    """
+
+    def render(self, content) -> bytes:
+        return dumps(content)
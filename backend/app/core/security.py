@@ -1,14 +1,30 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
 from passlib.context import CryptContext
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
 
 # Configuration
 SECRET_KEY = "CHANGE_THIS_IN_PRODUCTION_SECRET_KEY"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7 # 1 week
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+# Hashes made with other parameters are reported by needs_update() and get
+# rehashed on the next successful login.
+pwd_context = CryptContext(
+    schemes=["argon2"],
+    deprecated="auto",
+    argon2__rounds=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM,
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -16,6 +32,45 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+def verify_and_update_password(plain_password, hashed_password):
+    """Returns (valid, new_hash); new_hash is set when the stored hash is outdated."""
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# Argon2 is deliberately CPU/memory heavy. Running it on a small, dedicated
+# process pool keeps it off the event loop, the request threadpool and the GIL.
+_password_pool = None
+_password_pool_lock = threading.Lock()
+
+def _get_password_pool() -> ProcessPoolExecutor:
+    global _password_pool
+    if _password_pool is None:
+        with _password_pool_lock:
+            if _password_pool is None:
+                _password_pool = ProcessPoolExecutor(
+                    max_workers=max(1, settings.PASSWORD_HASH_WORKERS),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _password_pool
+
+async def get_password_hash_async(password):
+    loop = asyncio.get_running_loop()
+    with metrics.span("argon2", "hash"):
+        return await loop.run_in_executor(_get_password_pool(), get_password_hash, password)
+
+async def verify_and_update_password_async(plain_password, hashed_password):
+    loop = asyncio.get_running_loop()
+    with metrics.span("argon2", "verify"):
+        return await loop.run_in_executor(
+            _get_password_pool(), verify_and_update_password, plain_password, hashed_password
+        )
+
+def shutdown_password_pool():
+    global _password_pool
+    with _password_pool_lock:
+        pool, _password_pool = _password_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -25,3 +80,25 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+# Decoded claims per token. Entries never outlive the token's own expiry.
+_claims_cache = TTLCache(maxsize=settings.TOKEN_CACHE_MAX_ENTRIES, ttl=settings.TOKEN_CACHE_TTL_SECONDS)
+
+def get_token_cache_stats() -> dict:
+    return _claims_cache.stats()
+
+def decode_access_token(token: str) -> dict:
+    """
+    Verifies the token signature and expiry and returns its claims.
+    Raises jose.JWTError if the token is invalid. Valid tokens are memoized.
+    """
+    claims = _claims_cache.get(token)
+    if claims is not None:
+        return claims
+
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    remaining = claims.get("exp", 0) - time.time()
+    ttl = min(settings.TOKEN_CACHE_TTL_SECONDS, remaining)
+    if ttl > 0:
+        _claims_cache.set(token, claims, ttl=ttl)
+    return claims
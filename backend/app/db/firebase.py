@@ -1,36 +1,165 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import functools
+import itertools
+import os
+import threading
+
+from app.core import metrics
 from app.core.config import settings
 
-def get_db():
-    """
-    Initializes the Firebase app if not already initialized and returns the Firestore client.
-    """
-    if not firebase_admin._apps:
-        # Check if running in Emulator Mode
-        import os
-        if os.getenv("FIRESTORE_EMULATOR_HOST"):
-             import google.auth.credentials
-             cred = google.auth.credentials.AnonymousCredentials()
-             firebase_admin.initialize_app(cred, {'projectId': 'fitia-demo'})
-        elif settings.FIREBASE_CREDENTIALS_PATH:
-             # Explicit credentials file (e.g. local dev without emulator but with key)
-             cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
-             firebase_admin.initialize_app(cred)
-        else:
-             # Production (Cloud Run) - Use Application Default Credentials (ADC)
-             # Cloud Run injects the service account automatically.
-             firebase_admin.initialize_app()
-    
-    # Connect to the specific database
-    # firebase_admin.firestore.client() does not support 'database' arg in all versions.
-    # We use the direct Google Cloud Firestore client for named database support.
+EMULATOR_PROJECT_ID = "fitia-demo"
+
+# Process-wide client pool. Built once (on first use, or by warmup()) and
+# shared by every request instead of constructing a new client per call.
+# firebase_admin and google-cloud-firestore are imported at that point too,
+# so importing the app stays cheap.
+_lock = threading.Lock()
+_clients: list = []
+_client_cycle = None
+_async_client = None
+
+
+def _channel_options() -> list:
+    return [
+        ("grpc.keepalive_time_ms", settings.FIRESTORE_KEEPALIVE_TIME_MS),
+        ("grpc.keepalive_timeout_ms", settings.FIRESTORE_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+    ]
+
+
+def _tuned_api_helper(client, transport, client_class, client_module):
+    # Mirrors BaseClient._firestore_api_helper, but with our keepalive options
+    # (the library hardcodes a 30s keepalive and nothing else, and Client takes
+    # no transport or channel options). These are private internals, so the
+    # library version is pinned in requirements.txt and
+    # test_channels_get_our_keepalive_options fails if they move.
+    if client._firestore_api_internal is None and client._emulator_host is None:
+        channel = transport.create_channel(
+            client._target,
+            credentials=client._credentials,
+            options=_channel_options(),
+        )
+        client._transport = transport(host=client._target, channel=channel)
+        client._firestore_api_internal = client_class(
+            transport=client._transport, client_options=client._client_options
+        )
+        client_module._client_info = client._client_info
+    return client._firestore_api_internal
+
+
+@functools.cache
+def _pooled_classes():
+    """Returns (_PooledClient, _PooledAsyncClient), importing Firestore on first call."""
     from google.cloud import firestore as google_firestore
-    
-    # If using emulator, fall back to wrapper which handles localhost connection automatically
-    import os
+
+    class _PooledClient(google_firestore.Client):
+        def _firestore_api_helper(self, transport, client_class, client_module):
+            _tuned_api_helper(self, transport, client_class, client_module)
+            return super()._firestore_api_helper(transport, client_class, client_module)
+
+    class _PooledAsyncClient(google_firestore.AsyncClient):
+        def _firestore_api_helper(self, transport, client_class, client_module):
+            _tuned_api_helper(self, transport, client_class, client_module)
+            return super()._firestore_api_helper(transport, client_class, client_module)
+
+    return _PooledClient, _PooledAsyncClient
+
+
+def _init_firebase_app():
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if firebase_admin._apps:
+        return
+    # Check if running in Emulator Mode
+    if os.getenv("FIRESTORE_EMULATOR_HOST"):
+        import google.auth.credentials
+        cred = google.auth.credentials.AnonymousCredentials()
+        firebase_admin.initialize_app(cred, {'projectId': EMULATOR_PROJECT_ID})
+    elif settings.FIREBASE_CREDENTIALS_PATH:
+        # Explicit credentials file (e.g. local dev without emulator but with key)
+        cred = credentials.Certificate(settings.FIREBASE_CREDENTIALS_PATH)
+        firebase_admin.initialize_app(cred)
+    else:
+        # Production (Cloud Run) - Use Application Default Credentials (ADC)
+        # Cloud Run injects the service account automatically.
+        firebase_admin.initialize_app()
+
+
+def _build_client(client_class):
+    # We use the direct Google Cloud Firestore client for named database support
+    # (firebase_admin.firestore.client() does not support 'database' in all versions).
     if os.getenv("FIRESTORE_EMULATOR_HOST"):
-        return firestore.client()
-        
+        # The library picks up FIRESTORE_EMULATOR_HOST and opens an insecure channel.
+        import google.auth.credentials
+        return client_class(
+            project=EMULATOR_PROJECT_ID,
+            credentials=google.auth.credentials.AnonymousCredentials(),
+        )
     # Production: Use direct client with database ID and ADC
-    return google_firestore.Client(database=settings.FIREBASE_DATABASE_ID)
+    return client_class(database=settings.FIREBASE_DATABASE_ID)
+
+
+def init_db():
+    """
+    Initializes the Firebase app and the process-wide Firestore client pool.
+    Safe to call more than once; only the first call builds the clients.
+    """
+    global _client_cycle, _async_client
+    with _lock:
+        if _clients:
+            return
+        with metrics.span("firestore", "init_db"):
+            _init_firebase_app()
+            pooled_client, pooled_async_client = _pooled_classes()
+            pool_size = max(1, settings.FIRESTORE_POOL_SIZE)
+            _clients.extend(_build_client(pooled_client) for _ in range(pool_size))
+            _client_cycle = itertools.cycle(_clients)
+            _async_client = _build_client(pooled_async_client)
+
+
+def get_db():
+    """
+    Returns a pooled Firestore client (round-robin over the channel pool).
+    Initializes the pool on first use if the app startup hook did not run.
+    """
+    if not _clients:
+        init_db()
+    with _lock:
+        return next(_client_cycle)
+
+
+def get_async_db():
+    """Returns the process-wide Firestore AsyncClient."""
+    if _async_client is None:
+        init_db()
+    return _async_client
+
+
+def warmup():
+    """
+    Builds the client pool and opens every channel with a point read of a
+    document that doesn't exist, so the first requests find them connected.
+    """
+    init_db()
+    with metrics.span("firestore", "warmup"):
+        for client in list(_clients):
+            client.collection("_warmup").document("ping").get()
+
+
+async def close_db():
+    """Closes the pooled channels. Called at app shutdown."""
+    global _client_cycle, _async_client
+    with _lock:
+        clients, _clients[:] = list(_clients), []
+        async_client, _async_client = _async_client, None
+        _client_cycle = None
+
+    for client in clients:
+        transport = getattr(client, "_transport", None)
+        if transport is not None:
+            transport.close()
+    if async_client is not None:
+        transport = getattr(async_client, "_transport", None)
+        if transport is not None:
+            await transport.close()
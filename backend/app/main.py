@@ -1,9 +1,57 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse
+
+from app.api.endpoints import users, plans, chat, auth, images
+from app.core import metrics, security
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
+from app.core.security import shutdown_password_pool
+from app.db import firebase
+from app.services import ai_client, image_proxy, user_service, plan_jobs, plan_cache, recipe_index
+
+
+async def _warmup():
+    results = await asyncio.gather(asyncio.to_thread(firebase.warmup), ai_client.warmup(), return_exceptions=True)
+    for name, result in zip(("Firestore", "Gemini"), results):
+        if isinstance(result, Exception):
+            print(f"{name} warmup failed: {result}")
+
+
+async def _background_startup():
+    """Startup work that needs Firestore or Gemini; runs after the app is serving."""
+    if settings.WARMUP:
+        await _warmup()
+    await asyncio.to_thread(recipe_index.warmup)
+    try:
+        await asyncio.to_thread(user_service.start_cache_listener)
+    except Exception as e:
+        print(f"Could not start the user cache listener: {e}")
+    if settings.PLAN_JOB_RESUME:
+        await plan_jobs.resume()
+
 
-from app.api.endpoints import users, plans, chat, auth
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here waits on Firestore or Gemini: their clients are built on
+    # first use (or by the background warmup), so cold starts serve sooner
+    await plan_jobs.start(resume_pending=False)
+    startup = asyncio.create_task(_background_startup())
+    yield
+    startup.cancel()
+    await asyncio.gather(startup, return_exceptions=True)
+    await plan_jobs.stop()
+    await image_proxy.close()
+    user_service.stop_cache_listener()
+    await firebase.close_db()
+    shutdown_password_pool()
 
-app = FastAPI(title="Fitia Backend", version="1.0.0")
+
+app = FastAPI(title="Fitia Backend", version="1.0.0", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configure CORS
 app.add_middleware(
@@ -14,6 +62,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON responses (plans, job results); SSE streams and the
+# already-compressed meal images are left alone
+try:
+    from brotli_asgi import BrotliMiddleware
+    app.add_middleware(BrotliMiddleware, quality=settings.COMPRESSION_LEVEL, minimum_size=settings.COMPRESSION_MIN_BYTES,
+                       excluded_handlers=[r".*/stream$", r".*/images/.*"])
+except ImportError:
+    app.add_middleware(GZipMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES, compresslevel=settings.COMPRESSION_LEVEL,
+                       exclude_content_types=("text/event-stream", *image_proxy.EXTENSIONS))
+
+# Request timing; not installed at all when metrics are off
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
 import logging
@@ -30,7 +92,26 @@ app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
 app.include_router(plans.router, prefix="/api/v1/plans", tags=["plans"])
 app.include_router(chat.router, prefix="/api/v1/chat", tags=["chat"])
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
+app.include_router(images.router, prefix="/api/v1/images", tags=["images"])
 
 @app.get("/")
 def health_check():
     return {"status": "ok", "app": "Fitia Backend"}
+
+cache_stats = metrics.gauge("cache_stat", "Cache sizes, hits and misses", label=("cache", "stat"))
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+    # Cache counters are read at scrape time
+    for cache, stats in (
+        ("plan", plan_cache.get_stats()),
+        ("user", user_service.get_cache_stats()),
+        ("token", security.get_token_cache_stats()),
+    ):
+        for stat, value in stats.items():
+            cache_stats.set((cache, stat), value)
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
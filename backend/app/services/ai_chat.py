@@ -1,19 +1,13 @@
 # Validating against Enum value (backend uses 'Male', 'Female')
-# New SDK Import
-import os
+import asyncio
+import re
 import json
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+import time
+from app.core import metrics
+from app.core.config import settings
+from app.services import ai_client, answer_cache, chat_memory, context_cache, intent_classifier, plan_service
 
-load_dotenv()
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    print("Warning: GEMINI_API_KEY not found in env")
-
-# Configure Client
-client = genai.Client(api_key=GEMINI_API_KEY)
+CHAT_MODEL = 'gemini-2.0-flash'
 
 # System Prompt
 SYSTEM_PROMPT = """
@@ -28,7 +22,8 @@ Estructura:
     "intent": "CHANGE_MEAL" | "QUESTION",
     "entities": {
         "meal_type": "Breakfast" | "Lunch" | "Dinner" | "Snack" | null,
-        "food_keywords": ["pollo", "ensalada"] | null # palabras clave para buscar
+        "food_keywords": ["pollo", "ensalada"] | null, # palabras clave para buscar
+        "exclude_keywords": ["pescado"] | null # ingredientes que el usuario no quiere
     },
     "message": "Respuesta legible para el usuario en Español"
 }
@@ -38,33 +33,213 @@ Si el usuario hace una pregunta, pon intent en "QUESTION", entities en null, y d
 Mantén "message" conciso y amigable, SIEMPRE en Español.
 """
 
+# Bump when SYSTEM_PROMPT or the plan summary format changes, so cached
+# prefixes built from the old ones stop being used
+CONTEXT_VERSION = 1
+
+SUMMARY_PROMPT = """
+Resume en español, en un máximo de {words} palabras, lo que se sabe del usuario por esta conversación con su nutricionista: preferencias, alimentos que evita, objetivos y cambios hechos a su plan. Devuelve solo el resumen, sin formato.
+"""
+
+FALLBACK_RESPONSE = {
+    "intent": "unknown",
+    "message": "Estoy teniendo problemas para pensar claramente ahora mismo. Por favor intenta de nuevo."
+}
+
+# Chat latency by path: "local" (intent classifier), "cache" (answer cache) or "gemini"
+chat_latency = metrics.histogram(
+    "chat_message_seconds", "Time to answer a chat message", label="path"
+)
+
+def _request_kwargs(message: str) -> dict:
+    from google.genai import types
+    return {
+        "model": CHAT_MODEL, # Or gemini-1.5-flash
+        "contents": f"{SYSTEM_PROMPT}\n\nUser: {message}\n\nResponse (JSON):",
+        "config": types.GenerateContentConfig(
+            response_mime_type='application/json'
+        ),
+    }
+
+def _plan_summary(plan: dict | None) -> str:
+    """The user's current plan, one line per meal, for the chat context."""
+    if not plan or not plan.get("plan"):
+        return "El usuario todavía no tiene un plan de comidas."
+    lines = [f"Plan actual del usuario ({plan.get('target_calories', '?')} kcal/día objetivo):"]
+    for day in plan["plan"]:
+        lines.append(f"{day.get('day')} ({day.get('total_calories', 0)} kcal):")
+        for meal in day.get("meals", []):
+            ingredients = ", ".join(str(item) for item in meal.get("ingredients") or [])
+            lines.append(
+                f"- {meal.get('meal_type')}: {meal.get('name')} | {meal.get('calories')} kcal, "
+                f"P {meal.get('protein')} g, C {meal.get('carbs')} g, G {meal.get('fats')} g | {ingredients}"
+            )
+    return "\n".join(lines)
+
+def _context_key(user_id: str, plan_id: str | None, version: str | None) -> str:
+    # Users without a plan all share the bare system prompt
+    if not plan_id:
+        return context_cache.cache_key(CONTEXT_VERSION, CHAT_MODEL)
+    return context_cache.cache_key(CONTEXT_VERSION, CHAT_MODEL, user_id, plan_id, version)
+
+async def _context(client, user_id: str) -> dict:
+    """
+    Config fields carrying the static system prompt plus the user's current
+    plan, preferably as a Gemini cached context. The prefix is keyed by the
+    plan's version, so while the plan is unchanged only the user document
+    is read from Firestore and the prefix is not resent.
+    """
+    plan_id, version = await asyncio.to_thread(plan_service.get_plan_pointer, user_id)
+    if plan_id and version:
+        cached = context_cache.lookup(_context_key(user_id, plan_id, version))
+        if cached is not None:
+            return cached
+
+    latest = await asyncio.to_thread(plan_service.get_latest_plan, user_id, plan_id)
+    plan_id, plan = latest if latest else (None, None)
+    key = _context_key(user_id, plan_id, plan_service.plan_version(plan) if plan else None)
+    instruction = f"{SYSTEM_PROMPT}\n{_plan_summary(plan)}"
+    return await context_cache.get_or_create(client, key, CHAT_MODEL, instruction)
+
+async def _conversation_kwargs(client, message: str, user_id: str) -> dict:
+    from google.genai import types
+    context, history = await asyncio.gather(
+        _context(client, user_id),
+        asyncio.to_thread(chat_memory.load, user_id),
+    )
+    history = chat_memory.render(history)
+    contents = f"{history}\n\nUser: {message}\n\nResponse (JSON):" if history else f"User: {message}\n\nResponse (JSON):"
+    return {
+        "model": CHAT_MODEL,
+        "contents": contents,
+        "config": types.GenerateContentConfig(response_mime_type='application/json', **context),
+    }
+
+def _parse_response(response) -> dict:
+    text_response = response.text.strip()
+
+    # Robust JSON extraction
+    json_match = re.search(r'(\{.*\})', text_response, re.DOTALL)
+
+    if json_match:
+        json_str = json_match.group(1)
+        return json.loads(json_str)
+    else:
+        # Fallback if no JSON found
+        return json.loads(text_response) # Try direct parse just in case
+
 def process_user_message(message: str) -> dict:
+    start = time.perf_counter()
+    # Plain swap commands are resolved locally, without a Gemini round trip
+    local = intent_classifier.resolve(message)
+    if local is not None:
+        chat_latency.observe("local", time.perf_counter() - start)
+        return local
+
+    # Recurring general questions are answered from the shared cache
+    cached = answer_cache.lookup(message)
+    if cached is not None:
+        chat_latency.observe("cache", time.perf_counter() - start)
+        return cached
+
     try:
-        # New SDK Call
-        response = client.models.generate_content(
-            model='gemini-2.0-flash', # Or gemini-1.5-flash
-            contents=f"{SYSTEM_PROMPT}\n\nUser: {message}\n\nResponse (JSON):",
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json' 
-            )
+        response = ai_client.generate_content_sync(
+            ai_client.get_client(), operation="chat", timeout=settings.AI_CHAT_TIMEOUT_SECONDS,
+            parse=_parse_response, **_request_kwargs(message),
         )
-        
-        text_response = response.text.strip()
-        
-        # Robust JSON extraction
-        import re
-        json_match = re.search(r'(\{.*\})', text_response, re.DOTALL)
-        
-        if json_match:
-            json_str = json_match.group(1)
-            return json.loads(json_str)
+        answer_cache.store(message, response)
+        return response
+
+    except Exception as e:
+        print(f"Error calling Gemini or parsing response: {e}")
+        return dict(FALLBACK_RESPONSE)
+    finally:
+        chat_latency.observe("gemini", time.perf_counter() - start)
+
+async def process_user_message_async(message: str, user_id: str | None = None) -> dict:
+    """
+    Same as process_user_message, but awaits the genai async client.
+    With a user_id the assistant also sees the user's current plan and
+    the conversation so far (see remember()). General questions the shared
+    answer cache takes are answered without that context, since their
+    answers are served to every user.
+    """
+    start = time.perf_counter()
+    local = intent_classifier.resolve(message)
+    if local is not None:
+        chat_latency.observe("local", time.perf_counter() - start)
+        return local
+
+    cached = answer_cache.lookup(message)
+    if cached is not None:
+        chat_latency.observe("cache", time.perf_counter() - start)
+        return cached
+
+    try:
+        client = ai_client.get_client()
+        shared = answer_cache.cacheable(message)
+        if user_id and settings.CHAT_MEMORY_ENABLED and not shared:
+            kwargs = await _conversation_kwargs(client, message, user_id)
         else:
-            # Fallback if no JSON found
-            return json.loads(text_response) # Try direct parse just in case
+            kwargs = _request_kwargs(message)
+        response = await ai_client.generate_content(
+            client, operation="chat", timeout=settings.AI_CHAT_TIMEOUT_SECONDS,
+            parse=_parse_response, **kwargs,
+        )
+        if shared:
+            answer_cache.store(message, response)
+        return response
 
     except Exception as e:
         print(f"Error calling Gemini or parsing response: {e}")
-        return {
-            "intent": "unknown",
-            "message": "Estoy teniendo problemas para pensar claramente ahora mismo. Por favor intenta de nuevo."
-        }
+        return dict(FALLBACK_RESPONSE)
+    finally:
+        chat_latency.observe("gemini", time.perf_counter() - start)
+
+async def _summarize(summary: str, evicted: list[dict]) -> str:
+    """Folds turns that left the memory window into the rolling summary."""
+    from google.genai import types
+    words = max(10, settings.CHAT_SUMMARY_MAX_TOKENS * 3 // 4)
+    contents = SUMMARY_PROMPT.format(words=words)
+    if summary:
+        contents += f"\nResumen anterior: {summary}\n"
+    contents += f"\nConversación:\n{chat_memory.format_turns(evicted)}"
+    try:
+        text = await ai_client.generate_content(
+            ai_client.get_client(), operation="chat_summary", timeout=settings.AI_CHAT_TIMEOUT_SECONDS,
+            parse=lambda response: response.text.strip(),
+            model=CHAT_MODEL, contents=contents,
+            config=types.GenerateContentConfig(max_output_tokens=settings.CHAT_SUMMARY_MAX_TOKENS),
+        )
+        if text:
+            return text
+    except Exception as e:
+        print(f"Error summarizing chat history: {e}")
+    return chat_memory.fallback_summary(summary, evicted)
+
+async def remember(user_id: str, message: str, response: dict):
+    """
+    Adds an exchange to the user's chat memory. Turns beyond the
+    CHAT_MEMORY_MAX_TOKENS window are folded into the rolling summary.
+    Both steps are atomic updates of the stored history, so exchanges
+    remembered at the same time (on any worker) are all kept.
+    Meant to run after the reply has been sent.
+    """
+    if not settings.CHAT_MEMORY_ENABLED:
+        return
+
+    def add(history):
+        chat_memory.append(history, chat_memory.USER, message)
+        chat_memory.append(history, chat_memory.ASSISTANT, response.get("message", ""))
+
+    history = await asyncio.to_thread(chat_memory.update, user_id, add)
+    if history is None:
+        return
+    previous = history["summary"]
+    evicted = chat_memory.overflow(history)
+    if not evicted:
+        return
+    # Summarized outside the update: Gemini is too slow to hold a transaction open
+    summary = await _summarize(previous, evicted)
+    await asyncio.to_thread(chat_memory.update, user_id,
+                            lambda history: chat_memory.fold(history, evicted, previous, summary))
@@ -0,0 +1,352 @@
+import asyncio
+import threading
+import time
+import weakref
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, RetryBudget, backoff_delay
+
+# One genai client per process, shared by ai_plan and ai_chat. Built on
+# first use so importing the app (and serving / or /metrics) doesn't pay
+# for importing google-genai and constructing the client.
+_client = None
+_client_lock = threading.Lock()
+
+# One semaphore per event loop (uvicorn runs one loop per worker process), so
+# at most AI_MAX_CONCURRENCY Gemini calls are in flight per process.
+_semaphores = weakref.WeakKeyDictionary()
+
+# Process-wide resilience state, built from settings on first use (see reset())
+_breaker = None
+_budget = None
+_latencies = {}
+_state_lock = threading.Lock()
+
+ai_tokens = metrics.counter("ai_tokens_total", "Gemini tokens used", label=("kind",))
+ai_outcomes = metrics.counter(
+    "ai_call_outcomes_total",
+    "Gemini call outcomes: success, error, timeout, invalid_output, retry, hedge, hedge_won, "
+    "budget_exhausted, circuit_open",
+    label=("operation", "outcome"),
+)
+ai_circuit_open = metrics.gauge("ai_circuit_open", "1 while the Gemini circuit breaker is open or probing")
+
+
+def get_client():
+    """Returns the process-wide genai.Client, creating it on first call."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai
+                if not settings.GEMINI_API_KEY:
+                    print("Warning: GEMINI_API_KEY not found in env")
+                _client = genai.Client(api_key=settings.GEMINI_API_KEY)
+    return _client
+
+
+def set_client(client):
+    """Replaces the shared client (fakes for benchmarks)."""
+    global _client
+    _client = client
+
+
+async def warmup():
+    """Builds the client and opens its connection with a metadata call (no tokens used)."""
+    client = await asyncio.to_thread(get_client)
+    with metrics.span("gemini", "warmup"):
+        await client.aio.models.get(model='gemini-2.0-flash')
+
+
+def reset():
+    """Rebuilds the circuit breaker, retry budget and latency windows from settings."""
+    global _breaker, _budget
+    with _state_lock:
+        _breaker = CircuitBreaker(
+            settings.AI_BREAKER_FAILURE_RATIO, settings.AI_BREAKER_WINDOW,
+            settings.AI_BREAKER_MIN_CALLS, settings.AI_BREAKER_COOLDOWN_SECONDS,
+        )
+        _budget = RetryBudget(settings.AI_RETRY_BUDGET_RATIO, settings.AI_RETRY_BUDGET_MIN_PER_SECOND)
+        _latencies.clear()
+    ai_circuit_open.set((), 0)
+
+
+def _get_breaker() -> CircuitBreaker:
+    if _breaker is None:
+        reset()
+    return _breaker
+
+
+def _get_budget() -> RetryBudget:
+    if _budget is None:
+        reset()
+    return _budget
+
+
+def _latency_window(operation: str) -> LatencyWindow:
+    with _state_lock:
+        window = _latencies.get(operation)
+        if window is None:
+            window = _latencies[operation] = LatencyWindow()
+        return window
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max(1, settings.AI_MAX_CONCURRENCY))
+        _semaphores[loop] = semaphore
+    return semaphore
+
+
+def _count_tokens(usage):
+    if usage is None or not settings.METRICS_ENABLED:
+        return
+    ai_tokens.inc("prompt", getattr(usage, "prompt_token_count", None) or 0)
+    ai_tokens.inc("output", getattr(usage, "candidates_token_count", None) or 0)
+    # Part of the prompt served from a context cache (see app.services.context_cache)
+    ai_tokens.inc("cached", getattr(usage, "cached_content_token_count", None) or 0)
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Timeouts, rate limits, 5xx and connection errors: worth a retry, and count against the breaker."""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    import httpx
+    from google.genai import errors
+    if isinstance(error, errors.APIError):
+        return error.code in (408, 429) or (error.code or 0) >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def _outcome(error: Exception) -> str:
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+        return "timeout"
+    if isinstance(error, ValueError):
+        return "invalid_output"
+    return "error"
+
+
+def _record(success: bool):
+    breaker = _get_breaker()
+    breaker.record(success)
+    ai_circuit_open.set((), 0 if breaker.state == CircuitBreaker.CLOSED else 1)
+
+
+def _check_circuit(operation: str):
+    if not _get_breaker().allow():
+        ai_outcomes.inc((operation, "circuit_open"))
+        raise CircuitOpenError("Gemini circuit breaker is open")
+
+
+def _retry_allowed(operation: str, error: Exception, attempt: int, time_left: float) -> bool:
+    """Provider failures and unparseable output are retried, within AI_MAX_RETRIES, the deadline and the budget."""
+    if not (_is_provider_failure(error) or isinstance(error, ValueError)):
+        return False
+    if attempt > settings.AI_MAX_RETRIES or time_left <= 0:
+        return False
+    if not _get_budget().try_spend():
+        ai_outcomes.inc((operation, "budget_exhausted"))
+        return False
+    ai_outcomes.inc((operation, "retry"))
+    return True
+
+
+def _with_http_timeout(kwargs: dict, seconds: float) -> dict:
+    from google.genai import types
+    config = kwargs.get("config") or types.GenerateContentConfig()
+    http_options = (config.http_options or types.HttpOptions()).model_copy(update={"timeout": max(1, int(seconds * 1000))})
+    return {**kwargs, "config": config.model_copy(update={"http_options": http_options})}
+
+
+async def _acquire_slot(deadline: float) -> asyncio.Semaphore:
+    """
+    Waits for one of the AI_MAX_CONCURRENCY slots until `deadline` (loop
+    time), so time spent queued counts against the call's timeout.
+    """
+    loop = asyncio.get_running_loop()
+    semaphore = _get_semaphore()
+    await asyncio.wait_for(semaphore.acquire(), max(0.0, deadline - loop.time()))
+    return semaphore
+
+
+async def _request(client, operation: str, deadline: float, kwargs: dict):
+    """One request to Gemini, queueing included, bounded by `deadline` (loop time)."""
+    loop = asyncio.get_running_loop()
+    semaphore = await _acquire_slot(deadline)
+    try:
+        started = time.perf_counter()
+        try:
+            with metrics.span("gemini", operation):
+                response = await asyncio.wait_for(client.aio.models.generate_content(**kwargs),
+                                                  deadline - loop.time())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            _record(not _is_provider_failure(e))
+            raise
+        _record(True)
+        _latency_window(operation).observe(time.perf_counter() - started)
+    finally:
+        semaphore.release()
+    _count_tokens(getattr(response, "usage_metadata", None))
+    return response
+
+
+def _hedge_delay(operation: str) -> float | None:
+    if not settings.AI_HEDGE_ENABLED:
+        return None
+    return _latency_window(operation).percentile(settings.AI_HEDGE_PERCENTILE, settings.AI_HEDGE_MIN_SAMPLES)
+
+
+async def _hedged_request(client, operation: str, deadline: float, kwargs: dict):
+    """
+    A request that, if it is slower than the AI_HEDGE_PERCENTILE latency of
+    this operation, gets a second identical request (paid from the retry
+    budget). The first to succeed wins and the other is cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = [asyncio.ensure_future(_request(client, operation, deadline, kwargs))]
+    try:
+        delay = _hedge_delay(operation)
+        if delay is None or delay >= deadline - loop.time():
+            return await tasks[0]
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return tasks[0].result()
+        if not _get_budget().try_spend():
+            ai_outcomes.inc((operation, "budget_exhausted"))
+            return await tasks[0]
+
+        ai_outcomes.inc((operation, "hedge"))
+        tasks.append(asyncio.ensure_future(_request(client, operation, deadline, kwargs)))
+        pending, error = set(tasks), None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is tasks[1]:
+                        ai_outcomes.inc((operation, "hedge_won"))
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def generate_content(client, operation: str = "generate_content", timeout: float | None = None,
+                           parse=None, **kwargs):
+    """
+    Calls Gemini through the genai async client without blocking the event loop.
+    Waits for a free slot when AI_MAX_CONCURRENCY calls are already running.
+
+    The whole call, retries included, must finish within `timeout` seconds
+    (AI_TIMEOUT_SECONDS by default). Rate limits, 5xx, connection errors and
+    output that `parse` rejects with ValueError are retried with jittered
+    backoff, up to AI_MAX_RETRIES and while the retry budget allows. Raises
+    CircuitOpenError without calling Gemini while the breaker is open.
+    Returns parse(response) when `parse` is given, else the response.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or settings.AI_TIMEOUT_SECONDS)
+    _get_budget().record_call()
+    attempt = 0
+    while True:
+        attempt += 1
+        _check_circuit(operation)
+        try:
+            response = await _hedged_request(client, operation, deadline, kwargs)
+            result = parse(response) if parse else response
+        except Exception as e:
+            ai_outcomes.inc((operation, _outcome(e)))
+            delay = backoff_delay(attempt, settings.AI_RETRY_BASE_DELAY_SECONDS, settings.AI_RETRY_MAX_DELAY_SECONDS)
+            if not _retry_allowed(operation, e, attempt, deadline - loop.time() - delay):
+                raise
+            await asyncio.sleep(delay)
+            continue
+        ai_outcomes.inc((operation, "success"))
+        return result
+
+
+def generate_content_sync(client, operation: str = "generate_content", timeout: float | None = None,
+                          parse=None, **kwargs):
+    """
+    Blocking counterpart of generate_content for the sync code paths: same
+    deadline, retries, budget and breaker, without hedging. The deadline is
+    enforced through the request's HTTP timeout.
+    """
+    deadline = time.monotonic() + (timeout or settings.AI_TIMEOUT_SECONDS)
+    _get_budget().record_call()
+    attempt = 0
+    while True:
+        attempt += 1
+        _check_circuit(operation)
+        try:
+            try:
+                with metrics.span("gemini", operation):
+                    response = client.models.generate_content(
+                        **_with_http_timeout(kwargs, deadline - time.monotonic())
+                    )
+            except Exception as e:
+                _record(not _is_provider_failure(e))
+                raise
+            _record(True)
+            _count_tokens(getattr(response, "usage_metadata", None))
+            result = parse(response) if parse else response
+        except Exception as e:
+            ai_outcomes.inc((operation, _outcome(e)))
+            delay = backoff_delay(attempt, settings.AI_RETRY_BASE_DELAY_SECONDS, settings.AI_RETRY_MAX_DELAY_SECONDS)
+            if not _retry_allowed(operation, e, attempt, deadline - time.monotonic() - delay):
+                raise
+            time.sleep(delay)
+            continue
+        ai_outcomes.inc((operation, "success"))
+        return result
+
+
+async def generate_content_stream(client, operation: str = "generate_content_stream",
+                                  timeout: float | None = None, **kwargs):
+    """
+    Streams a Gemini response, yielding text chunks as they arrive.
+    Holds a concurrency slot for the whole stream, which must finish,
+    waiting for the slot included, within `timeout`. Not retried, since
+    chunks may already have been used; the breaker still fails it fast and
+    records its outcome.
+    """
+    _check_circuit(operation)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + (timeout or settings.AI_TIMEOUT_SECONDS)
+    usage = None
+    try:
+        semaphore = await _acquire_slot(deadline)
+    except Exception as e:
+        ai_outcomes.inc((operation, _outcome(e)))
+        raise
+    try:
+        try:
+            with metrics.span("gemini", operation):
+                stream = await asyncio.wait_for(client.aio.models.generate_content_stream(**kwargs),
+                                                deadline - loop.time())
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), deadline - loop.time())
+                    except StopAsyncIteration:
+                        break
+                    # Usage is cumulative; the last chunk carries the totals
+                    usage = getattr(chunk, "usage_metadata", None) or usage
+                    if chunk.text:
+                        yield chunk.text
+        except Exception as e:
+            _record(not _is_provider_failure(e))
+            ai_outcomes.inc((operation, _outcome(e)))
+            raise
+    finally:
+        semaphore.release()
+    _record(True)
+    ai_outcomes.inc((operation, "success"))
+    _count_tokens(usage)
@@ -1,85 +1,91 @@
-import os
+import copy
 import json
-import urllib.parse
-from dotenv import load_dotenv
-from google import genai
-from google.genai import types
+import asyncio
+from app.core.config import settings
 from app.models.user import UserBase, PreparationStyle, PlanningMode
+from app.core import metrics
+from app.services import ai_client, image_proxy, plan_cache
 
-load_dotenv()
-
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-client = genai.Client(api_key=GEMINI_API_KEY)
+COMPACT_FORMAT = """
+Formato de respuesta (claves cortas, definidas por el esquema JSON):
+- "m": comidas del día, una por cada tipo de la Distribución de Comidas y en ese mismo orden.
+- Cada comida: "n" nombre creativo del plato, "k" calorías (kcal), "p" proteína (g),
+  "c" carbohidratos (g), "f" grasas (g), "i" lista de ingredientes, "r" minutos de preparación.
+"""
 
 SYSTEM_PROMPT = """
 Eres un Nutricionista Experto de Fitia. Tu tarea es generar un plan de comidas semanal PERSONALIZADO y REGIONAL.
 Utiliza los datos del usuario (País, Región, Objetivo, Calorías) para sugerir platos típicos o disponibles en su zona.
+El idioma debe ser ESPAÑOL. "d" contiene los 7 días, de Lunes a Domingo y en ese orden.
+""" + COMPACT_FORMAT
 
-IMPORTANTE:
-1. Retorna SOLAMENTE JSON válido.
-2. No incluyas markdown (```json ... ```).
-3. El idioma debe ser ESPAÑOL.
-4. Estructura del JSON:
-{
-  "plan": [
-    {
-      "day": "Lunes",
-      "total_calories": 2000,
-      "meals": [
-        {
-          "meal_type": "Breakfast" | "Lunch" | "Dinner" | "Snack",
-          "name": "Nombre creativo del plato",
-          "calories": 500,
-          "protein": 30,
-          "carbs": 40,
-          "fats": 20,
-          "ingredients": ["Ingrediente 1", "Ingrediente 2"],
-          "prepTime": "15 min"
-        }
-      ]
-    }
-  ]
+DAY_SYSTEM_PROMPT = """
+Eres un Nutricionista Experto de Fitia. Tu tarea es generar UN SOLO DÍA de un plan de comidas semanal PERSONALIZADO y REGIONAL.
+Utiliza los datos del usuario (País, Región, Objetivo, Calorías) para sugerir platos típicos o disponibles en su zona.
+El idioma debe ser ESPAÑOL.
+""" + COMPACT_FORMAT
+
+# Compact wire format -> plan shape. Day names, meal types and day totals
+# are filled in server-side, so the model doesn't spend tokens on them.
+MEAL_KEYS = {
+    "n": "name",
+    "k": "calories",
+    "p": "protein",
+    "c": "carbs",
+    "f": "fats",
+    "i": "ingredients",
+    "r": "prepTime",
 }
-"""
+
+WEEK_DAYS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+
+# Fan-out mode: how many distinct days to generate per variety level.
+# The remaining days of the week cycle through them.
+FANOUT_UNIQUE_DAYS = {'Low': 2, 'Medium': 4, 'High': 7}
 
 def generate_image_url(recipe_name: str) -> str:
-    """Generates a dynamic image URL using Pollinations.ai"""
-    prompt = f"{recipe_name}, professional food photography, 4k, delicious, appetizing, studio lighting"
-    encoded_prompt = urllib.parse.quote(prompt)
-    return f"https://image.pollinations.ai/prompt/{encoded_prompt}"
+    """
+    Image URL for a dish: the backend's cached image proxy, or the upstream
+    generator (Pollinations.ai) directly when the proxy is disabled or
+    PUBLIC_BASE_URL is not set.
+    """
+    if image_proxy.enabled():
+        return image_proxy.image_url(recipe_name)
+    return image_proxy.upstream_url(recipe_name)
 
-def generate_ai_weekly_plan(user: UserBase, daily_calories: int) -> dict:
-    if user.planning_mode == PlanningMode.CUSTOM:
-        # User wants to count calories themselves -> Return empty template
-        distribution = user.meals_per_day if user.meals_per_day else ['Breakfast', 'Lunch', 'Dinner']
-        days = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-        
-        plan = []
-        for day in days:
-            day_meals = []
-            for meal_type in distribution:
-                day_meals.append({
-                    "meal_type": meal_type,
-                    "name": "Registrar Comida",
-                    "calories": 0,
-                    "protein": 0,
-                    "carbs": 0,
-                    "fats": 0,
-                    "ingredients": [],
-                    "prepTime": "0 min",
-                    "image": "https://images.unsplash.com/photo-1498837167922-ddd27525d352?auto=format&fit=crop&q=80&w=300",
-                    "id": str(abs(hash(f"{day}-{meal_type}")))
-                })
-            
-            plan.append({
-                "day": day,
-                "total_calories": 0,
-                "target_calories": daily_calories,
-                "meals": day_meals
+def _meal_types(user: UserBase) -> list[str]:
+    return user.meals_per_day if user.meals_per_day else ['Breakfast', 'Lunch', 'Dinner']
+
+def _custom_plan(user: UserBase, daily_calories: int) -> dict:
+    # User wants to count calories themselves -> Return empty template
+    distribution = _meal_types(user)
+    plan = []
+    for day in WEEK_DAYS:
+        day_meals = []
+        for meal_type in distribution:
+            day_meals.append({
+                "meal_type": meal_type,
+                "name": "Registrar Comida",
+                "calories": 0,
+                "protein": 0,
+                "carbs": 0,
+                "fats": 0,
+                "ingredients": [],
+                "prepTime": "0 min",
+                "image": "https://images.unsplash.com/photo-1498837167922-ddd27525d352?auto=format&fit=crop&q=80&w=300",
+                "id": str(abs(hash(f"{day}-{meal_type}")))
             })
         
-        return {"plan": plan}
+        plan.append({
+            "day": day,
+            "total_calories": 0,
+            "target_calories": daily_calories,
+            "meals": day_meals
+        })
+    
+    return {"plan": plan}
 
+def _build_prompt(user: UserBase, daily_calories: int) -> str:
     prep_instruction = 'Recetas detalladas paso a paso' if user.preparation_style == PreparationStyle.RECIPES else 'Lista de ingredientes simples para armar'
     
     variety_instruction = {
@@ -88,7 +94,7 @@ def generate_ai_weekly_plan(user: UserBase, daily_calories: int) -> dict:
         'High': 'Máxima variedad, intenta no repetir platos en la semana.'
     }.get(user.variety_level.value if user.variety_level else 'Medium', 'Balance entre variedad y repetición')
 
-    prompt = f"""
+    return f"""
     Genera un plan semanal para:
     - Perfil: {user.gender}, {user.age} años, {user.weight}kg.
     - Ubicación: {user.region}, {user.country} (Usa ingredientes locales).
@@ -101,33 +107,319 @@ def generate_ai_weekly_plan(user: UserBase, daily_calories: int) -> dict:
     - Distribución de Comidas: {', '.join(user.meals_per_day) if user.meals_per_day else 'Desayuno, Almuerzo, Cena'}.
     """
 
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.0-flash',
-            contents=f"{SYSTEM_PROMPT}\n\nUSER REQUEST:\n{prompt}\n\nRESPONSE (JSON):",
-            config=types.GenerateContentConfig(
-                response_mime_type='application/json'
-            )
-        )
-        
-        text_response = response.text.strip()
-        # Cleanup markdown formatting if present despite instructions
-        if text_response.startswith("```json"):
-            text_response = text_response[7:]
-        if text_response.endswith("```"):
-            text_response = text_response[:-3]
+class PlanGenerationError(Exception):
+    """Gemini failed, or returned a plan that doesn't match the schema."""
+
+def _day_schema(meal_count: int):
+    from google.genai import types
+    amount = types.Schema(type=types.Type.NUMBER, minimum=0)
+    meal = types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "n": types.Schema(type=types.Type.STRING),
+            "k": amount,
+            "p": amount,
+            "c": amount,
+            "f": amount,
+            "i": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
+            "r": amount,
+        },
+        required=list(MEAL_KEYS),
+        property_ordering=list(MEAL_KEYS),
+    )
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={"m": types.Schema(type=types.Type.ARRAY, items=meal, min_items=meal_count, max_items=meal_count)},
+        required=["m"],
+    )
+
+def _week_schema(meal_count: int):
+    from google.genai import types
+    days = len(WEEK_DAYS)
+    return types.Schema(
+        type=types.Type.OBJECT,
+        properties={"d": types.Schema(type=types.Type.ARRAY, items=_day_schema(meal_count), min_items=days, max_items=days)},
+        required=["d"],
+    )
+
+def _request_kwargs(prompt: str, meal_count: int, single_day: bool = False) -> dict:
+    from google.genai import types
+    system_prompt = DAY_SYSTEM_PROMPT if single_day else SYSTEM_PROMPT
+    return {
+        "model": 'gemini-2.0-flash',
+        "contents": f"{system_prompt}\n\nUSER REQUEST:\n{prompt}",
+        "config": types.GenerateContentConfig(
+            response_mime_type='application/json',
+            response_schema=_day_schema(meal_count) if single_day else _week_schema(meal_count),
+        ),
+    }
+
+def _is_amount(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value >= 0
+
+def expand_day(compact: dict, day: str, meal_types: list[str]) -> dict:
+    """
+    Expands one compact day ({"m": [{"n": ..., "k": ...}]}) into the plan
+    shape. Meal types are assigned by position. Raises ValueError if the
+    day doesn't match the schema.
+    """
+    meals = compact.get("m") if isinstance(compact, dict) else None
+    if not isinstance(meals, list) or len(meals) != len(meal_types):
+        raise ValueError(f"{day}: expected {len(meal_types)} meals, got {compact!r:.200}")
+
+    expanded = []
+    for meal, meal_type in zip(meals, meal_types):
+        if not isinstance(meal, dict) or any(key not in meal for key in MEAL_KEYS):
+            raise ValueError(f"{day}: incomplete meal {meal!r:.200}")
+        if not isinstance(meal["n"], str) or not meal["n"].strip():
+            raise ValueError(f"{day}: meal without a name {meal!r:.200}")
+        if not all(_is_amount(meal[key]) for key in "kpcfr"):
+            raise ValueError(f"{day}: invalid amounts in {meal!r:.200}")
+        if not isinstance(meal["i"], list) or not all(isinstance(item, str) for item in meal["i"]):
+            raise ValueError(f"{day}: invalid ingredients in {meal!r:.200}")
+        expanded.append({
+            "meal_type": meal_type,
+            "name": meal["n"].strip(),
+            "calories": meal["k"],
+            "protein": meal["p"],
+            "carbs": meal["c"],
+            "fats": meal["f"],
+            "ingredients": meal["i"],
+            "prepTime": f"{meal['r']:g} min",
+        })
+
+    return {
+        "day": day,
+        "total_calories": sum(meal["calories"] for meal in expanded),
+        "meals": expanded,
+    }
+
+def expand_plan(compact: dict, meal_types: list[str]) -> dict:
+    """Expands a compact week ({"d": [day, ...]}) into {"plan": [...]}; raises ValueError."""
+    days = compact.get("d") if isinstance(compact, dict) else None
+    if not isinstance(days, list) or len(days) != len(WEEK_DAYS):
+        raise ValueError(f"expected {len(WEEK_DAYS)} days, got {compact!r:.200}")
+    return {"plan": [expand_day(day, name, meal_types) for day, name in zip(days, WEEK_DAYS)]}
+
+def _decorate_day(day: dict) -> dict:
+    # Post-process to add Images and IDs
+    for meal in day.get("meals", []):
+        meal["id"] = str(abs(hash(meal["name"]))) # Simple ID
+        meal["image"] = generate_image_url(meal["name"])
+    return day
+
+def _parse_plan_response(response, meal_types: list[str]) -> dict:
+    with metrics.span("app", "parse_plan"):
+        data = expand_plan(json.loads(response.text), meal_types)
+    
+    with metrics.span("app", "decorate_plan"):
+        for day in data["plan"]:
+            _decorate_day(day)
             
-        data = json.loads(text_response.strip())
-        
-        # Post-process to add Images and IDs
-        for day in data.get("plan", []):
-            for meal in day.get("meals", []):
-                meal["id"] = str(abs(hash(meal["name"]))) # Simple ID
-                meal["image"] = generate_image_url(meal["name"])
-                
-        return data
+    return data
 
+def generate_ai_weekly_plan(user: UserBase, daily_calories: int) -> dict:
+    """
+    Generates the weekly plan with one Gemini call. Raises
+    PlanGenerationError if the call fails or the output is malformed.
+    """
+    if user.planning_mode == PlanningMode.CUSTOM:
+        return _custom_plan(user, daily_calories)
+
+    # Users with near-identical profiles get the same prompt; reuse their plan
+    cache_key = plan_cache.plan_cache_key(user, daily_calories)
+    cached = plan_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    prompt = _build_prompt(user, daily_calories)
+    meal_types = _meal_types(user)
+
+    try:
+        data = ai_client.generate_content_sync(
+            ai_client.get_client(), operation="plan", timeout=settings.AI_PLAN_TIMEOUT_SECONDS,
+            parse=lambda response: _parse_plan_response(response, meal_types),
+            **_request_kwargs(prompt, len(meal_types)),
+        )
     except Exception as e:
         print(f"Error generating AI Plan: {e}")
-        # Fallback to empty structure or error handling
-        return {"plan": []}
+        raise PlanGenerationError(str(e)) from e
+
+    plan_cache.put(cache_key, data)
+    return data
+
+async def generate_ai_weekly_plan_async(user: UserBase, daily_calories: int) -> dict:
+    """Same as generate_ai_weekly_plan, but awaits the genai async client."""
+    if user.planning_mode == PlanningMode.CUSTOM:
+        return _custom_plan(user, daily_calories)
+
+    cache_key = plan_cache.plan_cache_key(user, daily_calories)
+    cached = await asyncio.to_thread(plan_cache.get, cache_key)
+    if cached is not None:
+        return cached
+
+    data = None
+    if settings.PLAN_GENERATION_MODE == "fanout":
+        data = await _generate_fanout(user, daily_calories)
+
+    if data is None:
+        prompt = _build_prompt(user, daily_calories)
+        meal_types = _meal_types(user)
+        try:
+            data = await ai_client.generate_content(
+                ai_client.get_client(), operation="plan", timeout=settings.AI_PLAN_TIMEOUT_SECONDS,
+                parse=lambda response: _parse_plan_response(response, meal_types),
+                **_request_kwargs(prompt, len(meal_types)),
+            )
+        except Exception as e:
+            print(f"Error generating AI Plan: {e}")
+            raise PlanGenerationError(str(e)) from e
+
+    await asyncio.to_thread(plan_cache.put, cache_key, data)
+    return data
+
+def _build_day_prompt(user: UserBase, daily_calories: int, day: str, avoid: list[str]) -> str:
+    prompt = _build_prompt(user, daily_calories)
+    prompt += f"    - Día a generar: {day} (solo este día).\n"
+    if avoid:
+        prompt += f"    - Platos ya elegidos esta semana (NO los repitas): {', '.join(avoid)}.\n"
+    return prompt
+
+async def _generate_day(user: UserBase, daily_calories: int, day: str, avoid: list[str], meal_types: list[str]) -> dict:
+    prompt = _build_day_prompt(user, daily_calories, day, avoid)
+    return await ai_client.generate_content(
+        ai_client.get_client(), operation="plan_day", timeout=settings.AI_PLAN_TIMEOUT_SECONDS,
+        parse=lambda response: expand_day(json.loads(response.text), day, meal_types),
+        **_request_kwargs(prompt, len(meal_types), single_day=True),
+    )
+
+async def _generate_fanout(user: UserBase, daily_calories: int) -> dict | None:
+    """
+    Generates the week as concurrent per-day Gemini calls, in waves of
+    AI_FANOUT_CONCURRENCY. Dish names chosen by earlier waves are passed to
+    later ones so the variety level is respected; days of the same wave
+    can't see each other's dishes, so a repeat within a wave is possible.
+    Returns None if any shard fails (the rest of its wave is cancelled), so
+    the caller can fall back to the single-shot prompt.
+    """
+    meal_types = _meal_types(user)
+    variety = user.variety_level.value if user.variety_level else 'Medium'
+    unique_days = WEEK_DAYS[:FANOUT_UNIQUE_DAYS.get(variety, 4)]
+    wave_size = max(1, settings.AI_FANOUT_CONCURRENCY)
+
+    generated = []
+    chosen = []
+    try:
+        for start in range(0, len(unique_days), wave_size):
+            wave = unique_days[start:start + wave_size]
+            tasks = [
+                asyncio.ensure_future(_generate_day(user, daily_calories, day, list(chosen), meal_types))
+                for day in wave
+            ]
+            try:
+                results = await asyncio.gather(*tasks)
+            finally:
+                # One failed shard fails the plan: stop spending quota on the others
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            generated.extend(results)
+            chosen.extend(meal["name"] for day in results for meal in day["meals"])
+    except Exception as e:
+        print(f"Fan-out plan generation failed, falling back to single prompt: {e}")
+        return None
+
+    plan = []
+    for i, day_name in enumerate(WEEK_DAYS):
+        day = copy.deepcopy(generated[i % len(generated)])
+        day["day"] = day_name
+        plan.append(_decorate_day(day))
+    return {"plan": plan}
+
+class PlanStreamParser:
+    """
+    Incrementally extracts the complete elements of a top-level array (the
+    days of the plan) from streamed JSON text, so each day can be used before the rest arrives.
+    """
+
+    def __init__(self, array_key: str = "plan"):
+        self.array_key = array_key
+        self._buffer = ""
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_key = None
+        self._array_depth = None
+        self._item_start = None
+
+    def feed(self, chunk: str) -> list[dict]:
+        """Consumes a chunk of text and returns the array items it completed."""
+        self._buffer += chunk
+        buf = self._buffer
+        items = []
+        for i in range(self._pos, len(buf)):
+            ch = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_key = buf[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in "{[":
+                if ch == "[" and self._depth == 1 and self._array_depth is None and self._last_key == self.array_key:
+                    self._array_depth = self._depth + 1
+                elif ch == "{" and self._depth == self._array_depth:
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if ch == "}" and self._depth == self._array_depth and self._item_start is not None:
+                    items.append(json.loads(buf[self._item_start:i + 1]))
+                    self._item_start = None
+        self._pos = len(buf)
+        return items
+
+async def stream_ai_weekly_plan(user: UserBase, daily_calories: int):
+    """
+    Async generator yielding each day of the weekly plan (with ids/images
+    added) as soon as Gemini has finished writing it.
+    """
+    if user.planning_mode == PlanningMode.CUSTOM:
+        for day in _custom_plan(user, daily_calories)["plan"]:
+            yield day
+        return
+
+    cache_key = plan_cache.plan_cache_key(user, daily_calories)
+    cached = await asyncio.to_thread(plan_cache.get, cache_key)
+    if cached is not None:
+        for day in cached.get("plan", []):
+            yield day
+        return
+
+    prompt = _build_prompt(user, daily_calories)
+    meal_types = _meal_types(user)
+    parser = PlanStreamParser(array_key="d")
+    days = []
+    async for text in ai_client.generate_content_stream(
+        ai_client.get_client(), operation="plan_stream", timeout=settings.AI_PLAN_TIMEOUT_SECONDS,
+        **_request_kwargs(prompt, len(meal_types)),
+    ):
+        for compact in parser.feed(text):
+            if len(days) == len(WEEK_DAYS):
+                raise PlanGenerationError(f"more than {len(WEEK_DAYS)} days in the plan")
+            day = _decorate_day(expand_day(compact, WEEK_DAYS[len(days)], meal_types))
+            days.append(day)
+            yield day
+
+    if len(days) != len(WEEK_DAYS):
+        raise PlanGenerationError(f"expected {len(WEEK_DAYS)} days, got {len(days)}")
+
+    await asyncio.to_thread(plan_cache.put, cache_key, {"plan": days})
@@ -0,0 +1,272 @@
+"""
+Shared cache of Gemini answers to general nutrition questions ("¿cuánta
+proteína debo comer?", "is rice fattening?"). Questions are normalized
+(accents, stopwords, plurals, common English terms mapped to Spanish) into
+word and character-trigram features; a MinHash/LSH index finds earlier
+questions that are likely near-duplicates, and one whose Jaccard
+similarity reaches CHAT_ANSWER_CACHE_THRESHOLD, with the same numbers,
+contrast words ("antes"/"después"), people ("mujer"/"hombre") and foods,
+gets the stored answer.
+
+Only QUESTION answers are cached. Meal-change requests, follow-ups and
+questions about the user's own plan ("mi almuerzo") always go to Gemini.
+"""
+import copy
+import random
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict, defaultdict
+
+from app.core import metrics
+from app.core.config import settings
+from app.services import intent_classifier
+
+STOPWORDS = {
+    # Spanish
+    "que", "como", "cuanto", "cuanta", "cuantos", "cuantas", "cual", "cuales", "debo", "deberia",
+    "puedo", "podria", "es", "son", "el", "la", "los", "las", "un", "una", "unos", "unas", "de",
+    "del", "al", "a", "en", "y", "o", "u", "con", "para", "por", "se", "lo", "le", "les", "te",
+    "tu", "yo", "mucho", "mucha", "muchos", "muchas", "mas", "muy", "hay", "tiene", "tienen",
+    "esta", "estan", "este", "esto", "eso", "ser", "hacer", "dia", "diario", "diaria", "realmente",
+    "verdad", "cierto", "algun", "alguna",
+    # English
+    "how", "much", "many", "what", "which", "is", "are", "am", "be", "do", "does", "should",
+    "can", "could", "would", "i", "you", "an", "the", "of", "to", "in", "on", "for", "with",
+    "and", "or", "it", "at", "if", "any", "some", "there", "per", "day", "daily", "really", "very",
+    "true",
+}
+
+# English nutrition terms -> the Spanish word they should match
+LEXICON = {
+    "protein": "proteina", "proteins": "proteina", "rice": "arroz", "fattening": "engorda",
+    "fat": "grasa", "fats": "grasa", "carbs": "carbohidrato", "carbohydrates": "carbohidrato",
+    "sugar": "azucar", "water": "agua", "eat": "comer", "eating": "comer", "drink": "tomar",
+    "weight": "peso", "lose": "bajar", "adelgazar": "bajar", "muscle": "musculo",
+    "calories": "caloria", "calorie": "caloria", "egg": "huevo", "eggs": "huevo", "bread": "pan",
+    "fruit": "fruta", "fruits": "fruta", "vegetables": "verdura", "veggies": "verdura",
+    "chicken": "pollo", "fish": "pescado", "meat": "carne", "milk": "leche", "coffee": "cafe",
+    "night": "noche", "healthy": "sano", "saludable": "sano", "good": "bueno", "bad": "malo",
+    "fiber": "fibra", "diet": "dieta", "fasting": "ayuno", "vitamins": "vitamina",
+    "engordar": "engorda", "engordan": "engorda", "breakfast": "desayuno", "dinner": "cena",
+    "lunch": "almuerzo", "snacks": "snack", "before": "antes", "after": "despues",
+    "perder": "bajar", "gain": "subir", "ganar": "subir", "aumentar": "subir", "less": "menos",
+    "fewer": "menos", "without": "sin", "high": "alto", "low": "bajo", "better": "mejor",
+    "worse": "peor", "not": "no", "never": "nunca", "woman": "mujer", "women": "mujer",
+    "man": "hombre", "men": "hombre", "child": "nino", "children": "nino", "kid": "nino",
+    "kids": "nino", "nina": "nino", "pregnant": "embarazada", "teen": "adolescente",
+    "teenager": "adolescente", "elderly": "mayor", "older": "mayor", "baby": "bebe",
+    "athlete": "atleta", "deportista": "atleta", "oats": "avena", "banana": "platano",
+    "apple": "manzana", "cheese": "queso", "yogurt": "yogur", "potato": "papa", "potatoes": "papa",
+    "beans": "frijol", "lentils": "lenteja", "tuna": "atun", "avocado": "aguacate",
+    "nuts": "nuez", "juice": "jugo", "soda": "refresco", "beer": "cerveza", "wine": "vino",
+    "pork": "cerdo", "beef": "res", "butter": "mantequilla", "oil": "aceite", "honey": "miel",
+}
+
+# Words that flip a question's meaning ("antes" / "después", "bajar" /
+# "subir"). Like numbers, they must match exactly for a hit.
+CONTRAST_WORDS = {
+    "antes", "despues", "bajar", "subir", "menos", "sin", "alto", "bajo", "mejor", "peor",
+    "no", "nunca",
+}
+# Who is asking and what they eat decide the answer too ("agua para una
+# mujer" vs "para un hombre"), and trigrams alone can't tell them apart.
+PEOPLE_WORDS = {
+    "mujer", "hombre", "nino", "embarazada", "lactancia", "adolescente", "adulto", "mayor",
+    "bebe", "atleta", "diabetico", "vegano", "vegetariano",
+}
+FOOD_WORDS = {
+    "arroz", "huevo", "pan", "fruta", "verdura", "pollo", "pescado", "carne", "leche", "cafe",
+    "azucar", "agua", "avena", "platano", "manzana", "queso", "yogur", "papa", "pasta", "frijol",
+    "lenteja", "atun", "aguacate", "nuez", "chocolate", "jugo", "refresco", "cerveza", "vino",
+    "alcohol", "cerdo", "res", "mantequilla", "aceite", "miel", "tortilla",
+}
+
+# Questions about the user's own plan or day depend on that user
+PERSONAL = {"mi", "mis", "mio", "mia", "me", "my", "mine", "plan", "hoy", "today", "manana", "tomorrow"}
+# Follow-ups ("¿y de proteína?") only make sense with the earlier turns
+FOLLOW_UP_PREFIXES = ("y ", "e ", "and ", "entonces ", "tambien ", "also ")
+
+MIN_TOKENS = 2
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_PRIME = (1 << 61) - 1
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_rng = random.Random(20240101)
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+answer_cache_lookups = metrics.counter(
+    "chat_answer_cache_total", "Chat answer cache lookups: hit, miss or skip", label="result"
+)
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+# tokens() stems words, so compare exact words in stemmed form too
+_EXACT_STEMS = frozenset(_stem(word) for word in CONTRAST_WORDS | PEOPLE_WORDS | FOOD_WORDS)
+
+
+def tokens(message: str) -> list[str] | None:
+    """
+    Canonical content words of a question, sorted, or None when the
+    message must not be answered from the cache.
+    """
+    text = intent_classifier.normalize(message)
+    words = _TOKEN_RE.findall(text)
+    if not words or text.lstrip("¿¡ ").startswith(FOLLOW_UP_PREFIXES) or PERSONAL.intersection(words):
+        return None
+    content = sorted({_stem(LEXICON.get(word, word)) for word in words if word not in STOPWORDS})
+    return content if len(content) >= MIN_TOKENS else None
+
+
+def exact_terms(words: list[str]) -> frozenset[str]:
+    """Numbers, contrast, people and food words, which a cached question must share exactly."""
+    return frozenset(word for word in words if word.isdigit() or word in _EXACT_STEMS)
+
+
+def features(words: list[str]) -> frozenset[str]:
+    """Words plus their character trigrams, so small spelling differences still overlap."""
+    shingles = set(words)
+    for word in words:
+        padded = f"^{word}$"
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(shingles)
+
+
+def minhash(shingles: frozenset[str]) -> tuple[int, ...]:
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def jaccard(a: frozenset[str], b: frozenset[str]) -> float:
+    return len(a & b) / len(a | b) if a or b else 0.0
+
+
+def _bands(signature: tuple[int, ...]):
+    return [(band, signature[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class AnswerCache:
+    """
+    Size-bounded LRU of (question features, answer) with a TTL, indexed by
+    MinHash LSH bands: questions sharing a band are candidates, and the most
+    similar candidate at or above `threshold` whose exact terms are the
+    same is a hit.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.timer = timer
+        self._entries = OrderedDict()  # key -> (expires_at, shingles, terms, signature, answer)
+        self._buckets = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, _, signature, _ = self._entries.pop(key)
+        for band in _bands(signature):
+            bucket = self._buckets[band]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band]
+
+    def get(self, shingles: frozenset[str], terms: frozenset[str] = frozenset()) -> dict | None:
+        signature = minhash(shingles)
+        now = self.timer()
+        with self._lock:
+            candidates = set()
+            for band in _bands(signature):
+                candidates.update(self._buckets.get(band, ()))
+            best, best_score = None, self.threshold
+            for key in candidates:
+                expires_at, stored, stored_terms, _, _ = self._entries[key]
+                if expires_at <= now:
+                    self._remove(key)
+                    continue
+                if stored_terms != terms:
+                    continue
+                score = jaccard(shingles, stored)
+                if score >= best_score:
+                    best, best_score = key, score
+            if best is None:
+                return None
+            self._entries.move_to_end(best)
+            return copy.deepcopy(self._entries[best][4])
+
+    def set(self, shingles: frozenset[str], answer: dict, terms: frozenset[str] = frozenset()):
+        key = shingles
+        signature = minhash(shingles)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self.timer() + self.ttl, shingles, terms, signature, copy.deepcopy(answer))
+            for band in _bands(signature):
+                self._buckets[band].add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+
+_cache = AnswerCache(
+    maxsize=settings.CHAT_ANSWER_CACHE_MAX_ENTRIES,
+    ttl=settings.CHAT_ANSWER_CACHE_TTL_SECONDS,
+    threshold=settings.CHAT_ANSWER_CACHE_THRESHOLD,
+)
+
+
+def cacheable(message: str) -> bool:
+    """
+    True for general questions the shared cache answers. Their answers must
+    come from a prompt without any user's plan or history (see ai_chat).
+    """
+    if not settings.CHAT_ANSWER_CACHE_ENABLED or tokens(message) is None:
+        return False
+    return intent_classifier.classify(message)["intent"] != "CHANGE_MEAL"
+
+
+def lookup(message: str) -> dict | None:
+    """A cached answer to a near-duplicate of `message`, or None."""
+    if not settings.CHAT_ANSWER_CACHE_ENABLED:
+        return None
+    if not cacheable(message):
+        answer_cache_lookups.inc("skip")
+        return None
+    words = tokens(message)
+    answer = _cache.get(features(words), exact_terms(words))
+    answer_cache_lookups.inc("hit" if answer is not None else "miss")
+    return answer
+
+
+def store(message: str, response: dict):
+    """
+    Caches Gemini's answer to `message`, which must have been generated
+    without user context. Anything but a plain QUESTION answer is ignored.
+    """
+    if response.get("intent") != "QUESTION" or response.get("entities") or not response.get("message"):
+        return
+    if not cacheable(message):
+        return
+    words = tokens(message)
+    _cache.set(features(words), {"intent": "QUESTION", "entities": None, "message": response["message"]},
+               exact_terms(words))
+
+
+def clear():
+    _cache.clear()
@@ -0,0 +1,165 @@
+import copy
+import threading
+import time
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+CHAT_MEMORY_COLLECTION = "chat_memory"
+
+USER = "u"
+ASSISTANT = "a"
+_SPEAKERS = {USER: "Usuario", ASSISTANT: "Nutricionista"}
+
+# Histories are stored compactly, one document per user:
+# {"summary": "...", "turns": [{"r": "u" | "a", "t": "..."}, ...]}
+_memory = TTLCache(maxsize=settings.CHAT_MEMORY_CACHE_MAX_ENTRIES, ttl=settings.CHAT_MEMORY_CACHE_TTL_SECONDS)
+_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about 4 characters per token) used for the memory budget."""
+    return len(text) // 4 + 1
+
+
+def _empty() -> dict:
+    return {"summary": "", "turns": []}
+
+
+def _history(data: dict) -> dict:
+    return {"summary": data.get("summary") or "", "turns": list(data.get("turns") or [])}
+
+
+def _firestore_get(user_id: str) -> dict:
+    from app.db.firebase import get_db
+    with metrics.span("firestore", "chat_memory_get"):
+        doc = get_db().collection(CHAT_MEMORY_COLLECTION).document(user_id).get()
+    return _history((doc.to_dict() or {}) if doc.exists else {})
+
+
+def _firestore_update(user_id: str, change) -> dict:
+    from google.cloud import firestore as google_firestore
+    from app.db.firebase import get_db
+
+    db = get_db()
+    ref = db.collection(CHAT_MEMORY_COLLECTION).document(user_id)
+
+    @google_firestore.transactional
+    def apply(transaction):
+        snapshot = ref.get(transaction=transaction)
+        history = _history((snapshot.to_dict() or {}) if snapshot.exists else {})
+        change(history)
+        transaction.set(ref, {
+            "summary": history["summary"],
+            "turns": history["turns"],
+            "updated_at": time.time(),
+        })
+        return history
+
+    with metrics.span("firestore", "chat_memory_update"):
+        return apply(db.transaction())
+
+
+def load(user_id: str) -> dict:
+    """
+    The user's history, empty for new users. Other workers add turns too,
+    so with CHAT_MEMORY_FIRESTORE the document is read on every call; the
+    copy kept in memory is only used when that read fails.
+    """
+    history = None
+    if settings.CHAT_MEMORY_FIRESTORE:
+        try:
+            history = _firestore_get(user_id)
+            _memory.set(user_id, history)
+        except Exception as e:
+            print(f"Chat memory read failed: {e}")
+    if history is None:
+        history = _memory.get(user_id) or _empty()
+    return copy.deepcopy(history)
+
+
+def update(user_id: str, change) -> dict | None:
+    """
+    Applies `change(history)`, which edits the history in place, as one
+    atomic read-modify-write: in a Firestore transaction with
+    CHAT_MEMORY_FIRESTORE (so turns added by other workers are kept), under
+    a process lock otherwise. `change` may run more than once when the
+    transaction is retried. Returns the new history, or None if the write
+    failed.
+    """
+    if not settings.CHAT_MEMORY_FIRESTORE:
+        with _lock:
+            history = copy.deepcopy(_memory.get(user_id) or _empty())
+            change(history)
+            _memory.set(user_id, history)
+        return copy.deepcopy(history)
+
+    try:
+        history = _firestore_update(user_id, change)
+    except Exception as e:
+        print(f"Chat memory write failed: {e}")
+        return None
+    _memory.set(user_id, copy.deepcopy(history))
+    return copy.deepcopy(history)
+
+
+def append(history: dict, role: str, text: str):
+    # A single turn may use at most half of the window
+    limit = settings.CHAT_MEMORY_MAX_TOKENS * 2
+    text = str(text or "").strip()
+    history["turns"].append({"r": role, "t": text if len(text) <= limit else text[:limit] + "…"})
+
+
+def overflow(history: dict) -> list[dict]:
+    """
+    Removes the oldest turns until the rest fit in CHAT_MEMORY_MAX_TOKENS
+    and returns them, oldest first, to be folded into the summary. The
+    latest exchange is always kept.
+    """
+    turns = history["turns"]
+    used = sum(estimate_tokens(turn["t"]) for turn in turns)
+    evicted = []
+    while len(turns) > 2 and used > settings.CHAT_MEMORY_MAX_TOKENS:
+        turn = turns.pop(0)
+        used -= estimate_tokens(turn["t"])
+        evicted.append(turn)
+    return evicted
+
+
+def fold(history: dict, evicted: list[dict], previous_summary: str, summary: str):
+    """
+    Replaces the `evicted` turns at the start of the history with
+    `summary`, the fold of `previous_summary` and those turns. Does nothing
+    when another exchange has already folded them.
+    """
+    turns = history["turns"]
+    if history["summary"] == previous_summary and turns[:len(evicted)] == evicted:
+        del turns[:len(evicted)]
+        history["summary"] = summary
+
+
+def format_turns(turns: list[dict]) -> str:
+    return "\n".join(f"{_SPEAKERS.get(turn['r'], turn['r'])}: {turn['t']}" for turn in turns)
+
+
+def render(history: dict) -> str:
+    """The history as prompt text, or "" when there is none."""
+    parts = []
+    if history["summary"]:
+        parts.append(f"Resumen de la conversación anterior: {history['summary']}")
+    if history["turns"]:
+        parts.append(f"Conversación reciente:\n{format_turns(history['turns'])}")
+    return "\n\n".join(parts)
+
+
+def fallback_summary(summary: str, evicted: list[dict]) -> str:
+    """Summary without Gemini: the user's own words, newest kept when over budget."""
+    said = " ".join(turn["t"] for turn in evicted if turn["r"] == USER)
+    text = f"{summary} {said}".strip()
+    limit = settings.CHAT_SUMMARY_MAX_TOKENS * 4
+    return text if len(text) <= limit else "…" + text[-limit:]
+
+
+def clear():
+    _memory.clear()
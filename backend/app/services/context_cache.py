@@ -0,0 +1,76 @@
+import asyncio
+import hashlib
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.services.chat_memory import estimate_tokens
+
+# key -> request config fields for a prompt prefix: {"cached_content": name}
+# when Gemini holds it, {"system_instruction": text} when it is sent inline.
+# Entries expire before the provider-side cache does, so a name is never
+# used after Gemini dropped it.
+_prefixes = TTLCache(
+    maxsize=settings.CHAT_CONTEXT_CACHE_MAX_ENTRIES,
+    ttl=settings.CHAT_CONTEXT_CACHE_TTL_SECONDS * 0.9,
+)
+
+context_cache_lookups = metrics.counter(
+    "context_cache_total", "Prompt prefix lookups: hit, created or inline", label="result"
+)
+
+
+def cache_key(*parts) -> str:
+    """Stable key for a prefix built from `parts` (e.g. user, plan id and version)."""
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()[:32]
+
+
+def lookup(key: str) -> dict | None:
+    entry = _prefixes.get(key)
+    if entry is not None:
+        context_cache_lookups.inc("hit")
+    return entry
+
+
+async def _create(client, model: str, system_instruction: str) -> str:
+    from google.genai import types
+    with metrics.span("gemini", "context_cache_create"):
+        cache = await asyncio.wait_for(
+            client.aio.caches.create(model=model, config=types.CreateCachedContentConfig(
+                system_instruction=system_instruction,
+                ttl=f"{settings.CHAT_CONTEXT_CACHE_TTL_SECONDS}s",
+            )),
+            settings.AI_CHAT_TIMEOUT_SECONDS,
+        )
+    return cache.name
+
+
+async def get_or_create(client, key: str, model: str, system_instruction: str) -> dict:
+    """
+    Returns the config fields that give a request `system_instruction`:
+    a reference to a Gemini cached content, created on the first call for
+    `key`, or the instruction itself when caching is disabled, the prefix
+    is under CHAT_CONTEXT_CACHE_MIN_TOKENS (Gemini would refuse it, after a
+    round trip) or Gemini refuses it anyway. Either result is remembered
+    for the key.
+    """
+    entry = lookup(key)
+    if entry is not None:
+        return entry
+
+    entry = {"system_instruction": system_instruction}
+    if (
+        settings.CHAT_CONTEXT_CACHE_ENABLED
+        and estimate_tokens(system_instruction) >= settings.CHAT_CONTEXT_CACHE_MIN_TOKENS
+    ):
+        try:
+            entry = {"cached_content": await _create(client, model, system_instruction)}
+        except Exception as e:
+            print(f"Context cache create failed, sending the prefix inline: {e}")
+    context_cache_lookups.inc("created" if "cached_content" in entry else "inline")
+    _prefixes.set(key, entry)
+    return entry
+
+
+def clear():
+    _prefixes.clear()
@@ -0,0 +1,302 @@
+"""
+Meal images served by the backend instead of linking clients straight to
+the image generator. Each dish gets a stable key (a hash of its normalized
+name); the first request for a key fetches the image from the upstream
+once, concurrent requests share that fetch, and the bytes are kept in an
+on-disk LRU bounded by IMAGE_CACHE_MAX_BYTES. Only names signed by the
+backend (image_url) are ever sent upstream. Plans prefetch all their
+images in the background right after they are generated.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import tempfile
+import threading
+import urllib.parse
+import uuid
+import weakref
+from collections import OrderedDict
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.security import SECRET_KEY
+from app.services.recipe_index import name_key
+
+IMAGE_PROMPT = "{name}, professional food photography, 4k, delicious, appetizing, studio lighting"
+
+EXTENSIONS = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp", "image/gif": "gif"}
+CONTENT_TYPES = {ext: content_type for content_type, ext in EXTENSIONS.items()}
+
+image_requests = metrics.counter(
+    "image_proxy_total", "Meal image lookups: hit, fetched, error or unknown", label="result"
+)
+
+
+def image_key(recipe_name: str) -> str:
+    """Stable key for a dish: the same name in any case, accents or spacing maps to one image."""
+    return hashlib.sha256(name_key(recipe_name).encode("utf-8")).hexdigest()[:32]
+
+
+def sign(recipe_name: str) -> str:
+    """HMAC of the dish name, so only names the backend handed out get fetched."""
+    return hmac.new(SECRET_KEY.encode("utf-8"), f"image:{recipe_name}".encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def enabled() -> bool:
+    """
+    Plans get proxy URLs only once PUBLIC_BASE_URL is configured: the web
+    client runs on another origin, where relative /api/v1/images/... URLs
+    would not reach the backend.
+    """
+    return settings.IMAGE_PROXY_ENABLED and bool(settings.PUBLIC_BASE_URL)
+
+
+def image_url(recipe_name: str) -> str:
+    """The signed, absolute proxy URL for a dish."""
+    query = urllib.parse.urlencode({"name": recipe_name, "sig": sign(recipe_name)})
+    return f"{settings.PUBLIC_BASE_URL.rstrip('/')}{settings.API_V1_STR}/images/{image_key(recipe_name)}?{query}"
+
+
+def upstream_url(recipe_name: str, url_template: str | None = None) -> str:
+    """The generator URL for a dish (what clients were given before the proxy)."""
+    prompt = urllib.parse.quote(IMAGE_PROMPT.format(name=recipe_name))
+    return (url_template or settings.IMAGE_UPSTREAM_URL).format(prompt=prompt)
+
+
+class DiskLRU:
+    """
+    Image files named {key}.{ext} in `directory`, evicted least recently
+    used first once they add up to more than `max_bytes`. Recency is kept
+    in the files' mtime, so the order survives restarts. Workers sharing
+    the directory each keep their own index and tolerate files another
+    worker wrote or evicted.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._index = OrderedDict()  # key -> (filename, bytes)
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            key, _, ext = entry.name.partition(".")
+            if ext in CONTENT_TYPES and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, key, entry.name, stat.st_size))
+        for _, key, filename, size in sorted(files):
+            self._index[key] = (filename, size)
+            self.size += size
+        self._evict()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def _probe(self, key: str) -> tuple[str, int] | None:
+        # Written by another worker sharing the directory
+        for ext in CONTENT_TYPES:
+            filename = f"{key}.{ext}"
+            try:
+                return filename, os.path.getsize(self._path(filename))
+            except OSError:
+                continue
+        return None
+
+    def get(self, key: str) -> tuple[str, str] | None:
+        """(path, content type) of a stored image, or None."""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                entry = self._probe(key)
+                if entry is None:
+                    return None
+                self._index[key] = entry
+                self.size += entry[1]
+            filename, size = entry
+            path = self._path(filename)
+            try:
+                os.utime(path)
+            except OSError:
+                # Evicted by another worker
+                del self._index[key]
+                self.size -= size
+                return None
+            self._index.move_to_end(key)
+            return path, CONTENT_TYPES[filename.partition(".")[2]]
+
+    def put(self, key: str, data: bytes, content_type: str) -> str:
+        filename = f"{key}.{EXTENSIONS[content_type]}"
+        path = self._path(filename)
+        temp = self._path(f".{uuid.uuid4().hex}.tmp")
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self._index[key] = (filename, len(data))
+            self.size += len(data)
+            self._evict(keep=key)
+        return path
+
+    def _evict(self, keep: str | None = None):
+        while self.size > self.max_bytes and self._index:
+            key, (filename, size) = next(iter(self._index.items()))
+            if key == keep:
+                break
+            del self._index[key]
+            self.size -= size
+            try:
+                os.remove(self._path(filename))
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(self._index)
+
+
+class HttpUpstream:
+    """Generates images on the fly from IMAGE_UPSTREAM_URL (Pollinations by default)."""
+
+    def __init__(self, url_template: str, timeout: float):
+        self.url_template = url_template
+        self.timeout = timeout
+        self._client = None
+
+    async def fetch(self, recipe_name: str) -> tuple[bytes, str]:
+        import httpx
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=self.timeout, follow_redirects=True)
+        response = await self._client.get(upstream_url(recipe_name, self.url_template))
+        response.raise_for_status()
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        return response.content, content_type
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_store = None
+_store_lock = threading.Lock()
+_upstream = None
+_inflight = {}  # key -> fetch task shared by concurrent requests
+_background = set()
+_semaphores = weakref.WeakKeyDictionary()  # one per event loop
+
+
+def _get_store() -> DiskLRU:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                directory = settings.IMAGE_CACHE_DIR or os.path.join(tempfile.gettempdir(), "fitia-images")
+                _store = DiskLRU(directory, settings.IMAGE_CACHE_MAX_BYTES)
+    return _store
+
+
+def get_upstream():
+    global _upstream
+    if _upstream is None:
+        _upstream = HttpUpstream(settings.IMAGE_UPSTREAM_URL, settings.IMAGE_FETCH_TIMEOUT_SECONDS)
+    return _upstream
+
+
+def set_upstream(upstream):
+    """Replaces the image source (stand-ins for tests and benchmarks): needs `async fetch(name) -> (bytes, content_type)`."""
+    global _upstream
+    _upstream = upstream
+
+
+def reset():
+    """Forgets the disk index so the next call rebuilds it from settings."""
+    global _store
+    _store = None
+    _inflight.clear()
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _semaphores[loop] = asyncio.Semaphore(max(1, settings.IMAGE_FETCH_CONCURRENCY))
+    return semaphore
+
+
+async def _fetch(key: str, recipe_name: str) -> tuple[str, str]:
+    async with _get_semaphore():
+        with metrics.span("images", "fetch"):
+            data, content_type = await get_upstream().fetch(recipe_name)
+    if content_type not in EXTENSIONS or not data:
+        raise ValueError(f"upstream returned {content_type or 'no content type'} for {recipe_name!r}")
+    path = await asyncio.to_thread(_get_store().put, key, data, content_type)
+    return path, content_type
+
+
+async def get_image(key: str, recipe_name: str | None = None,
+                    signature: str | None = None) -> tuple[str, str] | None:
+    """
+    (path, content type) of the image for `key`. On a miss the image is
+    fetched when `recipe_name` hashes to `key` and `signature` is its
+    sign(); otherwise None. Raises if the upstream fetch fails.
+    """
+    found = await asyncio.to_thread(_get_store().get, key)
+    if found is not None:
+        image_requests.inc("hit")
+        return found
+    if not recipe_name or not signature or image_key(recipe_name) != key \
+            or not hmac.compare_digest(signature, sign(recipe_name)):
+        image_requests.inc("unknown")
+        return None
+
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_fetch(key, recipe_name))
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    try:
+        # Shielded: a client hanging up doesn't cancel the fetch others wait on
+        found = await asyncio.shield(task)
+    except Exception:
+        image_requests.inc("error")
+        raise
+    image_requests.inc("fetched")
+    return found
+
+
+async def _prefetch(names: dict[str, str]):
+    results = await asyncio.gather(*(get_image(key, name, sign(name)) for key, name in names.items()),
+                                   return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        print(f"Image prefetch: {len(failed)} of {len(names)} failed ({failed[0]})")
+
+
+def prefetch_plan(plan: dict):
+    """Starts fetching every meal image of a generated plan in the background."""
+    if not (enabled() and settings.IMAGE_PREFETCH):
+        return
+    names = {}
+    for day in plan.get("plan", []):
+        for meal in day.get("meals", []):
+            if name_key(meal.get("name")):
+                names.setdefault(image_key(meal["name"]), meal["name"])
+    if not names:
+        return
+    task = asyncio.create_task(_prefetch(names))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def close():
+    for task in list(_background):
+        task.cancel()
+    await asyncio.gather(*_background, return_exceptions=True)
+    if _upstream is not None and hasattr(_upstream, "close"):
+        await _upstream.close()
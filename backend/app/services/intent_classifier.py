@@ -0,0 +1,169 @@
+"""
+Rule/lexicon classifier for chat messages (Spanish and English). Recognizes
+plain meal-swap commands like "cambia la cena" or "change my breakfast, no
+fish" and extracts the same entities Gemini would, so those messages skip the
+LLM. Questions and anything ambiguous are left to Gemini.
+"""
+import re
+import unicodedata
+
+from app.core.config import settings
+
+MEAL_TYPES = {
+    "Breakfast": ("desayuno", "desayunar", "breakfast"),
+    "Lunch": ("almuerzo", "almorzar", "comida", "lunch"),
+    "Dinner": ("cena", "cenar", "dinner", "supper"),
+    "Snack": ("snack", "merienda", "colacion", "refrigerio", "tentempie", "bocadillo"),
+}
+
+MEAL_NAMES_ES = {"Breakfast": "desayuno", "Lunch": "almuerzo", "Dinner": "cena", "Snack": "snack"}
+
+CHANGE_VERBS = (
+    r"cambia(?:r|me|lo|la)?", r"cambiame", r"cambialo", r"cambiala", r"reemplaza(?:r|me)?",
+    r"sustituye", r"sustituir", r"change", r"swap", r"replace", r"switch",
+)
+
+# "otra cena", "another breakfast": a swap only when the meal comes right
+# after, so "another tip for breakfast" stays a question
+ALTERNATIVE_WORDS = (r"otr[oa]", r"different", r"another")
+
+# "don't change my dinner", "no cambies la cena", "I dont want to change it"
+NEGATIONS = (r"don'?t", r"do not", r"does not", r"doesn'?t", r"not", r"never", r"no", r"nunca")
+NEGATED_VERBS = r"(?:cambi\w*|reemplaz\w*|sustitu\w*|chang\w*|swap\w*|replac\w*|switch\w*)"
+# "keep my dinner", "change nothing", "mantén la cena"
+KEEP_WORDS = (r"keep", r"nothing", r"manten", r"mantener", r"mantenga", r"deja(?:la|lo|r)?")
+
+# Asking about options rather than asking for a swap
+INFO_WORDS = (
+    r"ideas?", r"recipes?", r"tips?", r"suggestions?", r"advice", r"tell me",
+    r"recetas?", r"consejos?", r"sugerencias?", r"dime",
+)
+
+# Weaker signal: "no me gusta la cena" usually means "change it", but not always
+DISLIKE_PHRASES = (r"no me gusta(?:n)?", r"no quiero", r"i don'?t (?:like|want)", r"i hate")
+
+QUESTION_WORDS = (
+    r"que", r"como", r"cuanto[as]?", r"cual(?:es)?", r"por ?que", r"cuando", r"donde",
+    r"es (?:bueno|malo|sano)", r"puedo", r"deberia", r"tiene", r"hay",
+    r"what", r"how", r"why", r"which", r"when", r"where", r"is", r"are", r"can", r"should",
+    r"does", r"do", r"could", r"would",
+)
+
+# Words that carry no food preference inside a "con ..."/"with ..." phrase
+FILLER = {
+    "algo", "alguna", "alguno", "un", "una", "uno", "unos", "unas", "el", "la", "los", "las",
+    "de", "del", "mi", "mis", "plato", "platillo", "opcion", "receta", "mas", "favor", "porfa",
+    "something", "some", "a", "an", "the", "my", "dish", "meal", "option", "recipe", "more",
+    "please", "instead", "it", "one", "y", "and", "que", "tenga", "lleve", "hoy", "today",
+    "con", "with", "por", "for", "sin", "without", "otra", "otro", "cosa", "diferente",
+    "else", "thing", "different",
+}
+FILLER |= {word for words in MEAL_TYPES.values() for word in words}
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+_CHANGE_RE = re.compile(r"\b(?:" + "|".join(CHANGE_VERBS) + r")\b")
+_NEGATED_RE = re.compile(r"\b(?:" + "|".join(NEGATIONS) + r")\s+(?:[a-z']+\s+){0,2}?" + NEGATED_VERBS + r"\b")
+_KEEP_RE = re.compile(r"\b(?:" + "|".join(KEEP_WORDS) + r")\b")
+_INFO_RE = re.compile(r"\b(?:" + "|".join(INFO_WORDS) + r")\b")
+_DISLIKE_RE = re.compile(r"\b(?:" + "|".join(DISLIKE_PHRASES) + r")\b")
+_QUESTION_RE = re.compile(r"^\s*(?:" + "|".join(QUESTION_WORDS) + r")\b")
+_MEAL_RES = {
+    meal_type: re.compile(r"\b(?:" + "|".join(words) + r")s?\b") for meal_type, words in MEAL_TYPES.items()
+}
+_ALTERNATIVE_RE = re.compile(
+    r"\b(?:" + "|".join(ALTERNATIVE_WORDS) + r")\s+(?:"
+    + "|".join(word for words in MEAL_TYPES.values() for word in words) + r")s?\b"
+)
+_CLAUSE_END = r"(?=$|[,.;:!]|\b(?:y no|pero|but|sin|without|no|not|and not)\b)"
+_WANT_RE = re.compile(r"\b(?:con|with|por|for|que (?:tenga|lleve)|a base de)\s+(.+?)" + _CLAUSE_END)
+_AVOID_RE = re.compile(
+    r"\b(?:sin|without|nada de|no me gusta(?:n)?|no quiero|i don'?t (?:like|want)|not|no)\s+(.+?)"
+    r"(?=$|[,.;:!]|\b(?:y|and|pero|but|con|with|por|for|en|in)\b)"
+)
+
+# Confidence contributions. A dislike without a change verb ("no quiero
+# cenar", "i hate breakfast") stays below the default threshold, so Gemini
+# decides whether it is a swap.
+CHANGE_VERB_SCORE = 0.5
+DISLIKE_SCORE = 0.25
+MEAL_TYPE_SCORE = 0.35
+SHORT_MESSAGE_SCORE = 0.1
+SHORT_MESSAGE_WORDS = 12
+
+
+def normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).strip()
+
+
+def _phrase_words(matches) -> list[str]:
+    words = []
+    for phrase in matches:
+        for word in _WORD_RE.findall(phrase):
+            if word not in FILLER and len(word) > 2 and word not in words:
+                words.append(word)
+    return words
+
+
+def classify(message: str) -> dict:
+    """
+    Returns {"intent", "confidence", "entities"}. Intent is "CHANGE_MEAL" when
+    the message reads as a swap command, otherwise "QUESTION" (confidence
+    0.0 means "no idea, ask the model").
+    """
+    text = normalize(message)
+    unknown = {"intent": "QUESTION", "confidence": 0.0, "entities": None}
+    if not text or "?" in text or "¿" in message or _QUESTION_RE.match(text):
+        return unknown
+    # Negated or "keep it" requests, and requests for ideas, are for Gemini
+    if _NEGATED_RE.search(text) or _KEEP_RE.search(text) or _INFO_RE.search(text):
+        return unknown
+
+    meal_types = [meal_type for meal_type, pattern in _MEAL_RES.items() if pattern.search(text)]
+    # "comida" doubles as "food"/"meal" in Spanish; a more specific slot wins
+    if len(meal_types) > 1 and "Lunch" in meal_types and not re.search(r"\b(?:almuerzo|almorzar|lunch)\b", text):
+        meal_types.remove("Lunch")
+    if len(meal_types) != 1:
+        return unknown
+
+    confidence = MEAL_TYPE_SCORE
+    if _CHANGE_RE.search(text) or _ALTERNATIVE_RE.search(text):
+        confidence += CHANGE_VERB_SCORE
+    elif _DISLIKE_RE.search(text):
+        confidence += DISLIKE_SCORE
+    else:
+        return unknown
+    if len(_WORD_RE.findall(text)) <= SHORT_MESSAGE_WORDS:
+        confidence += SHORT_MESSAGE_SCORE
+
+    avoid = _phrase_words(_AVOID_RE.findall(text))
+    wanted = [word for word in _phrase_words(_WANT_RE.findall(text)) if word not in avoid]
+    return {
+        "intent": "CHANGE_MEAL",
+        "confidence": round(min(confidence, 1.0), 2),
+        "entities": {
+            "meal_type": meal_types[0],
+            "food_keywords": wanted or None,
+            "exclude_keywords": avoid or None,
+        },
+    }
+
+
+def resolve(message: str) -> dict | None:
+    """
+    Returns a chat response (same shape as ai_chat's Gemini responses) when
+    the classifier is at least CHAT_INTENT_CONFIDENCE_THRESHOLD sure,
+    otherwise None.
+    """
+    result = classify(message)
+    if result["intent"] != "CHANGE_MEAL" or result["confidence"] < settings.CHAT_INTENT_CONFIDENCE_THRESHOLD:
+        return None
+
+    entities = result["entities"]
+    meal_name = MEAL_NAMES_ES[entities["meal_type"]]
+    text = f"¡Claro! Voy a buscarte otra opción para tu {meal_name}"
+    if entities["food_keywords"]:
+        text += f" con {', '.join(entities['food_keywords'])}"
+    if entities["exclude_keywords"]:
+        text += f" sin {', '.join(entities['exclude_keywords'])}"
+    return {"intent": "CHANGE_MEAL", "entities": entities, "message": text + "."}
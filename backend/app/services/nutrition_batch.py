@@ -0,0 +1,116 @@
+"""
+Columnar (NumPy) version of the nutrition_engine formulas, for recomputing
+calorie targets across the whole user base at once. Uses the same
+coefficient tables and operation order as the scalar functions, so results
+are bit-for-bit identical.
+"""
+import numpy as np
+
+from app.models.user import UserBase, Gender
+from app.services.nutrition_engine import (
+    BMR_COEFFICIENTS,
+    ACTIVITY_MULTIPLIERS,
+    DEFAULT_ACTIVITY_MULTIPLIER,
+    GOAL_ADJUSTMENTS,
+)
+
+USER_COLLECTION = "users"
+TARGET_FIELD = "nutrition_targets"
+BATCH_LIMIT = 450  # Firestore allows 500 writes per batch
+
+_PROFILE_FIELDS = ("weight", "height", "age", "gender", "activity_level", "goal")
+
+
+def _values(column) -> np.ndarray:
+    # Enum members -> their plain string values, so lookups work on either
+    return np.asarray([getattr(value, "value", value) for value in column], dtype=object)
+
+
+def _lookup(column, table: dict, default: float) -> np.ndarray:
+    """Maps a categorical column through `table` (keyed by enum) with one lookup per distinct value."""
+    values = _values(column).astype(str)
+    if values.size == 0:
+        return np.empty(0, dtype=np.float64)
+    codes, inverse = np.unique(values, return_inverse=True)
+    mapped = np.array([table.get(code, default) for code in codes], dtype=np.float64)
+    return mapped[inverse]
+
+
+def calculate_bmr_batch(weight, height, age, gender) -> np.ndarray:
+    """Vectorized calculate_bmr (Harris-Benedict Revised)."""
+    weight = np.asarray(weight, dtype=np.float64)
+    height = np.asarray(height, dtype=np.float64)
+    age = np.asarray(age, dtype=np.float64)
+    is_male = _values(gender) == Gender.MALE.value
+
+    def formula(coefficients):
+        constant, per_kg, per_cm, per_year = coefficients
+        return constant + (per_kg * weight) + (per_cm * height) - (per_year * age)
+
+    return np.where(is_male, formula(BMR_COEFFICIENTS[Gender.MALE]), formula(BMR_COEFFICIENTS[Gender.FEMALE]))
+
+
+def calculate_tdee_batch(bmr, activity_level) -> np.ndarray:
+    """Vectorized calculate_tdee."""
+    return np.asarray(bmr, dtype=np.float64) * _lookup(activity_level, ACTIVITY_MULTIPLIERS, DEFAULT_ACTIVITY_MULTIPLIER)
+
+
+def adjust_for_goal_batch(tdee, goal) -> np.ndarray:
+    """Vectorized adjust_for_goal."""
+    return np.asarray(tdee, dtype=np.float64) + _lookup(goal, GOAL_ADJUSTMENTS, 0.0)
+
+
+def calculate_targets_batch(weight, height, age, gender, activity_level, goal) -> dict:
+    """
+    Returns {"bmr", "tdee", "target_calories"} as int64 arrays, truncated the
+    same way generate_weekly_plan does (int()).
+    """
+    bmr = calculate_bmr_batch(weight, height, age, gender)
+    tdee = calculate_tdee_batch(bmr, activity_level)
+    target = adjust_for_goal_batch(tdee, goal)
+    return {
+        "bmr": np.trunc(bmr).astype(np.int64),
+        "tdee": np.trunc(tdee).astype(np.int64),
+        "target_calories": np.trunc(target).astype(np.int64),
+    }
+
+
+def read_user_columns(db=None) -> tuple[list[str], dict]:
+    """
+    Streams every user (only the fields the formulas need) into columns.
+    Missing fields get the UserBase defaults, like the scalar path.
+    """
+    from app.db.firebase import get_db
+    db = db or get_db()
+    defaults = UserBase.model_fields
+
+    user_ids = []
+    columns = {field: [] for field in _PROFILE_FIELDS}
+    for doc in db.collection(USER_COLLECTION).select(list(_PROFILE_FIELDS)).stream():
+        data = doc.to_dict() or {}
+        user_ids.append(doc.id)
+        for field in _PROFILE_FIELDS:
+            value = data.get(field)
+            columns[field].append(defaults[field].default if value is None else value)
+    return user_ids, columns
+
+
+def write_user_targets(user_ids: list[str], targets: dict, db=None) -> int:
+    """Writes each user's targets to users/{id}.nutrition_targets in batches."""
+    from app.db.firebase import get_db
+    db = db or get_db()
+    users_ref = db.collection(USER_COLLECTION)
+
+    written = 0
+    batch = db.batch()
+    for i, user_id in enumerate(user_ids):
+        batch.set(users_ref.document(user_id), {
+            TARGET_FIELD: {name: int(values[i]) for name, values in targets.items()}
+        }, merge=True)
+        written += 1
+        if written % BATCH_LIMIT == 0:
+            batch.commit()
+            batch = db.batch()
+    if written % BATCH_LIMIT:
+        batch.commit()
+    return written
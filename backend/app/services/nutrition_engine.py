@@ -1,39 +1,50 @@
-from app.services import ai_plan
-from app.models.user import UserBase, Gender, ActivityLevel, Goal
+import asyncio
+
+from app.core.config import settings
+from app.services import ai_plan, recipe_index
+from app.models.user import UserBase, Gender, ActivityLevel, Goal, PlanningMode
+
+# Harris-Benedict Revised coefficients: (constant, weight, height, age)
+BMR_COEFFICIENTS = {
+    Gender.MALE: (88.362, 13.397, 4.799, 5.677),
+    Gender.FEMALE: (447.593, 9.247, 3.098, 4.330),
+}
+
+ACTIVITY_MULTIPLIERS = {
+    ActivityLevel.SEDENTARY: 1.2,
+    ActivityLevel.LIGHT: 1.375,
+    ActivityLevel.MODERATE: 1.55,
+    ActivityLevel.VERY_ACTIVE: 1.725
+}
+DEFAULT_ACTIVITY_MULTIPLIER = 1.2
+
+GOAL_ADJUSTMENTS = {
+    Goal.LOSE_WEIGHT: -500,
+    Goal.GAIN_MUSCLE: 300,
+}
 
 def calculate_bmr(user: UserBase) -> float:
     """Calculates Basal Metabolic Rate using Harris-Benedict Revised."""
-    if user.gender == Gender.MALE:
-        return 88.362 + (13.397 * user.weight) + (4.799 * user.height) - (5.677 * user.age)
-    else:
-        return 447.593 + (9.247 * user.weight) + (3.098 * user.height) - (4.330 * user.age)
+    gender = Gender.MALE if user.gender == Gender.MALE else Gender.FEMALE
+    constant, per_kg, per_cm, per_year = BMR_COEFFICIENTS[gender]
+    return constant + (per_kg * user.weight) + (per_cm * user.height) - (per_year * user.age)
 
 def calculate_tdee(bmr: float, activity_level: ActivityLevel) -> float:
     """Calculates Total Daily Energy Expenditure."""
-    multipliers = {
-        ActivityLevel.SEDENTARY: 1.2,
-        ActivityLevel.LIGHT: 1.375,
-        ActivityLevel.MODERATE: 1.55,
-        ActivityLevel.VERY_ACTIVE: 1.725
-    }
-    return bmr * multipliers.get(activity_level, 1.2)
+    return bmr * ACTIVITY_MULTIPLIERS.get(activity_level, DEFAULT_ACTIVITY_MULTIPLIER)
 
 def adjust_for_goal(tdee: float, goal: Goal) -> float:
     """Adjusts calories based on user goal."""
-    if goal == Goal.LOSE_WEIGHT:
-        return tdee - 500
-    elif goal == Goal.GAIN_MUSCLE:
-        return tdee + 300
-    return tdee
+    return tdee + GOAL_ADJUSTMENTS.get(goal, 0)
 
-def generate_weekly_plan(user: UserBase):
+def calculate_targets(user: UserBase) -> tuple[float, float, int]:
+    """Returns (bmr, tdee, daily_target) for the user."""
     bmr = calculate_bmr(user)
     tdee = calculate_tdee(bmr, user.activity_level)
     daily_target = int(adjust_for_goal(tdee, user.goal))
-    
-    # Delegate to AI Service
-    ai_result = ai_plan.generate_ai_weekly_plan(user, daily_target)
-    
+    return bmr, tdee, daily_target
+
+def build_plan_result(bmr: float, tdee: float, daily_target: int, ai_result: dict) -> dict:
     return {
         "bmr": int(bmr),
         "tdee": int(tdee),
@@ -41,55 +52,94 @@ def generate_weekly_plan(user: UserBase):
         "plan": ai_result.get("plan", [])
     }
 
-def find_alternative_recipe(meal_type: str, exclude_ids: list[str] = [], keywords: list[str] = []) -> dict:
-    # Legacy/Fallback or Implement AI single recipe gen?
-    # For now returning None as we want full AI behavior and regenerate button does full plan usually.
-    # User might want to swap single meal though.
-    return None
-
+def plan_locally(user: UserBase, daily_target: int) -> dict | None:
+    """Local optimizer fast path; None when disabled or the catalog can't meet the targets."""
+    if settings.PLAN_STRATEGY != "local_first" or user.planning_mode != PlanningMode.AUTOMATIC:
+        return None
+    from app.services import plan_optimizer
+    try:
+        return plan_optimizer.optimize_weekly_plan(user, daily_target)
+    except Exception as e:
+        print(f"Local plan optimizer failed: {e}")
+        return None
 
-def update_latest_plan_meal(user_id: str, meal_type: str, keywords: list[str] = []) -> dict:
-    from app.db.firebase import get_db
+def generate_weekly_plan(user: UserBase):
+    bmr, tdee, daily_target = calculate_targets(user)
+    
+    # Delegate to AI Service unless the local optimizer can build the plan
+    ai_result = plan_locally(user, daily_target) or ai_plan.generate_ai_weekly_plan(user, daily_target)
     
-    db = get_db()
+    return build_plan_result(bmr, tdee, daily_target, ai_result)
+
+async def generate_weekly_plan_async(user: UserBase):
+    bmr, tdee, daily_target = calculate_targets(user)
+
+    ai_result = await asyncio.to_thread(plan_locally, user, daily_target)
+    if ai_result is None:
+        ai_result = await ai_plan.generate_ai_weekly_plan_async(user, daily_target)
+
+    return build_plan_result(bmr, tdee, daily_target, ai_result)
+
+def find_alternative_recipe(meal_type: str, exclude_ids: list[str] = [], keywords: list[str] = [],
+                            target_calories: float | None = None, exclude_names: list[str] = [],
+                            exclude_keywords: list[str] = [], diet_type: str | None = None) -> dict:
+    """
+    Finds a swap for a meal in the in-process recipe index (no LLM call):
+    same meal_type, calories within tolerance of target_calories, matching
+    the keywords, fitting the user's diet and not one of the excluded
+    recipes or ingredients.
+    """
+    return recipe_index.get_index().find(
+        meal_type,
+        target_calories=target_calories,
+        keywords=keywords,
+        exclude_ids=exclude_ids,
+        exclude_names=exclude_names,
+        exclude_keywords=exclude_keywords,
+        diet_type=diet_type,
+    )
+
+
+def update_latest_plan_meal(user_id: str, meal_type: str, keywords: list[str] = [],
+                            exclude_keywords: list[str] = [], diet_type: str | None = None) -> dict:
+    from app.services import plan_service
     
-    plans_ref = db.collection('users').document(user_id).collection('meal_plans')
-    docs = plans_ref.stream()
-    all_plans = list(docs)
+    latest = plan_service.get_latest_plan(user_id)
     
-    if not all_plans:
+    if latest is None:
         return {'success': False, 'message': 'No active plan found to update.'}
         
-    latest_doc = all_plans[-1]
-    plan_data = latest_doc.to_dict()
-    plan_id = latest_doc.id
+    plan_id, plan_data = latest
     
     weekly_plan = plan_data.get('plan', [])
     
     found = False
     new_recipe = None
+    day_index = None
     
-    for day_plan in weekly_plan:
+    for index, day_plan in enumerate(weekly_plan):
         meals = day_plan.get('meals', [])
         for i, meal in enumerate(meals):
-            if meal['meal_type'] == meal_type:
-                old_recipe_id = meal['recipe_id']
-                
-                new_recipe_data = find_alternative_recipe(meal_type, exclude_ids=[old_recipe_id], keywords=keywords)
+            if meal.get('meal_type') == meal_type:
+                new_recipe_data = find_alternative_recipe(
+                    meal_type,
+                    exclude_ids=[meal.get('id')],
+                    keywords=keywords,
+                    target_calories=meal.get('calories') or None,
+                    exclude_names=[meal.get('name')],
+                    exclude_keywords=exclude_keywords,
+                    diet_type=diet_type,
+                )
                 
                 if new_recipe_data:
-                    meals[i] = {
-                        'recipe_id': new_recipe_data['id'],
-                        'name': new_recipe_data['name'],
-                        'calories': new_recipe_data['calories'],
-                        'meal_type': new_recipe_data['type']
-                    }
+                    meals[i] = new_recipe_data
                     
-                    delta = new_recipe_data['calories'] - meal['calories']
-                    day_plan['total_calories'] += delta
+                    delta = new_recipe_data['calories'] - (meal.get('calories') or 0)
+                    day_plan['total_calories'] = day_plan.get('total_calories', 0) + delta
                     
                     found = True
                     new_recipe = new_recipe_data
+                    day_index = index
                     break
         if found:
             break
@@ -97,11 +147,11 @@ def update_latest_plan_meal(user_id: str, meal_type: str, keywords: list[str] =
     if not found or not new_recipe:
         return {'success': False, 'message': 'Could not find a suitable alternative recipe.'}
         
-    plans_ref.document(plan_id).update({'plan': weekly_plan})
+    # Only the changed day is written back
+    plan_service.update_plan_day(user_id, plan_id, plan_data, day_index)
     
     return {
         'success': True, 
         'message': f"Updated your {meal_type} to: {new_recipe['name']}",
         'new_meal': new_recipe
     }
-
@@ -0,0 +1,132 @@
+import copy
+import hashlib
+import json
+import threading
+import time
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import UserBase
+
+PLAN_CACHE_COLLECTION = "plan_cache"
+# Bump when the plan prompt or meal format (e.g. image URLs) changes so old
+# entries stop matching.
+PLAN_CACHE_VERSION = 2
+
+_memory = TTLCache(maxsize=settings.PLAN_CACHE_MAX_ENTRIES, ttl=settings.PLAN_CACHE_TTL_SECONDS)
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "firestore_hits": 0, "misses": 0, "writes": 0}
+
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def _enum_value(value):
+    return getattr(value, "value", value)
+
+
+def _normalize(text) -> str:
+    return str(text or "").strip().lower()
+
+
+def plan_cache_key(user: UserBase, daily_calories: int) -> str:
+    """
+    Canonical hash of the profile fields that feed the plan prompt.
+    Calories are bucketed, weight rounded and foods_like sorted so that
+    near-identical profiles share an entry.
+    """
+    bucket = max(1, settings.PLAN_CACHE_CALORIE_BUCKET)
+    profile = {
+        "v": PLAN_CACHE_VERSION,
+        "gender": _enum_value(user.gender),
+        "age": user.age,
+        "weight": round(user.weight),
+        "country": _normalize(user.country),
+        "region": _normalize(user.region),
+        "goal": _enum_value(user.goal),
+        "diet_type": _enum_value(user.diet_type),
+        "foods_like": sorted({_normalize(food) for food in user.foods_like if _normalize(food)}),
+        "preparation_style": _enum_value(user.preparation_style),
+        "variety_level": _enum_value(user.variety_level),
+        "meals_per_day": list(user.meals_per_day),
+        "calories": int(round(daily_calories / bucket) * bucket),
+    }
+    canonical = json.dumps(profile, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _firestore_get(key: str):
+    from app.db.firebase import get_db
+    try:
+        with metrics.span("firestore", "plan_cache_get"):
+            doc = get_db().collection(PLAN_CACHE_COLLECTION).document(key).get()
+        if not doc.exists:
+            return None
+        entry = doc.to_dict()
+        if entry.get("expires_at", 0) <= time.time():
+            return None
+        return entry.get("data")
+    except Exception as e:
+        print(f"Plan cache read failed: {e}")
+        return None
+
+
+def _firestore_set(key: str, data: dict):
+    from app.db.firebase import get_db
+    try:
+        with metrics.span("firestore", "plan_cache_set"):
+            get_db().collection(PLAN_CACHE_COLLECTION).document(key).set({
+                "data": data,
+                "created_at": time.time(),
+                "expires_at": time.time() + settings.PLAN_CACHE_TTL_SECONDS,
+            })
+    except Exception as e:
+        print(f"Plan cache write failed: {e}")
+
+
+def get(key: str) -> dict | None:
+    """Looks the plan up in memory first, then in the shared Firestore tier."""
+    if not settings.PLAN_CACHE_ENABLED:
+        return None
+    data = _memory.get(key)
+    if data is not None:
+        _count("memory_hits")
+        return copy.deepcopy(data)
+    if settings.PLAN_CACHE_FIRESTORE:
+        data = _firestore_get(key)
+        if data is not None:
+            _count("firestore_hits")
+            _memory.set(key, data)
+            return copy.deepcopy(data)
+    _count("misses")
+    return None
+
+
+def put(key: str, data: dict):
+    """Stores a generated plan. Empty plans (failed generations) are never cached."""
+    if not settings.PLAN_CACHE_ENABLED or not data.get("plan"):
+        return
+    data = copy.deepcopy(data)
+    _memory.set(key, data)
+    _count("writes")
+    if settings.PLAN_CACHE_FIRESTORE:
+        _firestore_set(key, data)
+
+
+def clear():
+    _memory.clear()
+    with _stats_lock:
+        for name in _stats:
+            _stats[name] = 0
+
+
+def get_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["memory_hits"] + stats["firestore_hits"] + stats["misses"]
+    stats["size"] = len(_memory)
+    stats["hit_ratio"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+    return stats
@@ -0,0 +1,179 @@
+"""
+Single-flight for plan generation. Concurrent requests with the same user id
+and profile share one generation (and one saved plan):
+
+- within a worker, callers wait on the leader's concurrent.futures.Future,
+  which works across event loops and threads;
+- across workers, a lease document in Firestore marks the generation as
+  running, and other workers poll it until the leader records the plan_id.
+
+Optionally, callers also get the same plan back for
+PLAN_COALESCE_WINDOW_SECONDS after a generation, which absorbs double taps
+and client retries that arrive late (off by default).
+"""
+import asyncio
+import concurrent.futures
+import copy
+import hashlib
+import json
+import threading
+import time
+import uuid
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import UserBase
+
+LEASE_COLLECTION = "plan_leases"
+RUNNING = "running"
+DONE = "done"
+LEASE_ATTEMPTS = 3
+
+# Identifies this worker process as a lease owner
+_owner = uuid.uuid4().hex
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+_recent = TTLCache(maxsize=1024, ttl=settings.PLAN_COALESCE_WINDOW_SECONDS)
+
+
+def coalesce_key(user_id: str, user: UserBase) -> str:
+    """User id plus a hash of the full profile, so a profile edit starts a new generation."""
+    profile = json.dumps(user.model_dump(mode="json"), sort_keys=True, separators=(",", ":"))
+    return f"{user_id}:{hashlib.sha256(profile.encode('utf-8')).hexdigest()[:32]}"
+
+
+def _lease_ref(key: str):
+    from app.db.firebase import get_db
+    return get_db().collection(LEASE_COLLECTION).document(hashlib.sha256(key.encode("utf-8")).hexdigest())
+
+
+def _acquire_lease(key: str) -> dict:
+    """
+    Returns {"acquired": True} when this worker should generate, or the
+    current lease ({"state", "plan_id", ...}) when another worker is running
+    or just finished the same generation.
+    """
+    from google.cloud import firestore as google_firestore
+    from app.db.firebase import get_db
+
+    ref = _lease_ref(key)
+
+    @google_firestore.transactional
+    def acquire(transaction):
+        now = time.time()
+        snapshot = ref.get(transaction=transaction)
+        lease = (snapshot.to_dict() or {}) if snapshot.exists else {}
+        if lease.get("state") == RUNNING and lease.get("expires_at", 0) > now:
+            return lease
+        if lease.get("state") == DONE and lease.get("completed_at", 0) + settings.PLAN_COALESCE_WINDOW_SECONDS > now:
+            return lease
+        transaction.set(ref, {
+            "state": RUNNING,
+            "owner": _owner,
+            "expires_at": now + settings.PLAN_COALESCE_LEASE_SECONDS,
+        })
+        return {"acquired": True}
+
+    return acquire(get_db().transaction())
+
+
+def _complete_lease(key: str, plan_id: str):
+    _lease_ref(key).set({"state": DONE, "owner": _owner, "plan_id": plan_id, "completed_at": time.time()})
+
+
+def _release_lease(key: str):
+    _lease_ref(key).delete()
+
+
+def _read_lease(key: str) -> dict:
+    snapshot = _lease_ref(key).get()
+    return (snapshot.to_dict() or {}) if snapshot.exists else {}
+
+
+async def _wait_for_lease(key: str, lease: dict) -> str | None:
+    """Polls another worker's lease; returns its plan_id, or None if it failed or expired."""
+    while lease.get("state") == RUNNING and lease.get("expires_at", 0) > time.time():
+        await asyncio.sleep(settings.PLAN_COALESCE_POLL_SECONDS)
+        lease = await asyncio.to_thread(_read_lease, key)
+    return lease.get("plan_id") if lease.get("state") == DONE else None
+
+
+async def _lead(user_id: str, key: str, produce) -> dict:
+    if not settings.PLAN_COALESCE_FIRESTORE:
+        return await produce()
+
+    from app.services import plan_service
+
+    # Another worker may be generating (or just generated) this plan
+    acquired = False
+    for _ in range(LEASE_ATTEMPTS):
+        try:
+            lease = await asyncio.to_thread(_acquire_lease, key)
+        except Exception as e:
+            print(f"Plan lease acquire failed: {e}")
+            break
+        if lease.get("acquired"):
+            acquired = True
+            break
+        plan_id = await _wait_for_lease(key, lease)
+        if plan_id:
+            plan = await asyncio.to_thread(plan_service.get_plan, user_id, plan_id)
+            if plan is not None:
+                return {"plan_id": plan_id, "summary": plan}
+        # The other worker failed or its plan is gone: try to take over
+    if not acquired:
+        return await produce()
+
+    try:
+        outcome = await produce()
+    except BaseException:
+        try:
+            await asyncio.to_thread(_release_lease, key)
+        except Exception as e:
+            print(f"Plan lease release failed: {e}")
+        raise
+    try:
+        await asyncio.to_thread(_complete_lease, key, outcome["plan_id"])
+    except Exception as e:
+        print(f"Plan lease update failed: {e}")
+    return outcome
+
+
+async def generate_once(user_id: str, user: UserBase, produce) -> dict:
+    """
+    Runs `produce` (an async callable returning {"plan_id", "summary"}) unless
+    an identical generation is in flight or just finished, in which case its
+    result is returned instead.
+    """
+    key = coalesce_key(user_id, user)
+    recent = _recent.get(key)
+    if recent is not None:
+        return copy.deepcopy(recent)
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = concurrent.futures.Future()
+
+    if not leader:
+        return copy.deepcopy(await asyncio.wrap_future(future))
+
+    try:
+        outcome = await _lead(user_id, key, produce)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        if settings.PLAN_COALESCE_WINDOW_SECONDS > 0:
+            _recent.set(key, outcome, ttl=settings.PLAN_COALESCE_WINDOW_SECONDS)
+        future.set_result(outcome)
+        return copy.deepcopy(outcome)
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def clear():
+    _recent.clear()
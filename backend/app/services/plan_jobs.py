@@ -0,0 +1,222 @@
+"""
+Background plan generation. POST /plans/generate?job=true stores a job in
+the plan_jobs collection and returns right away; a fixed pool of asyncio
+workers per process runs the jobs in priority order, and clients poll
+GET /plans/jobs/{id}. Jobs are claimed with a lease in a transaction, so
+unfinished jobs are picked up again after a restart (by any worker) and a
+job never runs twice at once.
+"""
+import asyncio
+import itertools
+import time
+import uuid
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import plan_coalescing
+
+JOB_COLLECTION = "plan_jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# What clients see for a failed job; the details only go to the logs
+JOB_ERROR = "Plan generation failed, please try again"
+
+# Lower runs first. A user waiting for their first plan goes ahead of regenerations.
+PRIORITY_FIRST_PLAN = 0
+PRIORITY_NORMAL = 10
+
+_owner = uuid.uuid4().hex
+_queue = None
+_workers = []
+_sequence = itertools.count()
+_active = {}  # coalesce key -> job_id, for jobs queued or running in this process
+
+
+async def generate_and_save(user_id: str, user: UserBase) -> dict:
+    """Generates and saves a plan (coalesced with identical requests). Returns {"plan_id", "summary"}."""
+    from app.services import image_proxy, nutrition_engine, plan_service
+
+    async def produce():
+        result = await nutrition_engine.generate_weekly_plan_async(user)
+        plan_id = await asyncio.to_thread(plan_service.save_plan, user_id, result)
+        image_proxy.prefetch_plan(result)
+        return {"plan_id": plan_id, "summary": result}
+
+    return await plan_coalescing.generate_once(user_id, user, produce)
+
+
+def _jobs_ref():
+    from app.db.firebase import get_db
+    return get_db().collection(JOB_COLLECTION)
+
+
+def _create_job(user_id: str, user: UserBase, key: str, priority: int) -> dict:
+    now = time.time()
+    job = {
+        "user_id": user_id,
+        "profile": user.model_dump(mode="json"),
+        "dedup_key": key,
+        "priority": priority,
+        "status": QUEUED,
+        "created_at": now,
+        "updated_at": now,
+    }
+    ref = _jobs_ref().document()
+    ref.set(job)
+    return {**job, "id": ref.id}
+
+
+def _find_active_job(key: str) -> dict | None:
+    query = _jobs_ref().where("dedup_key", "==", key).where("status", "in", list(ACTIVE_STATES)).limit(1)
+    for doc in query.stream():
+        return {**(doc.to_dict() or {}), "id": doc.id}
+    return None
+
+
+def _claim_job(job_id: str) -> dict | None:
+    """Marks a queued (or abandoned running) job as running under this worker's lease."""
+    from google.cloud import firestore as google_firestore
+    from app.db.firebase import get_db
+
+    ref = _jobs_ref().document(job_id)
+
+    @google_firestore.transactional
+    def claim(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        job = snapshot.to_dict() or {}
+        now = time.time()
+        abandoned = job.get("status") == RUNNING and job.get("lease_expires_at", 0) <= now
+        if job.get("status") != QUEUED and not abandoned:
+            return None
+        transaction.update(ref, {
+            "status": RUNNING,
+            "owner": _owner,
+            "lease_expires_at": now + settings.PLAN_JOB_LEASE_SECONDS,
+            "attempts": job.get("attempts", 0) + 1,
+            "updated_at": now,
+        })
+        return {**job, "id": job_id}
+
+    return claim(get_db().transaction())
+
+
+def _finish_job(job_id: str, fields: dict):
+    _jobs_ref().document(job_id).update({**fields, "updated_at": time.time()})
+
+
+def _pending_jobs() -> list[dict]:
+    query = _jobs_ref().where("status", "in", list(ACTIVE_STATES))
+    return [{**(doc.to_dict() or {}), "id": doc.id} for doc in query.stream()]
+
+
+def get_job(job_id: str) -> dict | None:
+    doc = _jobs_ref().document(job_id).get()
+    return {**(doc.to_dict() or {}), "id": doc.id} if doc.exists else None
+
+
+def _schedule(job: dict):
+    if _queue is None:
+        return  # workers stopped; the job stays in Firestore for the next start
+    _queue.put_nowait((job.get("priority", PRIORITY_NORMAL), next(_sequence), job["id"]))
+
+
+async def submit(user_id: str, user: UserBase, priority: int = PRIORITY_NORMAL) -> dict:
+    """
+    Queues a generation and returns the job. An identical request that is
+    still queued or running returns the existing job instead.
+    """
+    if _queue is None:
+        raise RuntimeError("Plan job workers are not running")
+
+    key = plan_coalescing.coalesce_key(user_id, user)
+    job_id = _active.get(key)
+    if job_id is not None:
+        return await asyncio.to_thread(get_job, job_id)
+
+    job = await asyncio.to_thread(_find_active_job, key)
+    if job is not None:
+        return job
+
+    job = await asyncio.to_thread(_create_job, user_id, user, key, priority)
+    _active[key] = job["id"]
+    _schedule(job)
+    return job
+
+
+async def _run(job_id: str):
+    job = await asyncio.to_thread(_claim_job, job_id)
+    if job is None:
+        return  # finished, or claimed by another worker
+
+    key = job.get("dedup_key")
+    _active[key] = job_id
+    try:
+        outcome = await generate_and_save(job["user_id"], UserBase(**job["profile"]))
+        await asyncio.to_thread(_finish_job, job_id, {"status": DONE, "plan_id": outcome["plan_id"]})
+    except Exception as e:
+        print(f"Plan job {job_id} failed: {e}")
+        await asyncio.to_thread(_finish_job, job_id, {"status": FAILED, "error": JOB_ERROR})
+    finally:
+        if _active.get(key) == job_id:
+            del _active[key]
+
+
+async def _worker():
+    while True:
+        _, _, job_id = await _queue.get()
+        try:
+            await _run(job_id)
+        except Exception as e:
+            print(f"Plan job worker error: {e}")
+        finally:
+            _queue.task_done()
+
+
+async def resume():
+    """Requeues jobs left queued or running by a previous process."""
+    try:
+        jobs = await asyncio.to_thread(_pending_jobs)
+    except Exception as e:
+        print(f"Could not load pending plan jobs: {e}")
+        return
+
+    loop = asyncio.get_running_loop()
+    for job in jobs:
+        # A running job whose lease is still valid may belong to a live worker;
+        # look again once the lease runs out.
+        delay = job.get("lease_expires_at", 0) - time.time() if job.get("status") == RUNNING else 0
+        if delay > 0:
+            loop.call_later(delay, _schedule, job)
+        else:
+            _schedule(job)
+
+
+async def start(resume_pending: bool = True):
+    """
+    Starts the workers. With resume_pending (and PLAN_JOB_RESUME) also
+    requeues unfinished jobs; the app does that later, in the background.
+    """
+    global _queue
+    if _queue is not None:
+        return
+    _queue = asyncio.PriorityQueue()
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(max(1, settings.PLAN_JOB_WORKERS)))
+    if resume_pending and settings.PLAN_JOB_RESUME:
+        await resume()
+
+
+async def stop():
+    global _queue
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _active.clear()
+    _queue = None
@@ -0,0 +1,151 @@
+"""
+Deterministic local planner: builds a weekly plan from the recipe catalog
+(dishes from previously generated plans) without calling Gemini. Each day is
+filled greedily slot by slot, scoring every candidate at once with NumPy on
+calorie fit, diet macro fit, foods_like and variety. Returns None when the
+catalog can't meet the targets, so the caller falls back to the AI.
+"""
+import copy
+
+import numpy as np
+
+from app.core.config import settings
+from app.models.user import UserBase, DietType
+from app.services import recipe_index
+from app.services.ai_plan import WEEK_DAYS, FANOUT_UNIQUE_DAYS
+
+# Share of the daily calories per meal slot (normalized over the user's slots)
+MEAL_SHARES = {"Breakfast": 0.25, "Lunch": 0.35, "Dinner": 0.30, "Snack": 0.10}
+
+# Fraction of calories from (protein, carbs, fats) per diet type
+MACRO_RATIOS = {
+    DietType.BALANCED: (0.25, 0.50, 0.25),
+    DietType.HIGH_PROTEIN: (0.35, 0.40, 0.25),
+    DietType.LOW_CARB: (0.30, 0.25, 0.45),
+    DietType.KETO: (0.20, 0.05, 0.75),
+    DietType.LOW_FAT: (0.25, 0.60, 0.15),
+    DietType.VEGAN: (0.20, 0.55, 0.25),
+}
+
+KCAL_PER_GRAM = np.array([4.0, 4.0, 9.0])
+PORTION_RANGE = (0.8, 1.2)
+MACRO_WEIGHT = 1.0
+LIKE_BONUS = 0.15
+
+
+class _Candidates:
+    """Column arrays for the recipes of one meal_type."""
+
+    def __init__(self, recipes: list[dict], likes: set[str], index: recipe_index.RecipeIndex):
+        self.recipes = recipes
+        self.calories = np.array([r["calories"] for r in recipes], dtype=np.float64)
+        self.macros = np.array(
+            [[r.get("protein") or 0, r.get("carbs") or 0, r.get("fats") or 0] for r in recipes],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        macro_kcal = self.macros * KCAL_PER_GRAM
+        totals = macro_kcal.sum(axis=1, keepdims=True)
+        self.macro_fractions = np.divide(macro_kcal, totals, out=np.zeros_like(macro_kcal), where=totals > 0)
+        self.likes = np.array(
+            [len(likes & index.keywords(r)) > 0 for r in recipes], dtype=np.float64
+        ) if likes else np.zeros(len(recipes))
+
+
+def _slot_shares(meal_types: list[str]) -> np.ndarray:
+    shares = np.array([MEAL_SHARES.get(str(t).capitalize(), 0.2) for t in meal_types], dtype=np.float64)
+    return shares / shares.sum()
+
+
+def _scaled_meal(recipe: dict, portion: float) -> dict:
+    meal = copy.deepcopy(recipe)
+    if portion != 1.0:
+        meal["portion"] = round(portion, 2)
+        for field in ("calories", "protein", "carbs", "fats"):
+            if isinstance(meal.get(field), (int, float)):
+                meal[field] = round(meal[field] * portion)
+    return meal
+
+
+def _plan_day(slots, shares, daily_calories, ratios, candidates, used) -> list[dict] | None:
+    meals = []
+    remaining = float(daily_calories)
+    for i, meal_type in enumerate(slots):
+        pool = candidates[meal_type]
+        remaining_share = shares[i:].sum()
+        target = remaining * shares[i] / remaining_share
+
+        portions = np.clip(target / pool.calories, *PORTION_RANGE)
+        scaled = pool.calories * portions
+        score = (
+            np.abs(scaled - target) / target
+            + MACRO_WEIGHT * np.abs(pool.macro_fractions - ratios).sum(axis=1)
+            - LIKE_BONUS * pool.likes
+        )
+        score[used[meal_type]] = np.inf
+        best = int(np.argmin(score))
+        if not np.isfinite(score[best]):
+            return None
+
+        used[meal_type][best] = True
+        meal = _scaled_meal(pool.recipes[best], float(portions[best]))
+        meal["meal_type"] = meal_type
+        meals.append(meal)
+        remaining -= meal["calories"]
+    return meals
+
+
+def _day_within_tolerance(meals: list[dict], daily_calories: int, ratios: np.ndarray) -> bool:
+    total = sum(meal["calories"] for meal in meals)
+    if abs(total - daily_calories) > settings.PLAN_OPTIMIZER_CALORIE_TOLERANCE * daily_calories:
+        return False
+    grams = np.array([[m.get("protein") or 0, m.get("carbs") or 0, m.get("fats") or 0] for m in meals]).sum(axis=0)
+    macro_kcal = grams * KCAL_PER_GRAM
+    if macro_kcal.sum() <= 0:
+        return False
+    return bool(np.all(np.abs(macro_kcal / macro_kcal.sum() - ratios) <= settings.PLAN_OPTIMIZER_MACRO_TOLERANCE))
+
+
+def optimize_weekly_plan(user: UserBase, daily_calories: int, index: recipe_index.RecipeIndex | None = None) -> dict | None:
+    """
+    Builds {"plan": [...]} in the same shape as the AI planner, or returns
+    None if any day misses the calorie target or the macro ratios by more
+    than the PLAN_OPTIMIZER_*_TOLERANCE settings.
+    """
+    if index is None:
+        index = recipe_index.get_index()
+    slots = [str(t).capitalize() for t in (user.meals_per_day or ['Breakfast', 'Lunch', 'Dinner'])]
+    ratios = np.array(MACRO_RATIOS.get(user.diet_type, MACRO_RATIOS[DietType.BALANCED]))
+    likes = set()
+    for food in user.foods_like or []:
+        likes |= recipe_index.tokenize(food)
+
+    variety = user.variety_level.value if user.variety_level else 'Medium'
+    unique_days = FANOUT_UNIQUE_DAYS.get(variety, 4)
+
+    candidates = {}
+    for meal_type in set(slots):
+        recipes = index.recipes(meal_type)
+        recipes = [r for r in recipes if index.fits_diet(r, user.diet_type)]
+        # No dish repeats within the distinct days, so each slot needs enough options
+        if len(recipes) < unique_days * slots.count(meal_type):
+            return None
+        candidates[meal_type] = _Candidates(recipes, likes, index)
+
+    shares = _slot_shares(slots)
+    used = {meal_type: np.zeros(len(pool.recipes), dtype=bool) for meal_type, pool in candidates.items()}
+    distinct = []
+    for _ in range(unique_days):
+        meals = _plan_day(slots, shares, daily_calories, ratios, candidates, used)
+        if meals is None or not _day_within_tolerance(meals, daily_calories, ratios):
+            return None
+        distinct.append(meals)
+
+    plan = []
+    for i, day_name in enumerate(WEEK_DAYS):
+        meals = copy.deepcopy(distinct[i % len(distinct)])
+        plan.append({
+            "day": day_name,
+            "total_calories": sum(meal["calories"] for meal in meals),
+            "meals": meals,
+        })
+    return {"plan": plan}
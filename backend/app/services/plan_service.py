@@ -0,0 +1,148 @@
+import hashlib
+
+from app.core import metrics, responses
+from app.db.firebase import get_db
+from app.services import recipe_index, user_service
+
+USER_COLLECTION = "users"
+PLAN_COLLECTION = "meal_plans"
+DAY_COLLECTION = "plan_days"
+
+# Plans are stored as a header document (targets, timestamps) plus one
+# document per day under meal_plans/{id}/plan_days, so a meal swap only
+# rewrites the day it touches. Plans saved before this layout keep the whole
+# week in the header's `plan` field and are still read and updated as-is.
+LAYOUT_FIELD = "layout"
+DAYS_LAYOUT = "days"
+
+# The user document carries a content hash of the latest plan, so clients
+# polling /plans/latest can be answered from one point read of it. Any
+# worker may move the pointer, so it is never taken from the cached profile.
+VERSION_FIELD = "latest_plan_version"
+
+
+def _plans_ref(db, user_id: str):
+    return db.collection(USER_COLLECTION).document(user_id).collection(PLAN_COLLECTION)
+
+
+def _day_id(index: int) -> str:
+    # Zero-padded so document ids sort in day order
+    return f"{index:02d}"
+
+
+def plan_version(plan: dict) -> str:
+    """Content hash of a plan's days; changes whenever a meal does."""
+    return hashlib.sha256(responses.dumps(plan.get("plan") or [], sort_keys=True)).hexdigest()[:16]
+
+
+def save_plan(user_id: str, result: dict) -> str:
+    """
+    Saves a generated plan under users/{id}/meal_plans (header + one document
+    per day) with a server timestamp and points the user's `latest_plan_id`
+    at it, in a single batch.
+    """
+    from google.cloud import firestore as google_firestore
+    db = get_db()
+    user_ref = db.collection(USER_COLLECTION).document(user_id)
+    plan_ref = _plans_ref(db, user_id).document()
+    days = result.get("plan", []) or []
+
+    header = {key: value for key, value in result.items() if key != "plan"}
+    header.update({
+        LAYOUT_FIELD: DAYS_LAYOUT,
+        "day_count": len(days),
+        "created_at": google_firestore.SERVER_TIMESTAMP,
+    })
+
+    batch = db.batch()
+    batch.set(plan_ref, header)
+    for index, day in enumerate(days):
+        batch.set(plan_ref.collection(DAY_COLLECTION).document(_day_id(index)), day)
+    batch.set(user_ref, {
+        "latest_plan_id": plan_ref.id,
+        VERSION_FIELD: plan_version(result),
+        "updated_at": google_firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+    with metrics.span("firestore", "save_plan"):
+        batch.commit()
+    user_service.invalidate_user(user_id)
+
+    # Make the new dishes available to meal swaps right away
+    recipe_index.add_plan(result)
+    return plan_ref.id
+
+
+def _assemble(plan_doc) -> dict:
+    """Returns the plan document with its day documents in `plan`, in order."""
+    plan = plan_doc.to_dict() or {}
+    if plan.get(LAYOUT_FIELD) == DAYS_LAYOUT:
+        day_docs = plan_doc.reference.collection(DAY_COLLECTION).stream()
+        plan["plan"] = [doc.to_dict() for doc in sorted(day_docs, key=lambda doc: doc.id)]
+    return plan
+
+
+def get_plan_pointer(user_id: str) -> tuple[str | None, str | None]:
+    """(latest_plan_id, version) read from the user document."""
+    with metrics.span("firestore", "get_plan_pointer"):
+        doc = get_db().collection(USER_COLLECTION).document(user_id).get()
+    data = (doc.to_dict() or {}) if doc.exists else {}
+    return data.get("latest_plan_id"), data.get(VERSION_FIELD)
+
+
+def get_latest_plan(user_id: str, plan_id: str | None = None) -> tuple[str, dict] | None:
+    """
+    Returns (plan_id, plan) for the user's newest plan, or None.
+    Uses the `latest_plan_id` pointer (a point get) and falls back to the
+    newest plan by `created_at` for users that have no pointer yet.
+    Pass a plan_id just read with get_plan_pointer to skip reading it again.
+    """
+    from google.cloud import firestore as google_firestore
+    if not plan_id:
+        plan_id, _ = get_plan_pointer(user_id)
+    with metrics.span("firestore", "get_latest_plan"):
+        plans_ref = _plans_ref(get_db(), user_id)
+        if plan_id:
+            doc = plans_ref.document(plan_id).get()
+            if doc.exists:
+                return doc.id, _assemble(doc)
+
+        query = plans_ref.order_by("created_at", direction=google_firestore.Query.DESCENDING).limit(1)
+        for doc in query.stream():
+            return doc.id, _assemble(doc)
+        return None
+
+
+def get_plan(user_id: str, plan_id: str) -> dict | None:
+    with metrics.span("firestore", "get_plan"):
+        doc = _plans_ref(get_db(), user_id).document(plan_id).get()
+        return _assemble(doc) if doc.exists else None
+
+
+def update_plan(user_id: str, plan_id: str, fields: dict):
+    db = get_db()
+    with metrics.span("firestore", "update_plan"):
+        _plans_ref(db, user_id).document(plan_id).update(fields)
+
+
+def update_plan_day(user_id: str, plan_id: str, plan: dict, day_index: int):
+    """
+    Persists a change to one day of a plan returned by get_latest_plan.
+    Per-day plans update only that day's `meals` and `total_calories`
+    fields; legacy single-document plans rewrite the `plan` field. The
+    user's latest plan version is bumped in the same batch.
+    """
+    db = get_db()
+    plan_ref = _plans_ref(db, user_id).document(plan_id)
+    batch = db.batch()
+    if plan.get(LAYOUT_FIELD) == DAYS_LAYOUT:
+        day = plan["plan"][day_index]
+        batch.update(plan_ref.collection(DAY_COLLECTION).document(_day_id(day_index)), {
+            "meals": day.get("meals", []),
+            "total_calories": day.get("total_calories", 0),
+        })
+    else:
+        batch.update(plan_ref, {"plan": plan["plan"]})
+    batch.set(db.collection(USER_COLLECTION).document(user_id), {VERSION_FIELD: plan_version(plan)}, merge=True)
+    with metrics.span("firestore", "update_plan_day"):
+        batch.commit()
+    user_service.invalidate_user(user_id)
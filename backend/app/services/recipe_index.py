@@ -0,0 +1,212 @@
+import bisect
+import copy
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+
+from app.core.config import settings
+from app.models.user import DietType
+
+RECIPE_FIELDS = ("id", "name", "meal_type", "calories", "protein", "carbs", "fats", "ingredients", "prepTime", "image")
+
+STOPWORDS = {
+    "con", "de", "del", "la", "las", "el", "los", "en", "al", "y", "a", "un", "una",
+    "para", "sin", "por", "the", "and", "with", "of", "in",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _stem(token: str) -> str:
+    # Crude plural folding, good enough for "huevos"/"huevo", "tomates"/"tomate"
+    if len(token) > 4 and token.endswith("es"):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> set[str]:
+    return {
+        _stem(token) for token in _TOKEN_RE.findall(_fold(text))
+        if len(token) > 2 and token not in STOPWORDS
+    }
+
+
+# Keywords that rule a dish out for vegan users
+ANIMAL_KEYWORDS = tokenize(
+    "carne res cerdo pollo pavo pescado atun salmon camaron mariscos huevo leche queso yogur "
+    "mantequilla jamon tocino chorizo miel beef pork chicken turkey fish tuna egg milk cheese butter ham bacon"
+)
+
+
+def name_key(name: str) -> str:
+    return " ".join(_TOKEN_RE.findall(_fold(name)))
+
+
+def _meal_type_key(meal_type: str) -> str:
+    return str(meal_type or "").strip().capitalize()
+
+
+class RecipeIndex:
+    """
+    In-process catalog of recipes seen in generated plans, deduplicated by
+    dish name. Keeps an inverted index (keyword -> recipes) over names and
+    ingredients and a calorie-sorted list per meal_type, so alternatives can
+    be found without calling the LLM.
+    """
+
+    def __init__(self):
+        self._recipes = {}
+        self._by_keyword = defaultdict(set)
+        self._by_type = defaultdict(list)
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._recipes)
+
+    def add(self, meal: dict) -> bool:
+        """Indexes a meal. Returns False for placeholders or already-known dishes."""
+        key = name_key(meal.get("name"))
+        calories = meal.get("calories")
+        meal_type = _meal_type_key(meal.get("meal_type"))
+        if not key or not meal_type or not isinstance(calories, (int, float)) or calories <= 0:
+            return False
+
+        recipe = {field: copy.deepcopy(meal[field]) for field in RECIPE_FIELDS if field in meal}
+        recipe["meal_type"] = meal_type
+        keywords = self.keywords(recipe)
+
+        with self._lock:
+            if key in self._recipes:
+                return False
+            self._recipes[key] = recipe
+            for keyword in keywords:
+                self._by_keyword[keyword].add(key)
+            bisect.insort(self._by_type[meal_type], (calories, key))
+        return True
+
+    def add_plan(self, plan: dict) -> int:
+        """Indexes every meal of a stored plan document. Returns how many were new."""
+        added = 0
+        for day in plan.get("plan", []) or []:
+            for meal in day.get("meals", []) or []:
+                added += self.add(meal)
+        return added
+
+    def recipes(self, meal_type: str) -> list[dict]:
+        """All recipes of a meal_type, in calorie order. Treat as read-only."""
+        with self._lock:
+            return [self._recipes[key] for _, key in self._by_type.get(_meal_type_key(meal_type), [])]
+
+    def keywords(self, recipe: dict) -> set[str]:
+        return tokenize(recipe.get("name")) | {
+            token for ingredient in recipe.get("ingredients") or [] for token in tokenize(ingredient)
+        }
+
+    def fits_diet(self, recipe: dict, diet_type: str | None) -> bool:
+        """False for dishes the diet rules out (animal products for vegans)."""
+        if diet_type == DietType.VEGAN:
+            return not (self.keywords(recipe) & ANIMAL_KEYWORDS)
+        return True
+
+    def find(self, meal_type: str, target_calories: float | None = None, keywords=(),
+             exclude_ids=(), exclude_names=(), tolerance: float | None = None,
+             exclude_keywords=(), diet_type: str | None = None) -> dict | None:
+        """
+        Returns a recipe of the same meal_type whose calories are within
+        ±tolerance of target_calories and that matches the keywords (if any),
+        excluding the given ids/names, recipes mentioning any of
+        exclude_keywords and recipes that don't fit diet_type. Prefers more
+        keyword matches, then the closest calorie count.
+        """
+        tolerance = settings.RECIPE_SWAP_CALORIE_TOLERANCE if tolerance is None else tolerance
+        wanted = set()
+        for keyword in keywords or []:
+            wanted |= tokenize(keyword)
+        excluded_names = {name_key(name) for name in exclude_names or []}
+        excluded_ids = set(exclude_ids or [])
+        avoided = set()
+        for keyword in exclude_keywords or []:
+            avoided |= tokenize(keyword)
+
+        with self._lock:
+            entries = self._by_type.get(_meal_type_key(meal_type), [])
+            if target_calories:
+                low = bisect.bisect_left(entries, (target_calories * (1 - tolerance), ""))
+                high = bisect.bisect_right(entries, (target_calories * (1 + tolerance), "\uffff"))
+                entries = entries[low:high]
+
+            best, best_score = None, None
+            for calories, key in entries:
+                recipe = self._recipes[key]
+                if key in excluded_names or recipe.get("id") in excluded_ids:
+                    continue
+                if avoided and any(key in self._by_keyword.get(keyword, ()) for keyword in avoided):
+                    continue
+                if not self.fits_diet(recipe, diet_type):
+                    continue
+                matches = sum(1 for keyword in wanted if key in self._by_keyword.get(keyword, ()))
+                if wanted and not matches:
+                    continue
+                score = (-matches, abs(calories - target_calories) if target_calories else 0)
+                if best_score is None or score < best_score:
+                    best, best_score = recipe, score
+
+        return copy.deepcopy(best) if best else None
+
+
+_index = RecipeIndex()
+_load_lock = threading.Lock()
+
+
+def load_from_firestore(index: RecipeIndex = _index) -> int:
+    """Seeds the index from stored meal plans (across all users)."""
+    from app.db.firebase import get_db
+    from app.services.plan_service import PLAN_COLLECTION, DAY_COLLECTION
+
+    db = get_db()
+    added = 0
+    # Per-day plan documents
+    query = db.collection_group(DAY_COLLECTION).limit(settings.RECIPE_INDEX_MAX_PLANS * 7)
+    for doc in query.stream():
+        added += index.add_plan({"plan": [doc.to_dict() or {}]})
+    # Legacy plans that keep the whole week in one document (newer plan
+    # headers have no `plan` field; their days were read above)
+    query = db.collection_group(PLAN_COLLECTION).where("plan", "!=", None).limit(settings.RECIPE_INDEX_MAX_PLANS)
+    for doc in query.stream():
+        added += index.add_plan(doc.to_dict() or {})
+    index.loaded = True
+    return added
+
+
+def warmup():
+    """
+    Seeds the process-wide index from Firestore. Runs in the background at
+    startup, so no request pays for reading the stored plans; until it is
+    done, swaps only see plans saved by this process.
+    """
+    with _load_lock:
+        if _index.loaded:
+            return
+        try:
+            load_from_firestore(_index)
+        except Exception as e:
+            print(f"Recipe index load failed: {e}")
+
+
+def get_index() -> RecipeIndex:
+    """Returns the process-wide index (seeded by warmup())."""
+    return _index
+
+
+def add_plan(plan: dict) -> int:
+    """Incremental refresh: called whenever a new plan is saved."""
+    return _index.add_plan(plan)
@@ -1,16 +1,120 @@
+import asyncio
+import copy
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.core import metrics
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.db.firebase import get_db
 from app.models.user import UserBase
-from app.core.security import get_password_hash, verify_password
+from app.core.security import get_password_hash, verify_password, verify_and_update_password_async
 
 USER_COLLECTION = "users"
 
+# Read-through profile cache. Profiles are keyed by id (value: (loaded_at, data));
+# email lookups map email -> id and then go through the id cache, so
+# invalidating an id is enough to drop both.
+_profiles = TTLCache(maxsize=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS)
+_email_ids = TTLCache(maxsize=settings.USER_CACHE_MAX_ENTRIES, ttl=settings.USER_CACHE_TTL_SECONDS)
+# The plan pointer (see plan_service) moves whenever any worker saves or
+# edits a plan, so it is never cached nor returned with the profile:
+# plan_service.get_plan_pointer reads it from Firestore.
+PLAN_POINTER_FIELDS = ("latest_plan_id", "latest_plan_version")
+_staleness_lock = threading.Lock()
+_staleness = {"served": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+_listener = None
+
+
+def _cached_profile(user_id: str) -> dict | None:
+    entry = _profiles.get(user_id)
+    if entry is None:
+        return None
+    loaded_at, data = entry
+    age = time.monotonic() - loaded_at
+    with _staleness_lock:
+        _staleness["served"] += 1
+        _staleness["total_seconds"] += age
+        _staleness["max_seconds"] = max(_staleness["max_seconds"], age)
+    return copy.deepcopy(data)
+
+
+def _profile(data: dict) -> dict:
+    return {key: value for key, value in data.items() if key not in PLAN_POINTER_FIELDS}
+
+
+def _cache_profile(user_id: str, data: dict):
+    _profiles.set(user_id, (time.monotonic(), copy.deepcopy(data)))
+    if data.get("email"):
+        _email_ids.set(data["email"], user_id)
+
+
+def invalidate_user(user_id: str):
+    """Drops a cached profile. Called on every write to the user document."""
+    _profiles.pop(user_id)
+
+
+def get_cache_stats() -> dict:
+    with _staleness_lock:
+        served = _staleness["served"]
+        stats = {
+            "avg_staleness_seconds": _staleness["total_seconds"] / served if served else 0.0,
+            "max_staleness_seconds": _staleness["max_seconds"],
+        }
+    stats.update({f"by_id_{k}": v for k, v in _profiles.stats().items()})
+    stats.update({f"by_email_{k}": v for k, v in _email_ids.stats().items()})
+    return stats
+
+
+def clear_cache():
+    _profiles.clear()
+    _email_ids.clear()
+    with _staleness_lock:
+        _staleness.update(served=0, total_seconds=0.0, max_seconds=0.0)
+
+
+def _on_users_snapshot(docs, changes, read_time):
+    for change in changes:
+        invalidate_user(change.document.id)
+
+
+def start_cache_listener():
+    """
+    Optional cross-worker invalidation: listens for user documents written
+    after this process started (writes stamp `updated_at`) and drops them
+    from the local cache.
+    """
+    global _listener
+    if _listener is not None or not settings.USER_CACHE_LISTENER:
+        return
+    since = datetime.now(timezone.utc)
+    query = get_db().collection(USER_COLLECTION).where("updated_at", ">=", since)
+    _listener = query.on_snapshot(_on_users_snapshot)
+
+
+def stop_cache_listener():
+    global _listener
+    if _listener is not None:
+        _listener.unsubscribe()
+        _listener = None
+
 
 def get_user_by_email(email: str) -> dict:
+    user_id = _email_ids.get(email)
+    if user_id is not None:
+        user_data = get_user(user_id)
+        if user_data and user_data.get("email") == email:
+            user_data["id"] = user_id
+            return user_data
+
     db = get_db()
     users_ref = db.collection(USER_COLLECTION).where("email", "==", email).limit(1)
-    docs = users_ref.stream()
+    with metrics.span("firestore", "get_user_by_email"):
+        docs = list(users_ref.stream())
     for doc in docs:
-        user_data = doc.to_dict()
+        user_data = _profile(doc.to_dict())
+        _cache_profile(doc.id, user_data)
         user_data["id"] = doc.id
         return user_data
     return None
@@ -24,7 +128,24 @@ def authenticate_user(email: str, password: str):
         return False
     return user
 
+async def authenticate_user_async(email: str, password: str):
+    """
+    Async authenticate_user: verifies on the password process pool and
+    transparently rehashes passwords stored with outdated Argon2 parameters.
+    """
+    user = await asyncio.to_thread(get_user_by_email, email)
+    if not user:
+        return False
+    valid, new_hash = await verify_and_update_password_async(password, user["hashed_password"])
+    if not valid:
+        return False
+    if new_hash:
+        await asyncio.to_thread(update_user, user["id"], {"hashed_password": new_hash})
+        user["hashed_password"] = new_hash
+    return user
+
 def create_user(user_data) -> str:
+    from google.cloud import firestore as google_firestore
     db = get_db()
     
     # Check if this is a dict or UserCreate model
@@ -37,19 +158,32 @@ def create_user(user_data) -> str:
     if "password" in data:
         data["hashed_password"] = get_password_hash(data.pop("password"))
     
-    update_time, user_ref = db.collection(USER_COLLECTION).add(data)
+    data["updated_at"] = google_firestore.SERVER_TIMESTAMP
+    with metrics.span("firestore", "create_user"):
+        update_time, user_ref = db.collection(USER_COLLECTION).add(data)
+    invalidate_user(user_ref.id)
     return user_ref.id
 
 def get_user(user_id: str) -> dict:
+    cached = _cached_profile(user_id)
+    if cached is not None:
+        return cached
+
     db = get_db()
     doc_ref = db.collection(USER_COLLECTION).document(user_id)
-    doc = doc_ref.get()
+    with metrics.span("firestore", "get_user"):
+        doc = doc_ref.get()
     if doc.exists:
-        return doc.to_dict()
+        user_data = _profile(doc.to_dict())
+        _cache_profile(user_id, user_data)
+        return user_data
     return None
 
 def update_user(user_id: str, user_data: dict) -> bool:
+    from google.cloud import firestore as google_firestore
     db = get_db()
     doc_ref = db.collection(USER_COLLECTION).document(user_id)
-    doc_ref.set(user_data, merge=True)
+    with metrics.span("firestore", "update_user"):
+        doc_ref.set({**user_data, "updated_at": google_firestore.SERVER_TIMESTAMP}, merge=True)
+    invalidate_user(user_id)
     return True
@@ -0,0 +1,129 @@
+"""
+Cold-start benchmark: in fresh interpreter processes, times `import app.main`,
+the app's startup (lifespan) and the first GET /, and lists which heavy
+client libraries got imported along the way. Also prints the slowest
+imports from `python -X importtime`. Results are saved to
+benchmarks/results/cold-start-<commit>.json; pass --compare with an
+earlier file to see the change.
+
+Usage: python -m benchmarks.bench_cold_start [--runs 5] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+from benchmarks.bench_e2e import RESULTS_DIR, git_commit
+
+# Libraries that should only load when Firestore / Gemini are first used
+HEAVY_MODULES = ("google.genai", "google.cloud.firestore", "firebase_admin", "numpy")
+
+CHILD = """
+import asyncio, json, sys, time
+started = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+
+async def first_request():
+    import httpx
+    async with app.main.app.router.lifespan_context(app.main.app):
+        ready = time.perf_counter()
+        transport = httpx.ASGITransport(app=app.main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+            response = await client.get("/")
+        return ready, time.perf_counter(), response.status_code
+
+ready, answered, status = asyncio.run(first_request())
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "startup_ms": (ready - imported) * 1000,
+    "first_request_ms": (answered - ready) * 1000,
+    "total_ms": (answered - started) * 1000,
+    "status": status,
+    "loaded": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    # Nothing in the background should reach real services
+    env.update({"WARMUP": "false", "PLAN_JOB_RESUME": "false", "USER_CACHE_LISTENER": "false"})
+    env.setdefault("GEMINI_API_KEY", "benchmark")
+    return env
+
+
+def run_once() -> dict:
+    output = subprocess.run([sys.executable, "-c", CHILD], capture_output=True, text=True, check=True, env=child_env())
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(top: int) -> list[tuple[str, float]]:
+    """Third-party packages by cumulative import time, from -X importtime."""
+    output = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"],
+                            capture_output=True, text=True, check=True, env=child_env())
+    packages = {}
+    for line in output.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        package = parts[2].strip().split(".")[0]
+        if package not in ("app", "site"):
+            packages[package] = max(packages.get(package, 0), int(parts[1]) / 1000)
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    fields = ("import_ms", "startup_ms", "first_request_ms", "total_ms")
+    medians = {field: round(statistics.median(run[field] for run in runs), 1) for field in fields}
+    commit, dirty = git_commit()
+    result = {
+        "benchmark": "cold-start",
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "runs": args.runs,
+        "median": medians,
+        "loaded_at_startup": runs[-1]["loaded"],
+        "slowest_imports_ms": dict(slowest_imports(args.top)),
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"baseline: {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''}")
+    print(f"commit {commit}{' (dirty)' if dirty else ''}: median of {args.runs} fresh processes")
+    for field in fields:
+        line = f"  {field:<17} {medians[field]:>8.1f}"
+        if baseline and baseline["median"].get(field):
+            before = baseline["median"][field]
+            line += f"   vs baseline {before:.1f} ({100 * (medians[field] - before) / before:+.0f}%)"
+        print(line)
+    print(f"  heavy modules loaded by startup: {', '.join(result['loaded_at_startup']) or 'none'}")
+    print("slowest imports (cumulative ms):")
+    for name, ms in result["slowest_imports_ms"].items():
+        print(f"  {name:<40} {ms:>8.1f}")
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"cold-start-{commit}{'-dirty' if dirty else ''}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
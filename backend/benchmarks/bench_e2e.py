@@ -0,0 +1,195 @@
+"""
+End-to-end load test of the API with an in-memory Firestore and a fake
+Gemini (see benchmarks.fakes). Virtual users run register -> login ->
+generate -> latest -> chat against the app in-process, --concurrency at a
+time. Prints p50/p95/p99 latency and req/s per endpoint and saves the run
+to benchmarks/results/e2e-<commit>.json; pass --compare with an earlier
+result file to see the change.
+
+Usage: python -m benchmarks.bench_e2e [--users 100] [--concurrency 20]
+           [--ai-latency-ms 800] [--ai-sigma 0.4] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+from app.core.config import settings
+from benchmarks import fakes
+
+ENDPOINTS = ("register", "login", "generate", "latest", "chat")
+CHAT_MESSAGES = ("cambia la cena", "¿Qué alimentos tienen más proteína?")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def call(self, name: str, request):
+        started = time.perf_counter()
+        try:
+            response = await request
+            ok = response.status_code < 400
+        except Exception as e:
+            print(f"{name} failed: {e}")
+            response, ok = None, False
+        self.latencies[name].append(time.perf_counter() - started)
+        if not ok:
+            self.errors[name] += 1
+        return response if ok else None
+
+
+async def user_flow(client: httpx.AsyncClient, recorder: Recorder, n: int, chats: int):
+    email = f"bench-{n}-{time.time_ns()}@test.com"
+    payload = {
+        "email": email, "password": "benchmark-password", "name": f"Bench {n}",
+        "age": 20 + n % 40, "weight": 55.0 + n % 45, "height": 160.0 + n % 30,
+        "gender": "Male" if n % 2 else "Female", "goal": "Lose Weight",
+        "activity_level": "Moderately Active", "country": "Peru", "region": "Lima",
+    }
+    if not await recorder.call("register", client.post("/api/v1/auth/register", json=payload)):
+        return
+    login = await recorder.call("login", client.post(
+        "/api/v1/auth/login", data={"username": email, "password": "benchmark-password"}
+    ))
+    if not login:
+        return
+    headers = {"Authorization": f"Bearer {login.json()['access_token']}"}
+
+    await recorder.call("generate", client.post("/api/v1/plans/generate", headers=headers))
+    await recorder.call("latest", client.get("/api/v1/plans/latest", headers=headers))
+    for i in range(chats):
+        message = CHAT_MESSAGES[i % len(CHAT_MESSAGES)]
+        await recorder.call("chat", client.post("/api/v1/chat/", json={"message": message}, headers=headers))
+
+
+async def run(args) -> tuple[Recorder, float]:
+    from app.main import app
+
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async def limited(n):
+        async with semaphore:
+            await user_flow(client, recorder, n, args.chats)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(n) for n in range(args.users)))
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    endpoints = {}
+    for name in ENDPOINTS:
+        samples = np.array(recorder.latencies.get(name, []), dtype=np.float64) * 1000
+        if samples.size == 0:
+            continue
+        p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+        endpoints[name] = {
+            "count": int(samples.size),
+            "errors": recorder.errors.get(name, 0),
+            "p50_ms": round(float(p50), 2),
+            "p95_ms": round(float(p95), 2),
+            "p99_ms": round(float(p99), 2),
+            "rps": round(samples.size / elapsed, 2),
+        }
+    return endpoints
+
+
+def git_commit() -> tuple[str, bool]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--", "."], capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+
+
+def print_table(endpoints: dict, baseline: dict | None = None):
+    print(f"{'endpoint':<10} {'n':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}")
+    for name, stats in endpoints.items():
+        line = (f"{name:<10} {stats['count']:>6} {stats['errors']:>5} {stats['p50_ms']:>9.1f} "
+                f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['rps']:>8.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            deltas = [
+                f"{field[:3]} {100 * (stats[field] - before[field]) / before[field]:+.0f}%"
+                for field in ("p50_ms", "p95_ms", "p99_ms", "rps") if before[field]
+            ]
+            line += "   vs baseline: " + ", ".join(deltas)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--chats", type=int, default=2, help="chat messages per user")
+    parser.add_argument("--ai-latency-ms", type=float, default=800, help="median fake Gemini latency")
+    parser.add_argument("--ai-sigma", type=float, default=0.4, help="log-normal sigma of the latency")
+    parser.add_argument("--ai-error-rate", type=float, default=0.0)
+    parser.add_argument("--plan-cache", action="store_true", help="keep the plan cache on (off by default)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--compare", help="earlier result JSON to compare against")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    # The fake store has no transactions, so cross-worker leases and the
+    # stored chat memory stay off; the in-process paths are what this measures.
+    settings.PLAN_CACHE_ENABLED = args.plan_cache
+    settings.PLAN_CACHE_FIRESTORE = False
+    settings.PLAN_COALESCE_FIRESTORE = False
+    settings.CHAT_MEMORY_FIRESTORE = False
+    db = fakes.FakeFirestore()
+    gemini = fakes.FakeGemini(args.ai_latency_ms, args.ai_sigma, args.ai_error_rate, seed=args.seed)
+    fakes.install(db, gemini)
+
+    recorder, elapsed = asyncio.run(run(args))
+    from app.core.security import shutdown_password_pool
+    shutdown_password_pool()
+
+    endpoints = summarize(recorder, elapsed)
+    commit, dirty = git_commit()
+    result = {
+        "benchmark": "e2e",
+        "commit": commit,
+        "dirty": dirty,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("compare", "no_save")},
+        "elapsed_seconds": round(elapsed, 3),
+        "gemini_calls": gemini.calls,
+        "firestore": {"reads": db.reads, "writes": db.writes},
+        "endpoints": endpoints,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"baseline: {baseline['commit']}{' (dirty)' if baseline.get('dirty') else ''}")
+    print(f"commit {commit}{' (dirty)' if dirty else ''}: {args.users} users, concurrency {args.concurrency}, "
+          f"{elapsed:.1f}s, {gemini.calls} Gemini calls, {db.reads} reads / {db.writes} writes")
+    print_table(endpoints, baseline["endpoints"] if baseline else None)
+
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"e2e-{commit}{'-dirty' if dirty else ''}.json")
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
+        print(f"saved {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Measures Argon2 login throughput (password verifications per second) with
+the current ARGON2_* settings: inline on one core, and through the password
+process pool at PASSWORD_HASH_WORKERS.
+
+Usage: python -m benchmarks.bench_password_hashing [--logins 200]
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from app.core import security
+from app.core.config import settings
+
+
+def bench_inline(hashed: str, logins: int) -> float:
+    started = time.perf_counter()
+    for _ in range(logins):
+        security.verify_password("benchmark-password", hashed)
+    return logins / (time.perf_counter() - started)
+
+
+async def bench_pool(hashed: str, logins: int) -> float:
+    # Warm the pool so process spawn time isn't counted
+    await asyncio.gather(*(
+        security.verify_and_update_password_async("benchmark-password", hashed)
+        for _ in range(settings.PASSWORD_HASH_WORKERS)
+    ))
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        security.verify_and_update_password_async("benchmark-password", hashed)
+        for _ in range(logins)
+    ))
+    return logins / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    hashed = security.get_password_hash("benchmark-password")
+    workers = max(1, settings.PASSWORD_HASH_WORKERS)
+    print(
+        f"argon2 t={settings.ARGON2_TIME_COST} m={settings.ARGON2_MEMORY_COST}KiB "
+        f"p={settings.ARGON2_PARALLELISM}, {os.cpu_count()} CPUs"
+    )
+
+    inline = bench_inline(hashed, max(1, args.logins // 4))
+    print(f"inline:           {inline:8.1f} logins/s (1 core)")
+
+    pooled = asyncio.run(bench_pool(hashed, args.logins))
+    security.shutdown_password_pool()
+    print(f"pool ({workers} workers): {pooled:8.1f} logins/s, {pooled / workers:8.1f} logins/s per core")
+
+
+if __name__ == "__main__":
+    main()
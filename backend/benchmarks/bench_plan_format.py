@@ -0,0 +1,137 @@
+"""
+Compares the output size of a weekly plan in the old verbose JSON format
+(keys spelled out in the prompt) and in the compact response_schema format
+(ai_plan.MEAL_KEYS), and the generation time that saves.
+
+Offline (default) it serializes the same canned week both ways and
+estimates tokens (~4 characters per token, or the exact count when
+sentencepiece is installed for genai's LocalTokenizer); the time saved is
+tokens / --tokens-per-second. With --live it calls Gemini --runs times per
+format (GEMINI_API_KEY required) and reports the median output tokens from
+usage_metadata and the median latency.
+
+Usage: python -m benchmarks.bench_plan_format [--tokens-per-second 180]
+           [--live --runs 3]
+"""
+import argparse
+import json
+import statistics
+import time
+
+from google.genai import types
+
+from app.models.user import UserBase
+from app.services import ai_client, ai_plan
+from benchmarks import fakes
+
+# SYSTEM_PROMPT as it was before the compact format, for the --live baseline
+VERBOSE_SYSTEM_PROMPT = """
+Eres un Nutricionista Experto de Fitia. Tu tarea es generar un plan de comidas semanal PERSONALIZADO y REGIONAL.
+Utiliza los datos del usuario (País, Región, Objetivo, Calorías) para sugerir platos típicos o disponibles en su zona.
+
+IMPORTANTE:
+1. Retorna SOLAMENTE JSON válido.
+2. No incluyas markdown (```json ... ```).
+3. El idioma debe ser ESPAÑOL.
+4. Estructura del JSON:
+{
+  "plan": [
+    {
+      "day": "Lunes",
+      "total_calories": 2000,
+      "meals": [
+        {
+          "meal_type": "Breakfast" | "Lunch" | "Dinner" | "Snack",
+          "name": "Nombre creativo del plato",
+          "calories": 500,
+          "protein": 30,
+          "carbs": 40,
+          "fats": 20,
+          "ingredients": ["Ingrediente 1", "Ingrediente 2"],
+          "prepTime": "15 min"
+        }
+      ]
+    }
+  ]
+}
+"""
+
+USER = UserBase(email="bench@test.com", gender="Female", age=30, weight=62, height=165,
+                country="Peru", region="Lima", goal="Lose Weight")
+
+
+def token_counter():
+    """Returns (count_tokens(text), description)."""
+    try:
+        from google.genai.local_tokenizer import LocalTokenizer
+        tokenizer = LocalTokenizer(model_name="gemini-2.0-flash")
+        tokenizer.count_tokens("warmup")
+        return (lambda text: tokenizer.count_tokens(text).total_tokens), "LocalTokenizer"
+    except Exception:
+        return (lambda text: round(len(text) / 4)), "estimate, ~4 chars/token"
+
+
+def offline(args):
+    count, method = token_counter()
+    plan = fakes.canned_plan()
+    outputs = {
+        # The model writes indented JSON in JSON mode; compare like for like
+        "verbose": json.dumps(plan, ensure_ascii=False, indent=2),
+        "compact": json.dumps(fakes.compact_plan(plan), ensure_ascii=False, indent=2),
+    }
+    tokens = {name: count(text) for name, text in outputs.items()}
+
+    print(f"output tokens for one week ({method}), {args.tokens_per_second:.0f} tokens/s")
+    print(f"{'format':<8} {'chars':>7} {'tokens':>7} {'gen s':>7}")
+    for name, text in outputs.items():
+        print(f"{name:<8} {len(text):>7} {tokens[name]:>7} {tokens[name] / args.tokens_per_second:>7.1f}")
+    saved = tokens["verbose"] - tokens["compact"]
+    print(f"saved: {saved} tokens ({100 * saved / tokens['verbose']:.0f}%), "
+          f"~{saved / args.tokens_per_second:.1f}s per plan")
+
+
+def live_call(kwargs: dict) -> tuple[int, float]:
+    started = time.perf_counter()
+    response = ai_client.get_client().models.generate_content(**kwargs)
+    elapsed = time.perf_counter() - started
+    return response.usage_metadata.candidates_token_count, elapsed
+
+
+def live(args):
+    prompt = ai_plan._build_prompt(USER, 1800)
+    requests = {
+        "verbose": {
+            "model": "gemini-2.0-flash",
+            "contents": f"{VERBOSE_SYSTEM_PROMPT}\n\nUSER REQUEST:\n{prompt}\n\nRESPONSE (JSON):",
+            "config": types.GenerateContentConfig(response_mime_type="application/json"),
+        },
+        "compact": ai_plan._request_kwargs(prompt, len(USER.meals_per_day)),
+    }
+    results = {}
+    for name, kwargs in requests.items():
+        samples = [live_call(kwargs) for _ in range(args.runs)]
+        results[name] = (statistics.median(s[0] for s in samples), statistics.median(s[1] for s in samples))
+
+    print(f"median of {args.runs} live Gemini calls per format")
+    print(f"{'format':<8} {'tokens':>7} {'latency s':>10}")
+    for name, (tokens, latency) in results.items():
+        print(f"{name:<8} {tokens:>7.0f} {latency:>10.2f}")
+    (verbose_tokens, verbose_latency), (compact_tokens, compact_latency) = results["verbose"], results["compact"]
+    print(f"saved: {verbose_tokens - compact_tokens:.0f} tokens ({100 * (1 - compact_tokens / verbose_tokens):.0f}%), "
+          f"{verbose_latency - compact_latency:.2f}s ({100 * (1 - compact_latency / verbose_latency):.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens-per-second", type=float, default=180, help="output speed for the offline estimate")
+    parser.add_argument("--live", action="store_true", help="call Gemini instead of estimating")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    if args.live:
+        live(args)
+    else:
+        offline(args)
+
+
+if __name__ == "__main__":
+    main()
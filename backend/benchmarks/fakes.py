@@ -0,0 +1,417 @@
+"""
+In-memory stand-ins for Firestore and Gemini, so the backend can be driven
+end to end without the emulator or an API key.
+
+FakeFirestore covers the client surface the services use: collection /
+collection_group / document / add / get / set (merge) / update / delete,
+where / order_by / limit / select / stream, and batches. Transactions and
+snapshot listeners are not emulated. FakeGemini answers plan, day, chat and
+summary prompts with canned replies after a log-normally distributed delay,
+and keeps context caches in memory. FakeImageUpstream stands in for the
+meal image generator.
+"""
+import asyncio
+import copy
+import itertools
+import json
+import random
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from google.cloud import firestore as google_firestore
+
+
+# ---------------------------------------------------------------------------
+# Firestore
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(x in a for x in b),
+}
+
+
+def _resolve_sentinels(data: dict) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        key: now if value is google_firestore.SERVER_TIMESTAMP else copy.deepcopy(value)
+        for key, value in data.items()
+    }
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data, create_time=None, update_time=None):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+        self.create_time = create_time
+        self.update_time = update_time
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class FakeDocumentReference:
+    def __init__(self, db, path: tuple):
+        self._db = db
+        self._path = path
+        self.id = path[-1]
+
+    @property
+    def path(self) -> str:
+        return "/".join(self._path)
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self._db, self._path + (name,))
+
+    def get(self, transaction=None):
+        return self._db._snapshot(self._path)
+
+    def set(self, data: dict, merge: bool = False):
+        self._db._write(self._path, data, merge=merge)
+
+    def update(self, fields: dict):
+        self._db._update(self._path, fields)
+
+    def delete(self):
+        self._db._delete(self._path)
+
+
+class FakeQuery:
+    def __init__(self, db, matcher, filters=(), orders=(), limit=None):
+        self._db = db
+        self._matcher = matcher  # collection path -> bool
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+
+    def _copy(self, **changes):
+        fields = {"filters": self._filters, "orders": self._orders, "limit": self._limit, **changes}
+        return FakeQuery(self._db, self._matcher, **fields)
+
+    def where(self, field_path=None, op_string=None, value=None, filter=None):
+        if filter is not None:
+            field_path, op_string, value = filter.field_path, filter.op_string, filter.value
+        return self._copy(filters=self._filters + ((field_path, _OPERATORS[op_string], value),))
+
+    def order_by(self, field_path, direction=google_firestore.Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field_path, direction == google_firestore.Query.DESCENDING),))
+
+    def limit(self, count: int):
+        return self._copy(limit=count)
+
+    def select(self, field_paths):
+        return self
+
+    def stream(self, transaction=None):
+        docs = [
+            (path, data) for path, data in self._db._documents()
+            if self._matcher(path[:-1])
+            and all(op(data.get(field), value) for field, op, value in self._filters)
+        ]
+        for field, descending in reversed(self._orders):
+            docs = [doc for doc in docs if doc[1].get(field) is not None]
+            docs.sort(key=lambda doc: doc[1][field], reverse=descending)
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        for path, _ in docs:
+            yield self._db._snapshot(path)
+
+    def get(self, transaction=None):
+        return list(self.stream())
+
+    def on_snapshot(self, callback):
+        raise NotImplementedError("FakeFirestore does not support listeners")
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, db, path: tuple):
+        super().__init__(db, lambda collection: collection == path)
+        self._path = path
+        self.id = path[-1]
+
+    def document(self, document_id: str | None = None):
+        return FakeDocumentReference(self._db, self._path + (document_id or uuid.uuid4().hex[:20],))
+
+    def add(self, data: dict, document_id: str | None = None):
+        ref = self.document(document_id)
+        ref.set(data)
+        return self._db._documents_meta[ref._path][1], ref
+
+
+class FakeWriteBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference, data, merge=False):
+        self._writes.append(lambda: reference.set(data, merge=merge))
+
+    def update(self, reference, fields):
+        self._writes.append(lambda: reference.update(fields))
+
+    def delete(self, reference):
+        self._writes.append(reference.delete)
+
+    def commit(self):
+        # Applied under the store lock, so readers never see half a batch
+        with self._db._lock:
+            for write in self._writes:
+                write()
+        self._writes = []
+
+
+class FakeFirestore:
+    """Thread-safe, path-keyed document store with the Firestore client API."""
+
+    def __init__(self):
+        self._docs = {}
+        self._documents_meta = {}  # path -> (create_time, update_time)
+        self._lock = threading.RLock()
+        self.reads = 0
+        self.writes = 0
+
+    def collection(self, name: str):
+        return FakeCollectionReference(self, (name,))
+
+    def collection_group(self, name: str):
+        return FakeQuery(self, lambda collection: collection[-1] == name)
+
+    def document(self, path: str):
+        return FakeDocumentReference(self, tuple(path.split("/")))
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def transaction(self, **kwargs):
+        raise NotImplementedError("FakeFirestore does not support transactions")
+
+    def close(self):
+        pass
+
+    def _documents(self):
+        with self._lock:
+            return list(self._docs.items())
+
+    def _snapshot(self, path):
+        with self._lock:
+            self.reads += 1
+            data = self._docs.get(path)
+            created, updated = self._documents_meta.get(path, (None, None))
+            return FakeSnapshot(FakeDocumentReference(self, path), copy.deepcopy(data), created, updated)
+
+    def _write(self, path, data, merge=False):
+        data = _resolve_sentinels(data)
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            self.writes += 1
+            current = self._docs.get(path)
+            self._docs[path] = {**current, **data} if merge and current is not None else data
+            created = self._documents_meta.get(path, (now, now))[0]
+            self._documents_meta[path] = (created, now)
+
+    def _update(self, path, fields):
+        with self._lock:
+            if path not in self._docs:
+                raise KeyError(f"No document to update: {'/'.join(path)}")
+            self._write(path, fields, merge=True)
+
+    def _delete(self, path):
+        with self._lock:
+            self.writes += 1
+            self._docs.pop(path, None)
+            self._documents_meta.pop(path, None)
+
+
+# ---------------------------------------------------------------------------
+# Gemini
+
+DISHES = {
+    "Breakfast": [
+        ("Avena con plátano y canela", ["Avena", "Plátano", "Canela"], 420, 14, 70, 9),
+        ("Huevos revueltos con espinaca", ["Huevo", "Espinaca", "Pan integral"], 380, 24, 28, 18),
+        ("Yogur con granola y fresas", ["Yogur", "Granola", "Fresas"], 360, 16, 50, 10),
+        ("Tostadas de palta", ["Pan integral", "Palta", "Tomate"], 400, 11, 42, 20),
+    ],
+    "Lunch": [
+        ("Pollo a la plancha con arroz", ["Pollo", "Arroz", "Ensalada"], 640, 45, 70, 15),
+        ("Lomo saltado", ["Res", "Papas", "Cebolla", "Tomate"], 700, 40, 65, 28),
+        ("Quinoa con verduras salteadas", ["Quinoa", "Brócoli", "Zanahoria"], 560, 20, 85, 14),
+        ("Ceviche de pescado", ["Pescado", "Limón", "Camote"], 520, 42, 50, 10),
+    ],
+    "Dinner": [
+        ("Salmón al horno con camote", ["Salmón", "Camote", "Espárragos"], 600, 38, 45, 26),
+        ("Ensalada de atún", ["Atún", "Lechuga", "Huevo", "Aceite de oliva"], 480, 35, 20, 26),
+        ("Tacos de pavo", ["Pavo", "Tortilla", "Lechuga"], 550, 36, 48, 20),
+        ("Sopa de lentejas", ["Lentejas", "Zanahoria", "Apio"], 450, 24, 65, 8),
+    ],
+    "Snack": [
+        ("Manzana con mantequilla de maní", ["Manzana", "Mantequilla de maní"], 220, 6, 26, 11),
+        ("Mix de frutos secos", ["Almendras", "Nueces", "Pasas"], 240, 7, 16, 17),
+    ],
+}
+
+CHAT_RESPONSE = {
+    "intent": "QUESTION",
+    "entities": None,
+    "message": "Una alimentación balanceada incluye proteínas, carbohidratos complejos y grasas saludables.",
+}
+
+
+def canned_day(day: str, index: int, meal_types=("Breakfast", "Lunch", "Dinner")) -> dict:
+    meals = []
+    for meal_type in meal_types:
+        name, ingredients, calories, protein, carbs, fats = DISHES[meal_type][index % len(DISHES[meal_type])]
+        meals.append({
+            "meal_type": meal_type, "name": f"{name} ({day})", "calories": calories,
+            "protein": protein, "carbs": carbs, "fats": fats,
+            "ingredients": ingredients, "prepTime": "20 min",
+        })
+    return {"day": day, "total_calories": sum(meal["calories"] for meal in meals), "meals": meals}
+
+
+def canned_plan() -> dict:
+    from app.services.ai_plan import WEEK_DAYS
+    return {"plan": [canned_day(day, i) for i, day in enumerate(WEEK_DAYS)]}
+
+
+def compact_day(day: dict) -> dict:
+    """Plan-shape day -> the compact wire format Gemini is asked for (see ai_plan.MEAL_KEYS)."""
+    from app.services.ai_plan import MEAL_KEYS
+    meals = []
+    for meal in day["meals"]:
+        compact = {short: meal[key] for short, key in MEAL_KEYS.items()}
+        compact["r"] = int(str(meal["prepTime"]).split()[0])
+        meals.append(compact)
+    return {"m": meals}
+
+
+def compact_plan(plan: dict) -> dict:
+    return {"d": [compact_day(day) for day in plan["plan"]]}
+
+
+class FakeGemini:
+    """
+    genai.Client stand-in (models / aio.models) returning canned JSON.
+    Latency is log-normal with the given median and sigma; error_rate makes
+    that fraction of calls fail with a 503.
+    """
+
+    def __init__(self, latency_ms: float = 800, sigma: float = 0.4, error_rate: float = 0.0,
+                 stream_chunks: int = 20, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._days = itertools.count()
+        self.calls = 0
+        self.models = SimpleNamespace(generate_content=self._generate_sync)
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(
+                generate_content=self._generate_async,
+                generate_content_stream=self._generate_stream,
+            ),
+            caches=SimpleNamespace(create=self._create_cache),
+        )
+        # Stand-in for Gemini context caching: name -> system instruction
+        self.cached_contents = {}
+
+    def _latency(self) -> float:
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.error_rate:
+                from google.genai import errors
+                raise errors.ServerError(503, {"error": {"code": 503, "message": "FakeGemini: injected failure",
+                                                         "status": "UNAVAILABLE"}})
+            return self._random.lognormvariate(0, self.sigma) * self.latency_ms / 1000
+
+    async def _create_cache(self, model=None, config=None):
+        await asyncio.sleep(self._latency())
+        with self._lock:
+            name = f"cachedContents/fake-{len(self.cached_contents)}"
+            self.cached_contents[name] = config.system_instruction
+        return SimpleNamespace(name=name, model=model)
+
+    def _respond(self, contents: str) -> str:
+        from app.services import ai_chat, ai_plan
+        if contents.startswith(ai_chat.SUMMARY_PROMPT.split("{")[0]):
+            return "El usuario conversa sobre su plan de comidas."
+        if contents.startswith(ai_plan.DAY_SYSTEM_PROMPT):
+            day = canned_day("Lunes", next(self._days))
+            return json.dumps(compact_day(day), ensure_ascii=False)
+        if contents.startswith(ai_plan.SYSTEM_PROMPT):
+            return json.dumps(compact_plan(canned_plan()), ensure_ascii=False)
+        return json.dumps(CHAT_RESPONSE, ensure_ascii=False)
+
+    def _generate_sync(self, model=None, contents="", config=None, **kwargs):
+        time.sleep(self._latency())
+        return SimpleNamespace(text=self._respond(contents))
+
+    async def _generate_async(self, model=None, contents="", config=None, **kwargs):
+        await asyncio.sleep(self._latency())
+        return SimpleNamespace(text=self._respond(contents))
+
+    async def _generate_stream(self, model=None, contents="", config=None, **kwargs):
+        latency = self._latency()
+        text = self._respond(contents)
+        size = max(1, len(text) // self.stream_chunks)
+
+        async def chunks():
+            for start in range(0, len(text), size):
+                await asyncio.sleep(latency / self.stream_chunks)
+                yield SimpleNamespace(text=text[start:start + size])
+
+        return chunks()
+
+
+class FakeImageUpstream:
+    """
+    Image generator stand-in for image_proxy: a small fixed JPEG-typed body
+    per dish after `latency_ms`. Counts fetches per dish name.
+    """
+
+    def __init__(self, latency_ms: float = 0, size: int = 2048):
+        self.latency_ms = latency_ms
+        self.size = size
+        self.fetches = {}
+
+    async def fetch(self, recipe_name: str) -> tuple[bytes, str]:
+        self.fetches[recipe_name] = self.fetches.get(recipe_name, 0) + 1
+        await asyncio.sleep(self.latency_ms / 1000)
+        body = recipe_name.encode("utf-8")
+        return b"\xff\xd8\xff" + (body * (self.size // max(1, len(body)) + 1))[:self.size], "image/jpeg"
+
+
+# ---------------------------------------------------------------------------
+
+def install(db: FakeFirestore, gemini: FakeGemini, images: FakeImageUpstream | None = None):
+    """Points every get_db()/Gemini client/image upstream the app uses at the fakes."""
+    from app.core.config import settings
+    from app.db import firebase
+    from app.services import ai_client, image_proxy, plan_service, user_service
+
+    for module in (firebase, plan_service, user_service):
+        module.get_db = lambda: db
+    ai_client.set_client(gemini)
+    image_proxy.set_upstream(images or FakeImageUpstream())
+    # Fake images never land in the real image cache
+    settings.IMAGE_CACHE_DIR = tempfile.mkdtemp(prefix="fitia-bench-images-")
+    settings.PUBLIC_BASE_URL = settings.PUBLIC_BASE_URL or "http://bench.local"
+    image_proxy.reset()
@@ -0,0 +1,57 @@
+"""
+Backfills the indexed "latest plan" lookup for plans saved before it existed:
+sets `created_at` on every meal plan that lacks it (from the document's
+create time) and points each user's `latest_plan_id` at their newest plan.
+
+Usage: python migrate_latest_plan.py [--dry-run]
+"""
+import sys
+
+from app.db.firebase import get_db
+from app.services.plan_service import USER_COLLECTION, PLAN_COLLECTION
+
+BATCH_LIMIT = 450  # Firestore allows 500 writes per batch
+
+
+def migrate(dry_run: bool = False):
+    db = get_db()
+    batch = db.batch()
+    pending = 0
+    users = plans_stamped = pointers_set = 0
+
+    def flush():
+        nonlocal batch, pending
+        if pending and not dry_run:
+            batch.commit()
+        batch = db.batch()
+        pending = 0
+
+    for user_doc in db.collection(USER_COLLECTION).stream():
+        users += 1
+        latest_id, latest_time = None, None
+        for plan_doc in user_doc.reference.collection(PLAN_COLLECTION).stream():
+            created_at = (plan_doc.to_dict() or {}).get("created_at")
+            if created_at is None:
+                created_at = plan_doc.create_time
+                batch.update(plan_doc.reference, {"created_at": created_at})
+                pending += 1
+                plans_stamped += 1
+            if latest_time is None or created_at > latest_time:
+                latest_id, latest_time = plan_doc.id, created_at
+            if pending >= BATCH_LIMIT:
+                flush()
+
+        if latest_id and (user_doc.to_dict() or {}).get("latest_plan_id") != latest_id:
+            batch.set(user_doc.reference, {"latest_plan_id": latest_id}, merge=True)
+            pending += 1
+            pointers_set += 1
+            if pending >= BATCH_LIMIT:
+                flush()
+
+    flush()
+    prefix = "[dry run] " if dry_run else ""
+    print(f"{prefix}Scanned {users} users: stamped {plans_stamped} plans, set {pointers_set} latest_plan_id pointers.")
+
+
+if __name__ == "__main__":
+    migrate(dry_run="--dry-run" in sys.argv)
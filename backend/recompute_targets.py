@@ -0,0 +1,36 @@
+"""
+Recomputes BMR/TDEE/target calories for every user with the vectorized
+nutrition engine and stores them in users/{id}.nutrition_targets.
+Run after changing formulas or multipliers in nutrition_engine.
+
+Usage: python recompute_targets.py [--dry-run]
+"""
+import sys
+import time
+
+from app.services import nutrition_batch
+
+
+def recompute(dry_run: bool = False):
+    started = time.perf_counter()
+    user_ids, columns = nutrition_batch.read_user_columns()
+    read_at = time.perf_counter()
+
+    targets = nutrition_batch.calculate_targets_batch(
+        columns["weight"], columns["height"], columns["age"],
+        columns["gender"], columns["activity_level"], columns["goal"],
+    )
+    computed_at = time.perf_counter()
+
+    written = 0 if dry_run else nutrition_batch.write_user_targets(user_ids, targets)
+    done_at = time.perf_counter()
+
+    prefix = "[dry run] " if dry_run else ""
+    print(
+        f"{prefix}{len(user_ids)} users: read {read_at - started:.2f}s, "
+        f"computed {computed_at - read_at:.4f}s, wrote {written} in {done_at - computed_at:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    recompute(dry_run="--dry-run" in sys.argv)
@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+# The shared genai client is built on first use. Unit tests replace it or
+# never reach it, but a key lets it construct if one does.
+os.environ.setdefault("GEMINI_API_KEY", "test-key")
+
+from app.core.config import settings  # noqa: E402
+from app.services import ai_client, answer_cache  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_ai_state(monkeypatch):
+    # The breaker, retry budget and answer cache are process-wide; start
+    # each test clean and without backoff sleeps
+    monkeypatch.setattr(settings, "AI_RETRY_BASE_DELAY_SECONDS", 0)
+    # Generated plans would otherwise prefetch their images from the network
+    monkeypatch.setattr(settings, "IMAGE_PREFETCH", False)
+    ai_client.reset()
+    answer_cache.clear()
@@ -0,0 +1,44 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.services import ai_chat, ai_client
+
+
+class FakeAsyncModels:
+    def __init__(self, text, delay=0.01):
+        self.text = text
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_content(self, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return SimpleNamespace(text=self.text)
+
+
+def fake_client(models):
+    return SimpleNamespace(aio=SimpleNamespace(models=models))
+
+
+def test_concurrency_limit(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 2)
+    models = FakeAsyncModels("{}")
+    client = fake_client(models)
+
+    async def run():
+        await asyncio.gather(*(ai_client.generate_content(client, model="m") for _ in range(6)))
+
+    asyncio.run(run())
+    assert models.max_in_flight == 2
+
+
+def test_chat_uses_async_client(monkeypatch):
+    payload = {"intent": "QUESTION", "entities": None, "message": "Hola"}
+    monkeypatch.setattr(ai_client, "_client", fake_client(FakeAsyncModels(json.dumps(payload))))
+
+    assert asyncio.run(ai_chat.process_user_message_async("hola")) == payload
@@ -26,8 +26,12 @@ def test_full_ai_flow():
     user_id = resp.json()["id"]
     print("[PASS] User Registered (Custom Mode)")
 
+    resp = client.post("/api/v1/auth/login", data={"username": email, "password": "password123"})
+    assert resp.status_code == 200
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
     # 2. Generate Plan (Custom Mode -> Should be fast/empty-ish)
-    resp = client.post(f"/api/v1/plans/generate?user_id={user_id}")
+    resp = client.post(f"/api/v1/plans/generate?user_id={user_id}", headers=headers)
     assert resp.status_code == 200
     data = resp.json()
     # Check if we got the basic tracker template (empty meals or specific structure)
@@ -39,13 +43,13 @@ def test_full_ai_flow():
 
     # 3. Update User to AUTOMATIC Mode
     update_payload = {"planning_mode": "Automatic"}
-    resp = client.put(f"/api/v1/users/{user_id}", json=update_payload)
+    resp = client.put(f"/api/v1/users/{user_id}", json=update_payload, headers=headers)
     assert resp.status_code == 200
     print("[PASS] User Updated to Automatic Mode")
 
     # 4. Generate AI Plan (Real AI Call)
     print("[WAIT] Generating AI Plan (consulting Gemini)...")
-    resp = client.post(f"/api/v1/plans/generate?user_id={user_id}")
+    resp = client.post(f"/api/v1/plans/generate?user_id={user_id}", headers=headers)
     if resp.status_code != 200:
         print(f"AI Gen Failed: {resp.text}")
     assert resp.status_code == 200
@@ -63,7 +67,7 @@ def test_full_ai_flow():
         "user_id": user_id,
         "message": "Give me a healthy snack suggestion"
     }
-    resp = client.post("/api/v1/chat/", json=chat_payload)
+    resp = client.post("/api/v1/chat/", json=chat_payload, headers=headers)
     assert resp.status_code == 200
     chat_resp = resp.json()
     assert "message" in chat_resp
@@ -0,0 +1,177 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.genai import errors
+
+from app.core.config import settings
+from app.core.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, RetryBudget
+from app.services import ai_client
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeModels:
+    """Plays back `script`: an exception to raise, a delay in seconds, or a text to return."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0) if self.script else "ok"
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, (int, float)):
+            await asyncio.sleep(step)
+            step = "slow"
+        return SimpleNamespace(text=step)
+
+
+def client_for(models):
+    return SimpleNamespace(aio=SimpleNamespace(models=models))
+
+
+def unavailable():
+    return errors.ServerError(503, {"error": {"code": 503, "message": "overloaded", "status": "UNAVAILABLE"}})
+
+
+def test_retry_budget_caps_retries_and_refills():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.5, min_per_second=1, max_tokens=2, clock=clock)
+    assert budget.try_spend() and budget.try_spend()
+    assert not budget.try_spend()
+    budget.record_call()
+    budget.record_call()
+    assert budget.try_spend()
+    clock.now += 1
+    assert budget.try_spend()
+    assert not budget.try_spend()
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_ratio=0.5, window=4, min_calls=4, cooldown_seconds=10, clock=clock)
+    for success in (True, False, True, False):
+        assert breaker.allow()
+        breaker.record(success)
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+    clock.now += 10
+    assert breaker.allow()  # the probe
+    assert not breaker.allow()
+    breaker.record(False)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_latency_window_percentile():
+    window = LatencyWindow(size=100)
+    assert window.percentile(0.95) is None
+    for ms in range(1, 101):
+        window.observe(ms / 1000)
+    assert window.percentile(0.95) == pytest.approx(0.096)
+    assert window.percentile(0.95, min_samples=200) is None
+
+
+def test_retries_provider_errors_then_succeeds():
+    models = FakeModels(unavailable(), unavailable(), "ok")
+    result = asyncio.run(ai_client.generate_content(client_for(models), operation="test", contents="hola"))
+    assert result.text == "ok"
+    assert models.calls == 3
+
+
+def test_retries_unparseable_output():
+    models = FakeModels("not json", "42")
+    result = asyncio.run(ai_client.generate_content(client_for(models), operation="test", parse=lambda r: int(r.text)))
+    assert result == 42
+    assert models.calls == 2
+
+
+def test_client_errors_are_not_retried():
+    models = FakeModels(errors.ClientError(400, {"error": {"code": 400, "message": "bad request"}}))
+    with pytest.raises(errors.ClientError):
+        asyncio.run(ai_client.generate_content(client_for(models), operation="test"))
+    assert models.calls == 1
+
+
+def test_exhausted_budget_stops_retries(monkeypatch):
+    monkeypatch.setattr(settings, "AI_RETRY_BUDGET_MIN_PER_SECOND", 0)
+    monkeypatch.setattr(settings, "AI_RETRY_BUDGET_RATIO", 0)
+    ai_client.reset()
+    ai_client._budget._tokens = 1
+
+    models = FakeModels(unavailable(), unavailable(), unavailable(), "ok")
+    with pytest.raises(errors.ServerError):
+        asyncio.run(ai_client.generate_content(client_for(models), operation="test"))
+    assert models.calls == 2
+
+
+def test_deadline_covers_the_whole_call():
+    models = FakeModels(5)
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(ai_client.generate_content(client_for(models), operation="test", timeout=0.05))
+    assert models.calls == 1
+
+
+def test_deadline_covers_waiting_for_a_slot(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_CONCURRENCY", 1)
+    models = FakeModels(0.5)
+    client = client_for(models)
+
+    async def stream():
+        return [chunk async for chunk in ai_client.generate_content_stream(client, operation="test", timeout=0.05)]
+
+    async def run():
+        busy = asyncio.ensure_future(ai_client.generate_content(client, operation="test", timeout=2))
+        await asyncio.sleep(0)
+        started = asyncio.get_running_loop().time()
+        for queued in (ai_client.generate_content(client, operation="test", timeout=0.05), stream()):
+            with pytest.raises(asyncio.TimeoutError):
+                await queued
+        elapsed = asyncio.get_running_loop().time() - started
+        await busy
+        return elapsed
+
+    assert asyncio.run(run()) < 0.4
+    assert models.calls == 1
+
+
+def test_hedge_wins_over_a_slow_request(monkeypatch):
+    monkeypatch.setattr(settings, "AI_HEDGE_ENABLED", True)
+    monkeypatch.setattr(settings, "AI_HEDGE_MIN_SAMPLES", 5)
+    for _ in range(5):
+        ai_client._latency_window("test").observe(0.01)
+
+    models = FakeModels(5, "fast")
+    result = asyncio.run(ai_client.generate_content(client_for(models), operation="test", timeout=2))
+    assert result.text == "fast"
+    assert models.calls == 2
+
+
+def test_open_circuit_fails_fast(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_RETRIES", 0)
+    monkeypatch.setattr(settings, "AI_BREAKER_MIN_CALLS", 3)
+    ai_client.reset()
+
+    models = FakeModels(*[unavailable()] * 3)
+    for _ in range(3):
+        with pytest.raises(errors.ServerError):
+            asyncio.run(ai_client.generate_content(client_for(models), operation="test"))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(ai_client.generate_content(client_for(models), operation="test"))
+    assert models.calls == 3
+    assert ai_client.ai_circuit_open.value(()) == 1
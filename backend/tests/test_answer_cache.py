@@ -0,0 +1,144 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_chat, ai_client, answer_cache
+from app.services.answer_cache import AnswerCache, features, tokens
+
+ANSWER = {"intent": "QUESTION", "entities": None, "message": "Entre 1.6 y 2.2 g por kg de peso."}
+
+
+class FakeModels:
+    def __init__(self, response=ANSWER):
+        self.response = response
+        self.calls = 0
+
+    async def generate_content(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(text=json.dumps(self.response))
+
+
+@pytest.fixture
+def models(monkeypatch):
+    models = FakeModels()
+    monkeypatch.setattr(ai_client, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    return models
+
+
+def ask(message):
+    return asyncio.run(ai_chat.process_user_message_async(message))
+
+
+@pytest.mark.parametrize("first, second", [
+    ("¿Cuánta proteína debo comer al día?", "how much protein should I eat per day"),
+    ("¿El arroz engorda?", "is rice fattening?"),
+    ("¿Es bueno comer huevos en la noche?", "can i eat eggs at night"),
+])
+def test_rephrased_questions_share_an_answer(models, first, second):
+    assert ask(first) == ANSWER
+    assert ask(second) == ANSWER
+    assert models.calls == 1
+
+
+def test_different_questions_miss(models):
+    ask("¿Cuánta proteína debo comer al día?")
+    ask("¿Qué alimentos tienen más proteína?")
+    ask("¿El arroz engorda?")
+    assert models.calls == 3
+
+
+@pytest.mark.parametrize("first, second", [
+    ("is 2000 calories enough", "is 1200 calories enough"),
+    ("¿Son suficientes 1500 calorías?", "¿Son suficientes 1800 calorías?"),
+    ("how to lose weight fast", "how to gain weight fast"),
+    ("¿Cómo bajar de peso rápido?", "¿Cómo subir de peso rápido?"),
+    ("should I eat protein before training", "should I eat protein after training"),
+    ("¿Comer fruta antes de entrenar?", "¿Comer fruta después de entrenar?"),
+    ("¿Es malo comer arroz?", "¿No es malo comer arroz?"),
+    ("foods high in protein", "foods low in protein"),
+    ("how much water should a woman drink", "how much water should a man drink"),
+    ("how many calories should a 30 year old woman eat", "how many calories should a 30 year old man eat"),
+    ("how many calories should a 30 year old woman eat", "how many calories should a 40 year old woman eat"),
+    ("¿Cuánta agua debe tomar una embarazada?", "¿Cuánta agua debe tomar un niño?"),
+    ("¿Es bueno comer avena en la noche?", "¿Es bueno comer arroz en la noche?"),
+])
+def test_opposite_questions_never_share_an_answer(models, first, second):
+    ask(first)
+    ask(second)
+    assert models.calls == 2
+
+
+def test_contrast_words_match_across_languages(models):
+    ask("¿Comer fruta antes de entrenar?")
+    ask("comer fruta before entrenar")
+    assert models.calls == 1
+
+
+@pytest.mark.parametrize("message", [
+    "¿Cuántas calorías tiene mi almuerzo?",  # about the user's plan
+    "¿y de proteína?",                       # follow-up
+    "hola",                                  # too little to match on
+])
+def test_personal_and_follow_up_messages_are_not_cached(models, message):
+    ask(message)
+    ask(message)
+    assert models.calls == 2
+
+
+def test_meal_changes_are_never_cached(models, monkeypatch):
+    # Below the threshold the classifier leaves it to Gemini, but it still reads as a swap
+    monkeypatch.setattr(settings, "CHAT_INTENT_CONFIDENCE_THRESHOLD", 1.1)
+    models.response = {"intent": "QUESTION", "entities": None, "message": "ok"}
+    ask("cambia la cena por favor")
+    ask("cambia la cena por favor")
+    assert models.calls == 2
+
+    answer_cache.store("¿Qué cenar hoy con pollo?", {"intent": "CHANGE_MEAL", "entities": {"meal_type": "Dinner"},
+                                                      "message": "ok"})
+    assert len(answer_cache._cache) == 0
+
+
+def test_entries_expire_and_are_evicted():
+    now = [0.0]
+    cache = AnswerCache(maxsize=2, ttl=10, threshold=0.7, timer=lambda: now[0])
+    questions = [features(tokens(q)) for q in ("¿El arroz engorda?", "¿Es sano el café?", "¿Cuánta agua tomar?")]
+    for i, question in enumerate(questions):
+        cache.set(question, {"message": str(i)})
+    assert len(cache) == 2
+    assert cache.get(questions[0]) is None
+    assert cache.get(questions[2]) == {"message": "2"}
+
+    now[0] = 11
+    assert cache.get(questions[2]) is None
+    assert len(cache) == 1
+
+
+async def _fake_conversation_kwargs(client, message, user_id):
+    return {"model": ai_chat.CHAT_MODEL, "contents": f"CONTEXT {user_id}: {message}"}
+
+
+def test_cached_answers_never_carry_user_context(monkeypatch):
+    requests = []
+
+    class RecordingModels(FakeModels):
+        async def generate_content(self, **kwargs):
+            requests.append(kwargs)
+            return await super().generate_content(**kwargs)
+
+    models = RecordingModels()
+    monkeypatch.setattr(ai_client, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+
+    async def run():
+        # A personal question gets the user's plan, and is not shared
+        await ai_chat.process_user_message_async("¿Cuántas calorías tiene mi almuerzo?", "u1")
+        # A general question is answered without it, then shared
+        await ai_chat.process_user_message_async("¿El arroz engorda?", "u1")
+        return await ai_chat.process_user_message_async("is rice fattening?", "u2")
+
+    monkeypatch.setattr(ai_chat, "_conversation_kwargs", _fake_conversation_kwargs)
+    assert asyncio.run(run()) == ANSWER
+    assert [kwargs["contents"].startswith("CONTEXT") for kwargs in requests] == [True, False]
+    assert ai_chat.SYSTEM_PROMPT in requests[1]["contents"]
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from fastapi.testclient import TestClient
+
+from app.api import deps
+from app.core import security
+from app.main import app
+
+client = TestClient(app)
+
+
+def auth(user_id="u1"):
+    token = security.create_access_token({"sub": user_id}, expires_delta=timedelta(minutes=5))
+    return {"Authorization": f"Bearer {token}"}
+
+
+def test_decode_is_memoized(monkeypatch):
+    headers = auth()
+    token = headers["Authorization"].split()[1]
+    assert security.decode_access_token(token)["sub"] == "u1"
+
+    monkeypatch.setattr(security.jwt, "decode", lambda *args, **kwargs: (_ for _ in ()).throw(AssertionError))
+    assert security.decode_access_token(token)["sub"] == "u1"
+
+
+def test_profile_read_once_and_shared(monkeypatch):
+    reads = []
+
+    def get_user(user_id):
+        reads.append(user_id)
+        return {"email": "a@test.com", "name": "Ana", "hashed_password": "x"}
+
+    monkeypatch.setattr(deps.user_service, "get_user", get_user)
+    response = client.get("/api/v1/users/u1", headers=auth())
+
+    assert response.status_code == 200
+    assert response.json()["name"] == "Ana"
+    assert "hashed_password" not in response.json()
+    assert reads == ["u1"]
+
+
+def test_rejects_missing_bad_and_foreign_tokens(monkeypatch):
+    monkeypatch.setattr(deps.user_service, "get_user", lambda user_id: {"email": "a@test.com"})
+
+    assert client.get("/api/v1/plans/latest").status_code == 401
+    assert client.get("/api/v1/plans/latest", headers={"Authorization": "Bearer nope"}).status_code == 401
+    assert client.get("/api/v1/users/someone-else", headers=auth("u1")).status_code == 403
@@ -0,0 +1,182 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_chat, ai_client, chat_memory, context_cache, plan_service
+
+REPLY = {"intent": "QUESTION", "entities": None, "message": "Claro, el almuerzo tiene 600 kcal."}
+
+PLAN = {
+    "target_calories": 2000,
+    "plan": [{
+        "day": "Lunes", "total_calories": 600,
+        "meals": [{"meal_type": "Lunch", "name": "Pollo con arroz", "calories": 600, "protein": 40,
+                   "carbs": 60, "fats": 15, "ingredients": ["pollo", "arroz"], "prepTime": "20 min"}],
+    }],
+}
+
+
+class FakeGemini:
+    """Chat replies plus an in-memory stand-in for Gemini context caching."""
+
+    def __init__(self, cache_error=None):
+        self.requests = []
+        self.cached_contents = {}
+        self.cache_error = cache_error
+        self.aio = SimpleNamespace(
+            models=SimpleNamespace(generate_content=self._generate),
+            caches=SimpleNamespace(create=self._create_cache),
+        )
+
+    async def _create_cache(self, model=None, config=None):
+        if self.cache_error:
+            raise self.cache_error
+        name = f"cachedContents/{len(self.cached_contents)}"
+        self.cached_contents[name] = config.system_instruction
+        return SimpleNamespace(name=name)
+
+    async def _generate(self, model=None, contents="", config=None):
+        self.requests.append((contents, config))
+        if contents.startswith(ai_chat.SUMMARY_PROMPT.split("{")[0]):
+            return SimpleNamespace(text="Le gusta el pollo.")
+        return SimpleNamespace(text=json.dumps(REPLY))
+
+
+@pytest.fixture(autouse=True)
+def memory(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_MEMORY_FIRESTORE", False)
+    reads = []
+
+    def get_latest_plan(user_id, plan_id=None):
+        reads.append(user_id)
+        return "plan-1", PLAN
+
+    monkeypatch.setattr(plan_service, "get_latest_plan", get_latest_plan)
+    monkeypatch.setattr(plan_service, "get_plan_pointer",
+                        lambda user_id: ("plan-1", plan_service.plan_version(PLAN)))
+    chat_memory.clear()
+    context_cache.clear()
+    return reads
+
+
+def chat(gemini, message):
+    async def run():
+        reply = await ai_chat.process_user_message_async(message, "u1")
+        await ai_chat.remember("u1", message, reply)
+        return reply
+    return asyncio.run(run())
+
+
+def test_plan_goes_in_a_cached_prefix_created_once(monkeypatch, memory):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 0)
+    gemini = FakeGemini()
+    monkeypatch.setattr(ai_client, "_client", gemini)
+
+    assert chat(gemini, "¿cuántas calorías tiene mi almuerzo?") == REPLY
+    chat(gemini, "¿y cuánta proteína?")
+
+    [instruction] = gemini.cached_contents.values()
+    assert instruction.startswith(ai_chat.SYSTEM_PROMPT)
+    assert "Pollo con arroz" in instruction
+    # The second turn reuses the prefix without reading the plan again
+    assert memory == ["u1"]
+    for contents, config in gemini.requests:
+        assert config.cached_content == "cachedContents/0"
+        assert ai_chat.SYSTEM_PROMPT not in contents
+
+
+def test_earlier_turns_are_sent_back(monkeypatch):
+    gemini = FakeGemini()
+    monkeypatch.setattr(ai_client, "_client", gemini)
+
+    chat(gemini, "no me gusta el pescado")
+    chat(gemini, "¿qué me recomiendas?")
+
+    contents, _ = gemini.requests[-1]
+    assert "Usuario: no me gusta el pescado" in contents
+    assert f"Nutricionista: {REPLY['message']}" in contents
+    assert contents.endswith("User: ¿qué me recomiendas?\n\nResponse (JSON):")
+
+
+def test_prefix_goes_inline_when_gemini_wont_cache_it(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_CONTEXT_CACHE_MIN_TOKENS", 0)
+    gemini = FakeGemini(cache_error=ValueError("content too small"))
+    monkeypatch.setattr(ai_client, "_client", gemini)
+
+    chat(gemini, "hola")
+    _, config = gemini.requests[0]
+    assert config.cached_content is None
+    assert "Pollo con arroz" in config.system_instruction
+
+
+def test_small_prefix_goes_inline_without_asking_gemini(monkeypatch):
+    gemini = FakeGemini()
+    monkeypatch.setattr(ai_client, "_client", gemini)
+
+    chat(gemini, "hola")
+    chat(gemini, "¿y la cena?")
+    assert gemini.cached_contents == {}
+    for _, config in gemini.requests:
+        assert config.cached_content is None
+        assert "Pollo con arroz" in config.system_instruction
+
+
+def test_old_turns_are_folded_into_the_summary(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_MEMORY_MAX_TOKENS", 40)
+    gemini = FakeGemini()
+    monkeypatch.setattr(ai_client, "_client", gemini)
+
+    for i in range(4):
+        chat(gemini, f"pregunta número {i} sobre mi plan")
+
+    history = chat_memory.load("u1")
+    assert history["summary"] == "Le gusta el pollo."
+    assert sum(chat_memory.estimate_tokens(turn["t"]) for turn in history["turns"]) <= 40
+    assert history["turns"][-2] == {"r": chat_memory.USER, "t": "pregunta número 3 sobre mi plan"}
+
+
+def test_fallback_summary_keeps_the_newest_words(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_SUMMARY_MAX_TOKENS", 5)
+    evicted = [{"r": "u", "t": "a" * 30}, {"r": "a", "t": "respuesta"}, {"r": "u", "t": "sin gluten"}]
+    summary = chat_memory.fallback_summary("", evicted)
+    assert summary.endswith("sin gluten")
+    assert "respuesta" not in summary
+    assert len(summary) <= 21
+
+
+def test_concurrent_exchanges_are_all_kept(monkeypatch):
+    monkeypatch.setattr(ai_client, "_client", FakeGemini())
+
+    async def run():
+        await asyncio.gather(*(ai_chat.remember("u1", f"mensaje {i}", REPLY) for i in range(5)))
+    asyncio.run(run())
+
+    said = [turn["t"] for turn in chat_memory.load("u1")["turns"] if turn["r"] == chat_memory.USER]
+    assert sorted(said) == [f"mensaje {i}" for i in range(5)]
+
+
+def test_fold_keeps_turns_another_worker_added(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_MEMORY_FIRESTORE", True)
+    monkeypatch.setattr(settings, "CHAT_MEMORY_MAX_TOKENS", 20)
+    stored = {"summary": "", "turns": [{"r": "u", "t": "a" * 60}, {"r": "a", "t": "b" * 60}]}
+
+    async def summarize(summary, evicted):
+        # Another worker remembers an exchange while this one summarizes
+        stored["turns"] += [{"r": "u", "t": "sin gluten"}, {"r": "a", "t": "anotado"}]
+        return "resumen"
+
+    def firestore_update(user_id, change):
+        history = {"summary": stored["summary"], "turns": list(stored["turns"])}
+        change(history)
+        stored.update(history)
+        return history
+
+    monkeypatch.setattr(chat_memory, "_firestore_update", firestore_update)
+    monkeypatch.setattr(ai_chat, "_summarize", summarize)
+    asyncio.run(ai_chat.remember("u1", "hola", REPLY))
+
+    assert stored["summary"] == "resumen"
+    assert [turn["t"] for turn in stored["turns"]] == ["hola", REPLY["message"], "sin gluten", "anotado"]
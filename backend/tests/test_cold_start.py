@@ -0,0 +1,20 @@
+import os
+import subprocess
+import sys
+
+from app.services import ai_client
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_defers_client_libraries():
+    code = ("import sys, app.main; "
+            "print([m for m in ('google.genai', 'google.cloud.firestore', 'firebase_admin') if m in sys.modules])")
+    output = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
+
+
+def test_ai_client_is_built_once_and_shared(monkeypatch):
+    monkeypatch.setattr(ai_client, "_client", None)
+    first = ai_client.get_client()
+    assert ai_client.get_client() is first
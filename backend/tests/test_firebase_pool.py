@@ -0,0 +1,48 @@
+import asyncio
+
+from app.core.config import settings
+from app.db import firebase
+
+
+def test_pool_is_shared_and_round_robin(monkeypatch):
+    monkeypatch.setenv("FIRESTORE_EMULATOR_HOST", "localhost:8080")
+    monkeypatch.setattr(settings, "FIRESTORE_POOL_SIZE", 2)
+    asyncio.run(firebase.close_db())
+
+    first, second, third = firebase.get_db(), firebase.get_db(), firebase.get_db()
+    assert first is not second
+    assert first is third
+    assert first.project == firebase.EMULATOR_PROJECT_ID
+    assert firebase.get_async_db() is firebase.get_async_db()
+
+    asyncio.run(firebase.close_db())
+    assert firebase.get_db() is not first
+    asyncio.run(firebase.close_db())
+
+
+def test_channels_get_our_keepalive_options(monkeypatch):
+    # The pooled clients hook a private google-cloud-firestore method
+    # (_firestore_api_helper) to pass channel options; this fails if a
+    # library upgrade moves it, instead of the options silently going away.
+    import google.auth.credentials
+    from google.cloud.firestore_v1.services.firestore.transports import grpc, grpc_asyncio
+
+    monkeypatch.delenv("FIRESTORE_EMULATOR_HOST", raising=False)
+    calls = []
+    for transport in (grpc.FirestoreGrpcTransport, grpc_asyncio.FirestoreGrpcAsyncIOTransport):
+        original = transport.create_channel.__func__
+
+        def create_channel(cls, *args, original=original, **kwargs):
+            calls.append(kwargs.get("options"))
+            return original(cls, *args, **kwargs)
+
+        monkeypatch.setattr(transport, "create_channel", classmethod(create_channel))
+
+    async def build_clients():
+        for client_class in firebase._pooled_classes():
+            client = client_class(project="test", credentials=google.auth.credentials.AnonymousCredentials())
+            assert client._firestore_api is client._firestore_api
+            await asyncio.sleep(0)
+
+    asyncio.run(build_clients())
+    assert calls == [firebase._channel_options()] * 2
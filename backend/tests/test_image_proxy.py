@@ -0,0 +1,153 @@
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.main import app
+from app.services import ai_plan, image_proxy
+from app.services.image_proxy import DiskLRU, image_key
+
+
+class FakeUpstream:
+    def __init__(self, delay=0.0, error=None):
+        self.delay = delay
+        self.error = error
+        self.fetches = []
+
+    async def fetch(self, recipe_name):
+        self.fetches.append(recipe_name)
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return b"\xff\xd8\xff" + recipe_name.encode("utf-8"), "image/jpeg"
+
+
+@pytest.fixture
+def upstream(monkeypatch, tmp_path):
+    upstream = FakeUpstream()
+    monkeypatch.setattr(settings, "IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "http://testserver")
+    monkeypatch.setattr(image_proxy, "_upstream", upstream)
+    image_proxy.reset()
+    yield upstream
+    image_proxy.reset()
+
+
+def test_key_ignores_case_accents_and_spacing():
+    assert image_key("Ají de Gallina") == image_key("  aji de  GALLINA ")
+    assert image_key("Ají de Gallina") != image_key("Lomo Saltado")
+
+
+def test_plans_get_proxy_urls(monkeypatch):
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "https://api.fitia.test/")
+    url = ai_plan.generate_image_url("Ají de Gallina")
+    assert url == (f"https://api.fitia.test/api/v1/images/{image_key('Ají de Gallina')}"
+                   f"?name=Aj%C3%AD+de+Gallina&sig={image_proxy.sign('Ají de Gallina')}")
+
+    monkeypatch.setattr(settings, "IMAGE_PROXY_ENABLED", False)
+    assert ai_plan.generate_image_url("Ají de Gallina").startswith("https://image.pollinations.ai/prompt/Aj%C3%AD")
+
+
+def test_no_proxy_urls_without_a_public_base_url(monkeypatch):
+    # Relative URLs would resolve against the web client's origin
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "")
+    assert ai_plan.generate_image_url("Ceviche").startswith("https://image.pollinations.ai/prompt/Ceviche")
+
+
+def test_image_is_fetched_once_and_cached(upstream):
+    client = TestClient(app)
+    url = ai_plan.generate_image_url("Lomo Saltado")
+
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers["content-type"] == "image/jpeg"
+    assert first.headers["cache-control"] == f"public, max-age={settings.IMAGE_CACHE_MAX_AGE_SECONDS}, immutable"
+    assert "content-encoding" not in first.headers
+    assert first.content == b"\xff\xd8\xffLomo Saltado"
+
+    # Later requests need only the key
+    second = client.get(url.split("?")[0])
+    assert second.content == first.content
+    assert upstream.fetches == ["Lomo Saltado"]
+
+    revalidated = client.get(url, headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 304
+
+
+def test_unknown_and_mismatched_keys_are_not_fetched(upstream):
+    client = TestClient(app)
+    key = image_key("Lomo Saltado")
+    assert client.get(f"/api/v1/images/{key}").status_code == 404
+    assert client.get(f"/api/v1/images/{key}?name=Ceviche").status_code == 404
+    assert client.get("/api/v1/images/not-a-key?name=Ceviche").status_code == 404
+    assert upstream.fetches == []
+
+
+def test_unsigned_names_are_not_fetched(upstream):
+    client = TestClient(app)
+    prompt = "anything at all, 4k"
+    key = image_key(prompt)
+    assert client.get(f"/api/v1/images/{key}?name={prompt}").status_code == 404
+    assert client.get(f"/api/v1/images/{key}?name={prompt}&sig={'0' * 32}").status_code == 404
+    # A signature for another name doesn't carry over
+    assert client.get(f"/api/v1/images/{key}?name={prompt}&sig={image_proxy.sign('Ceviche')}").status_code == 404
+    assert upstream.fetches == []
+
+
+def test_upstream_failure_is_a_502_and_not_cached(upstream):
+    upstream.error = RuntimeError("generator down")
+    client = TestClient(app)
+    url = ai_plan.generate_image_url("Ceviche")
+    response = client.get(url)
+    assert response.status_code == 502
+    assert response.headers["cache-control"] == "no-store"
+
+    upstream.error = None
+    assert client.get(url).status_code == 200
+
+
+def test_concurrent_requests_share_one_fetch(upstream):
+    upstream.delay = 0.05
+    key = image_key("Ceviche")
+
+    async def run():
+        signature = image_proxy.sign("Ceviche")
+        return await asyncio.gather(*(image_proxy.get_image(key, "Ceviche", signature) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(set(results)) == 1
+    assert upstream.fetches == ["Ceviche"]
+
+
+def test_prefetch_fetches_each_dish_once(upstream, monkeypatch):
+    monkeypatch.setattr(settings, "IMAGE_PREFETCH", True)
+    meals = [{"name": "Ceviche"}, {"name": "ceviche"}, {"name": "Causa"}, {"name": ""}]
+    plan = {"plan": [{"day": "Lunes", "meals": meals}] * 7}
+
+    async def run():
+        image_proxy.prefetch_plan(plan)
+        await asyncio.gather(*image_proxy._background)
+
+    asyncio.run(run())
+    assert sorted(upstream.fetches) == ["Causa", "Ceviche"]
+    assert image_proxy._get_store().get(image_key("causa")) is not None
+
+
+def test_disk_lru_evicts_least_recently_used(tmp_path):
+    store = DiskLRU(str(tmp_path), max_bytes=250)
+    for key in ("a" * 32, "b" * 32):
+        store.put(key, b"x" * 100, "image/jpeg")
+    os.utime(store.get("b" * 32)[0], (0, 0))  # make "b" the oldest on disk
+    store.get("a" * 32)
+    store.put("c" * 32, b"x" * 100, "image/png")
+
+    assert store.get("b" * 32) is None
+    assert store.size == 200
+    assert sorted(os.listdir(tmp_path)) == ["a" * 32 + ".jpg", "c" * 32 + ".png"]
+
+    # A new index (e.g. after a restart) picks the files up again
+    reopened = DiskLRU(str(tmp_path), max_bytes=250)
+    assert len(reopened) == 2
+    assert reopened.get("c" * 32)[1] == "image/png"
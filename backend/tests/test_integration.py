@@ -39,10 +39,11 @@ def test_integration_flow():
     assert response.status_code == 200
     token = response.json().get("access_token")
     assert token is not None
+    headers = {"Authorization": f"Bearer {token}"}
     print("Login Successful, Token received")
 
     # 2. Generate Plan
-    response = client.post(f"/api/v1/plans/generate?user_id={user_id}")
+    response = client.post(f"/api/v1/plans/generate?user_id={user_id}", headers=headers)
     assert response.status_code == 200
     plan_data = response.json()
     assert "plan_id" in plan_data
@@ -51,7 +52,7 @@ def test_integration_flow():
     print("Plan Generated Successfully")
 
     # 3. Fetch Latest Plan
-    response = client.get(f"/api/v1/plans/latest?user_id={user_id}")
+    response = client.get(f"/api/v1/plans/latest?user_id={user_id}", headers=headers)
     assert response.status_code == 200
     fetched_plan = response.json()
     assert "summary" in fetched_plan
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_chat, ai_client, intent_classifier
+
+
+@pytest.mark.parametrize("message, meal_type, wanted, avoided", [
+    ("cambia la cena", "Dinner", None, None),
+    ("change my breakfast, no fish", "Breakfast", None, ["fish"]),
+    ("Cámbiame el desayuno por algo con huevos y sin jamón", "Breakfast", ["huevos"], ["jamon"]),
+    ("swap dinner for something with chicken please", "Dinner", ["chicken"], None),
+    ("quiero otra comida con pollo", "Lunch", ["pollo"], None),
+    ("cambia la cena por favor", "Dinner", None, None),
+    ("cambia la cena por otra cosa", "Dinner", None, None),
+    ("change dinner, not fish", "Dinner", None, ["fish"]),
+    ("swap lunch with chicken not fish", "Lunch", ["chicken"], ["fish"]),
+])
+def test_swap_commands_are_resolved_locally(message, meal_type, wanted, avoided):
+    response = intent_classifier.resolve(message)
+
+    assert response["intent"] == "CHANGE_MEAL"
+    assert response["entities"] == {"meal_type": meal_type, "food_keywords": wanted, "exclude_keywords": avoided}
+
+
+@pytest.mark.parametrize("message", [
+    "¿Qué es mejor para la cena?",
+    "what should I eat for dinner",
+    "cuantas calorias tiene el desayuno",
+    "cambia el desayuno y la cena",
+    "hola",
+    "quiero bajar de peso",
+])
+def test_questions_and_ambiguous_messages_fall_through(message):
+    assert intent_classifier.resolve(message) is None
+
+
+@pytest.mark.parametrize("message", [
+    "don't change my dinner",
+    "please do not swap my breakfast",
+    "no cambiar la cena",
+    "no cambies el desayuno",
+    "keep my dinner, change nothing",
+    "I dont want to change my dinner",
+    "nunca cambies mi almuerzo",
+    "another tip for breakfast",
+    "tell me a different dinner recipe",
+    "different breakfast ideas for kids",
+])
+def test_negated_changes_and_requests_for_ideas_fall_through(message):
+    assert intent_classifier.classify(message)["intent"] != "CHANGE_MEAL"
+    assert intent_classifier.resolve(message) is None
+
+
+@pytest.mark.parametrize("message, meal_type", [
+    ("dame otro desayuno", "Breakfast"),
+    ("another dinner please", "Dinner"),
+])
+def test_alternative_words_count_before_a_meal(message, meal_type):
+    assert intent_classifier.resolve(message)["entities"]["meal_type"] == meal_type
+
+
+@pytest.mark.parametrize("message", ["no quiero cenar", "i hate breakfast", "no me gusta la cena"])
+def test_dislikes_without_a_change_verb_are_left_to_gemini(message):
+    assert intent_classifier.classify(message)["intent"] == "CHANGE_MEAL"
+    assert intent_classifier.resolve(message) is None
+
+
+def test_threshold_setting(monkeypatch):
+    monkeypatch.setattr(settings, "CHAT_INTENT_CONFIDENCE_THRESHOLD", 0.7)
+    assert intent_classifier.resolve("no me gusta la cena") is not None
+    monkeypatch.setattr(settings, "CHAT_INTENT_CONFIDENCE_THRESHOLD", 0.9)
+    assert intent_classifier.resolve("no me gusta la cena") is None
+    assert intent_classifier.resolve("cambia la cena") is not None
+
+
+def test_chat_skips_gemini_for_local_intents(monkeypatch):
+    monkeypatch.setattr(ai_client, "_client", object())  # any Gemini call would fail
+    ai_chat.chat_latency.clear()
+
+    response = asyncio.run(ai_chat.process_user_message_async("cambia el almuerzo"))
+
+    assert response["entities"]["meal_type"] == "Lunch"
+    assert ai_chat.chat_latency.snapshot()["local"]["count"] == 1
+    assert "gemini" not in ai_chat.chat_latency.snapshot()
@@ -0,0 +1,55 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.core import metrics
+from app.core.config import settings
+from app.main import app
+
+
+def test_span_records_latency_and_errors():
+    metrics.dependency_latency.clear()
+    metrics.dependency_errors.clear()
+
+    with metrics.span("firestore", "test_read"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.span("firestore", "test_read"):
+            raise ValueError("boom")
+
+    assert metrics.dependency_latency.snapshot()[("firestore", "test_read")]["count"] == 2
+    assert metrics.dependency_errors.value(("firestore", "test_read")) == 1
+    assert metrics.dependency_in_flight.value("firestore") == 0
+
+
+def test_span_is_a_noop_when_disabled(monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    metrics.dependency_latency.clear()
+
+    with metrics.span("gemini", "generate_content"):
+        pass
+    assert metrics.dependency_latency.snapshot() == {}
+
+
+def test_prometheus_rendering():
+    histogram = metrics.Histogram("test_seconds", "Test", label=("route",), buckets=(0.1, 1.0))
+    histogram.observe("/a", 0.5)
+    text = "\n".join(histogram.render())
+
+    assert 'test_seconds_bucket{route="/a",le="0.1"} 0' in text
+    assert 'test_seconds_bucket{route="/a",le="1.0"} 1' in text
+    assert 'test_seconds_bucket{route="/a",le="+Inf"} 1' in text
+    assert 'test_seconds_count{route="/a"} 1' in text
+
+
+def test_metrics_endpoint_reports_routes_and_caches(monkeypatch):
+    client = TestClient(app)
+    client.get("/")
+    client.get("/api/v1/plans/jobs/some-id")  # 401, labelled by template
+
+    text = client.get("/metrics").text
+    assert 'http_request_seconds_count{method="GET",route="/",status="200"}' in text
+    assert 'route="/api/v1/plans/jobs/{job_id}",status="401"' in text
+    assert 'cache_stat{cache="plan",stat="hit_ratio"}' in text
+
+    monkeypatch.setattr(settings, "METRICS_ENABLED", False)
+    assert client.get("/metrics").status_code == 404
@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.models.user import UserBase, Gender, ActivityLevel, Goal
+from app.services import nutrition_batch, nutrition_engine
+
+
+def random_users(count=2000, seed=7):
+    rng = np.random.default_rng(seed)
+    genders = list(Gender)
+    activities = list(ActivityLevel)
+    goals = list(Goal)
+    return [
+        UserBase(
+            email=f"user{i}@test.com",
+            weight=float(rng.uniform(35, 180)),
+            height=float(rng.uniform(130, 210)),
+            age=int(rng.integers(14, 90)),
+            gender=genders[rng.integers(len(genders))],
+            activity_level=activities[rng.integers(len(activities))],
+            goal=goals[rng.integers(len(goals))],
+        )
+        for i in range(count)
+    ]
+
+
+def test_batch_matches_scalar_path_exactly():
+    users = random_users()
+
+    batch = nutrition_batch.calculate_targets_batch(
+        [u.weight for u in users], [u.height for u in users], [u.age for u in users],
+        [u.gender for u in users], [u.activity_level for u in users], [u.goal for u in users],
+    )
+    bmr = nutrition_batch.calculate_bmr_batch(
+        [u.weight for u in users], [u.height for u in users], [u.age for u in users], [u.gender for u in users]
+    )
+
+    for i, user in enumerate(users):
+        scalar_bmr, scalar_tdee, scalar_target = nutrition_engine.calculate_targets(user)
+        assert bmr[i] == scalar_bmr
+        assert batch["bmr"][i] == int(scalar_bmr)
+        assert batch["tdee"][i] == int(scalar_tdee)
+        assert batch["target_calories"][i] == scalar_target
+
+
+def test_accepts_plain_strings_and_unknown_activity():
+    batch = nutrition_batch.calculate_targets_batch(
+        [70.0], [170.0], [25], ["Male"], ["Couch Potato"], ["Maintain Weight"]
+    )
+    bmr = nutrition_engine.calculate_bmr(UserBase(email="a@test.com", gender="Male"))
+    assert batch["tdee"][0] == int(bmr * nutrition_engine.DEFAULT_ACTIVITY_MULTIPLIER)
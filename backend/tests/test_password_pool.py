@@ -0,0 +1,27 @@
+import asyncio
+
+from passlib.context import CryptContext
+
+from app.core import security
+from app.services import user_service
+
+# Cheap parameters, standing in for hashes made before a settings change
+outdated_context = CryptContext(schemes=["argon2"], argon2__rounds=1, argon2__memory_cost=8192, argon2__parallelism=1)
+
+
+def test_login_rehashes_outdated_hash(monkeypatch):
+    stored = {"id": "u1", "email": "a@test.com", "hashed_password": outdated_context.hash("secret")}
+    updates = {}
+    monkeypatch.setattr(user_service, "get_user_by_email", lambda email: dict(stored))
+    monkeypatch.setattr(user_service, "update_user", lambda user_id, data: updates.update(data))
+
+    try:
+        assert asyncio.run(user_service.authenticate_user_async("a@test.com", "wrong")) is False
+        user = asyncio.run(user_service.authenticate_user_async("a@test.com", "secret"))
+    finally:
+        security.shutdown_password_pool()
+
+    assert user["id"] == "u1"
+    assert updates["hashed_password"] == user["hashed_password"]
+    assert not security.pwd_context.needs_update(updates["hashed_password"])
+    assert security.verify_password("secret", updates["hashed_password"])
@@ -0,0 +1,64 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.models.user import UserBase, PlanningMode
+from app.services import ai_client, ai_plan, plan_cache
+
+
+@pytest.fixture(autouse=True)
+def memory_only_cache(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_CACHE_FIRESTORE", False)
+    plan_cache.clear()
+    yield
+    plan_cache.clear()
+
+
+def make_user(**overrides):
+    data = {"email": "a@test.com", "foods_like": ["Pollo", "arroz"]}
+    data.update(overrides)
+    return UserBase(**data)
+
+
+def test_key_normalizes_profile():
+    base = plan_cache.plan_cache_key(make_user(), 1810)
+    assert plan_cache.plan_cache_key(make_user(foods_like=["arroz ", "pollo"]), 1790) == base
+    assert plan_cache.plan_cache_key(make_user(name="Otro", email="b@test.com"), 1800) == base
+    assert plan_cache.plan_cache_key(make_user(), 1900) != base
+    assert plan_cache.plan_cache_key(make_user(diet_type="Keto"), 1800) != base
+
+
+def test_ttl_cache_expires_and_evicts():
+    now = [0.0]
+    cache = TTLCache(maxsize=2, ttl=10, timer=lambda: now[0])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    now[0] = 11
+    assert cache.get("a") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_generation_hits_cache(monkeypatch):
+    calls = []
+    meal = {"n": "Avena", "k": 400, "p": 12, "c": 60, "f": 8, "i": ["avena"], "r": 5}
+    payload = {"d": [{"m": [meal] * 3}] * 7}
+
+    def generate_content(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(text=json.dumps(payload))
+
+    monkeypatch.setattr(ai_client, "_client", SimpleNamespace(models=SimpleNamespace(generate_content=generate_content)))
+    user = make_user(planning_mode=PlanningMode.AUTOMATIC)
+
+    first = ai_plan.generate_ai_weekly_plan(user, 1800)
+    second = ai_plan.generate_ai_weekly_plan(user, 1810)
+
+    assert len(calls) == 1
+    assert second == first
+    assert plan_cache.get_stats()["memory_hits"] == 1
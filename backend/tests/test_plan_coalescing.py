@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import plan_coalescing, plan_service
+
+USER = UserBase(email="a@test.com", gender="Male")
+
+
+@pytest.fixture(autouse=True)
+def memory_only(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_COALESCE_FIRESTORE", False)
+    plan_coalescing.clear()
+    yield
+    plan_coalescing.clear()
+
+
+def make_producer():
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"plan_id": f"plan-{len(calls)}", "summary": {"plan": []}}
+
+    return produce, calls
+
+
+def test_concurrent_callers_share_one_generation():
+    produce, calls = make_producer()
+
+    async def run():
+        return await asyncio.gather(*(plan_coalescing.generate_once("u1", USER, produce) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert {result["plan_id"] for result in results} == {"plan-1"}
+
+
+def test_window_and_profile_changes(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_COALESCE_WINDOW_SECONDS", 10)
+    produce, calls = make_producer()
+    first = asyncio.run(plan_coalescing.generate_once("u1", USER, produce))
+    assert asyncio.run(plan_coalescing.generate_once("u1", USER, produce)) == first
+
+    # A different profile or user is a different generation
+    asyncio.run(plan_coalescing.generate_once("u1", USER.model_copy(update={"weight": 80}), produce))
+    asyncio.run(plan_coalescing.generate_once("u2", USER, produce))
+    assert len(calls) == 3
+
+    monkeypatch.setattr(settings, "PLAN_COALESCE_WINDOW_SECONDS", 0)
+    plan_coalescing.clear()
+    asyncio.run(plan_coalescing.generate_once("u3", USER, produce))
+    asyncio.run(plan_coalescing.generate_once("u3", USER, produce))
+    assert len(calls) == 5
+
+
+def test_failures_are_shared_but_not_remembered():
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Gemini down")
+
+    async def run():
+        return await asyncio.gather(
+            *(plan_coalescing.generate_once("u1", USER, failing) for _ in range(3)), return_exceptions=True
+        )
+
+    assert all(isinstance(result, RuntimeError) for result in asyncio.run(run()))
+    assert len(attempts) == 1
+
+    produce, _ = make_producer()
+    assert asyncio.run(plan_coalescing.generate_once("u1", USER, produce))["plan_id"] == "plan-1"
+
+
+def test_waits_for_another_workers_lease(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_COALESCE_FIRESTORE", True)
+    monkeypatch.setattr(settings, "PLAN_COALESCE_POLL_SECONDS", 0.001)
+    running = {"state": plan_coalescing.RUNNING, "expires_at": float("inf")}
+    reads = iter([running, {"state": plan_coalescing.DONE, "plan_id": "remote-plan"}])
+    monkeypatch.setattr(plan_coalescing, "_acquire_lease", lambda key: running)
+    monkeypatch.setattr(plan_coalescing, "_read_lease", lambda key: next(reads))
+    monkeypatch.setattr(plan_service, "get_plan", lambda user_id, plan_id: {"plan": [{"day": "Lunes"}]})
+    produce, calls = make_producer()
+
+    result = asyncio.run(plan_coalescing.generate_once("u1", USER, produce))
+
+    assert result == {"plan_id": "remote-plan", "summary": {"plan": [{"day": "Lunes"}]}}
+    assert calls == []
+
+
+def test_leader_records_plan_id_on_lease(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_COALESCE_FIRESTORE", True)
+    completed = {}
+    monkeypatch.setattr(plan_coalescing, "_acquire_lease", lambda key: {"acquired": True})
+    monkeypatch.setattr(plan_coalescing, "_complete_lease", lambda key, plan_id: completed.update(plan_id=plan_id))
+    produce, _ = make_producer()
+
+    asyncio.run(plan_coalescing.generate_once("u1", USER, produce))
+    assert completed == {"plan_id": "plan-1"}
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import ai_client, ai_plan, plan_cache
+
+
+@pytest.fixture(autouse=True)
+def fanout_mode(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_GENERATION_MODE", "fanout")
+    monkeypatch.setattr(settings, "AI_FANOUT_CONCURRENCY", 4)
+    monkeypatch.setattr(settings, "PLAN_CACHE_ENABLED", False)
+
+
+def meal(name):
+    return {"n": name, "k": 300, "p": 20, "c": 30, "f": 10, "i": ["arroz"], "r": 15}
+
+
+class FakeModels:
+    def __init__(self, fail_day=None):
+        self.prompts = []
+        self.fail_day = fail_day
+
+    async def generate_content(self, contents, **kwargs):
+        self.prompts.append(contents)
+        if "Genera un plan semanal" in contents and "Día a generar" not in contents:
+            day = {"m": [meal("Semanal")] * 3}
+            return SimpleNamespace(text=json.dumps({"d": [day] * 7}))
+        day = contents.split("Día a generar: ")[1].split(" ")[0]
+        if day == self.fail_day:
+            return SimpleNamespace(text='{"m": []}')
+        meals = [meal(f"{day} {meal_type}") for meal_type in ("Breakfast", "Lunch", "Dinner")]
+        return SimpleNamespace(text=json.dumps({"m": meals}))
+
+
+def run(monkeypatch, user, models):
+    monkeypatch.setattr(ai_client, "_client", SimpleNamespace(aio=SimpleNamespace(models=models)))
+    return asyncio.run(ai_plan.generate_ai_weekly_plan_async(user, 1800))
+
+
+def test_high_variety_generates_every_day_and_avoids_repeats(monkeypatch):
+    models = FakeModels()
+    result = run(monkeypatch, UserBase(email="a@test.com", variety_level="High"), models)
+
+    assert [day["day"] for day in result["plan"]] == ai_plan.WEEK_DAYS
+    assert len(models.prompts) == 7
+    # The second wave sees the dishes chosen by the first one
+    assert "Lunes Breakfast" in models.prompts[4]
+    first_meal = result["plan"][0]["meals"][0]
+    assert first_meal["meal_type"] == "Breakfast"
+    assert result["plan"][0]["total_calories"] == 900
+    assert "image" in first_meal and "id" in first_meal
+
+
+def test_low_variety_repeats_generated_days(monkeypatch):
+    models = FakeModels()
+    result = run(monkeypatch, UserBase(email="a@test.com", variety_level="Low"), models)
+
+    assert len(models.prompts) == 2
+    names = [day["meals"][0]["name"] for day in result["plan"]]
+    assert names == ["Lunes Breakfast", "Martes Breakfast"] * 3 + ["Lunes Breakfast"]
+
+
+def test_falls_back_to_single_prompt_when_a_shard_fails(monkeypatch):
+    models = FakeModels(fail_day="Martes")
+    result = run(monkeypatch, UserBase(email="a@test.com", variety_level="Medium"), models)
+
+    assert len(result["plan"]) == 7
+    assert result["plan"][0]["meals"][0]["name"] == "Semanal"
+
+
+def test_a_failed_shard_cancels_the_rest_of_its_wave(monkeypatch):
+    monkeypatch.setattr(settings, "AI_MAX_RETRIES", 0)
+    finished = []
+
+    class SlowModels(FakeModels):
+        async def generate_content(self, contents, **kwargs):
+            if "Día a generar: Lunes" not in contents and "Día a generar" in contents:
+                await asyncio.sleep(0.5)
+                finished.append(contents)
+            return await super().generate_content(contents, **kwargs)
+
+    async def generate_then_wait():
+        result = await ai_plan.generate_ai_weekly_plan_async(UserBase(email="a@test.com", variety_level="Medium"), 1800)
+        await asyncio.sleep(0.6)  # long enough for shards left running to finish
+        return result
+
+    monkeypatch.setattr(ai_client, "_client", SimpleNamespace(aio=SimpleNamespace(models=SlowModels(fail_day="Lunes"))))
+    result = asyncio.run(generate_then_wait())
+
+    assert result["plan"][0]["meals"][0]["name"] == "Semanal"
+    assert finished == []
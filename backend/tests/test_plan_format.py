@@ -0,0 +1,53 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import ai_client, ai_plan
+
+MEAL = {"n": "Lomo saltado", "k": 650, "p": 40, "c": 60, "f": 25, "i": ["res", "arroz"], "r": 25}
+
+
+def test_expand_day_fills_in_the_plan_shape():
+    day = ai_plan.expand_day({"m": [MEAL, {**MEAL, "n": "Sopa", "k": 350}]}, "Martes", ["Lunch", "Dinner"])
+
+    assert day["day"] == "Martes"
+    assert day["total_calories"] == 1000
+    assert day["meals"][0] == {
+        "meal_type": "Lunch", "name": "Lomo saltado", "calories": 650, "protein": 40,
+        "carbs": 60, "fats": 25, "ingredients": ["res", "arroz"], "prepTime": "25 min",
+    }
+    assert day["meals"][1]["meal_type"] == "Dinner"
+
+
+@pytest.mark.parametrize("compact", [
+    {"m": [MEAL]},                                   # wrong meal count
+    {"m": [MEAL, {**MEAL, "k": "650"}]},             # calories as text
+    {"m": [MEAL, {key: v for key, v in MEAL.items() if key != "i"}]},
+    {"m": [MEAL, {**MEAL, "n": " "}]},
+    {"plan": []},
+])
+def test_expand_day_rejects_malformed_output(compact):
+    with pytest.raises(ValueError):
+        ai_plan.expand_day(compact, "Lunes", ["Lunch", "Dinner"])
+
+
+def test_request_uses_the_compact_schema():
+    config = ai_plan._request_kwargs("prompt", 4)["config"]
+    days = config.response_schema.properties["d"]
+    assert days.min_items == days.max_items == 7
+    meals = days.items.properties["m"]
+    assert meals.min_items == meals.max_items == 4
+    assert list(meals.items.properties) == list(ai_plan.MEAL_KEYS)
+
+
+def test_malformed_plan_raises_instead_of_returning_an_empty_plan(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_CACHE_ENABLED", False)
+    truncated = {"d": [{"m": [MEAL] * 3}] * 5}
+    fake = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **kwargs: SimpleNamespace(text=json.dumps(truncated))))
+    monkeypatch.setattr(ai_client, "_client", fake)
+
+    with pytest.raises(ai_plan.PlanGenerationError):
+        ai_plan.generate_ai_weekly_plan(UserBase(email="a@test.com"), 1800)
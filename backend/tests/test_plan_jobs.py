@@ -0,0 +1,161 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import plan_coalescing, plan_jobs
+
+USER = UserBase(email="a@test.com", gender="Male")
+
+
+@pytest.fixture
+def jobs(monkeypatch):
+    """In-memory plan_jobs collection."""
+    store = {}
+    monkeypatch.setattr(settings, "PLAN_COALESCE_FIRESTORE", False)
+    monkeypatch.setattr(settings, "PLAN_JOB_RESUME", True)
+    plan_coalescing.clear()
+
+    def create(user_id, user, key, priority):
+        job_id = f"job-{len(store) + 1}"
+        store[job_id] = {"user_id": user_id, "profile": user.model_dump(mode="json"), "dedup_key": key,
+                         "priority": priority, "status": plan_jobs.QUEUED}
+        return {**store[job_id], "id": job_id}
+
+    def claim(job_id):
+        job = store[job_id]
+        if job["status"] != plan_jobs.QUEUED:
+            return None
+        job["status"] = plan_jobs.RUNNING
+        return {**job, "id": job_id}
+
+    def find_active(key):
+        for job_id, job in store.items():
+            if job["dedup_key"] == key and job["status"] in plan_jobs.ACTIVE_STATES:
+                return {**job, "id": job_id}
+        return None
+
+    monkeypatch.setattr(plan_jobs, "_create_job", create)
+    monkeypatch.setattr(plan_jobs, "_claim_job", claim)
+    monkeypatch.setattr(plan_jobs, "_find_active_job", find_active)
+    monkeypatch.setattr(plan_jobs, "_finish_job", lambda job_id, fields: store[job_id].update(fields))
+    monkeypatch.setattr(plan_jobs, "_pending_jobs", lambda: [
+        {**job, "id": job_id} for job_id, job in store.items() if job["status"] in plan_jobs.ACTIVE_STATES
+    ])
+    monkeypatch.setattr(plan_jobs, "get_job", lambda job_id: {**store[job_id], "id": job_id})
+    yield store
+    plan_coalescing.clear()
+
+
+def fake_generation(monkeypatch, order=None, fail=False):
+    async def generate_and_save(user_id, user):
+        await asyncio.sleep(0.01)
+        if order is not None:
+            order.append(user_id)
+        if fail:
+            raise RuntimeError("Gemini down")
+        return {"plan_id": f"plan-{user_id}", "summary": {}}
+
+    monkeypatch.setattr(plan_jobs, "generate_and_save", generate_and_save)
+
+
+async def drain():
+    await asyncio.sleep(0)
+    await plan_jobs._queue.join()
+
+
+def test_submit_returns_immediately_and_dedups(jobs, monkeypatch):
+    fake_generation(monkeypatch)
+
+    async def run():
+        await plan_jobs.start()
+        try:
+            first = await plan_jobs.submit("u1", USER)
+            second = await plan_jobs.submit("u1", USER)
+            assert first["status"] == plan_jobs.QUEUED
+            assert second["id"] == first["id"]
+            await drain()
+        finally:
+            await plan_jobs.stop()
+        return first["id"]
+
+    job_id = asyncio.run(run())
+    assert len(jobs) == 1
+    assert jobs[job_id]["status"] == plan_jobs.DONE
+    assert jobs[job_id]["plan_id"] == "plan-u1"
+
+
+def test_priority_order_and_failures(jobs, monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_JOB_WORKERS", 1)
+    order = []
+    fake_generation(monkeypatch, order)
+
+    # Both are queued before the single worker picks one
+    for job_id, user_id, priority in [("job-1", "regen", plan_jobs.PRIORITY_NORMAL),
+                                      ("job-2", "first", plan_jobs.PRIORITY_FIRST_PLAN)]:
+        jobs[job_id] = {"user_id": user_id, "profile": USER.model_dump(mode="json"), "dedup_key": user_id,
+                        "priority": priority, "status": plan_jobs.QUEUED}
+
+    async def run():
+        await plan_jobs.start()
+        try:
+            await drain()
+        finally:
+            await plan_jobs.stop()
+
+    asyncio.run(run())
+    assert order == ["first", "regen"]
+
+    fake_generation(monkeypatch, fail=True)
+
+    async def run_failing():
+        await plan_jobs.start()
+        try:
+            job = await plan_jobs.submit("u2", USER)
+            await drain()
+        finally:
+            await plan_jobs.stop()
+        return job["id"]
+
+    job_id = asyncio.run(run_failing())
+    assert jobs[job_id]["status"] == plan_jobs.FAILED
+    # Provider and internal error text stays in the logs
+    assert jobs[job_id]["error"] == plan_jobs.JOB_ERROR
+
+
+def test_start_resumes_pending_jobs(jobs, monkeypatch):
+    fake_generation(monkeypatch)
+    jobs["job-1"] = {"user_id": "u1", "profile": USER.model_dump(mode="json"), "dedup_key": "k",
+                     "priority": 10, "status": plan_jobs.QUEUED}
+
+    async def run():
+        await plan_jobs.start()
+        try:
+            await drain()
+        finally:
+            await plan_jobs.stop()
+
+    asyncio.run(run())
+    assert jobs["job-1"]["status"] == plan_jobs.DONE
+
+
+def test_find_active_job_reads_one_active_document(monkeypatch):
+    calls = []
+
+    class Query:
+        def where(self, field, op, value):
+            calls.append((field, op, value))
+            return self
+
+        def limit(self, count):
+            calls.append(("limit", count))
+            return self
+
+        def stream(self):
+            return iter([SimpleNamespace(id="job-1", to_dict=lambda: {"status": plan_jobs.QUEUED})])
+
+    monkeypatch.setattr(plan_jobs, "_jobs_ref", Query)
+    assert plan_jobs._find_active_job("key")["id"] == "job-1"
+    assert calls == [("dedup_key", "==", "key"), ("status", "in", list(plan_jobs.ACTIVE_STATES)), ("limit", 1)]
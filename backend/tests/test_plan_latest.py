@@ -0,0 +1,50 @@
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user
+from app.api.endpoints import plans
+from app.main import app
+
+PLAN = {"target_calories": 1800, "plan": [
+    {"day": "Lunes", "total_calories": 1800, "meals": [
+        {"name": f"Plato {i}", "calories": 600, "ingredients": ["arroz", "pollo"] * 20} for i in range(3)
+    ]},
+] * 7}
+
+
+def request_latest(monkeypatch, pointer=(None, None), headers=None):
+    reads = []
+    monkeypatch.setattr(plans.plan_service, "get_plan_pointer", lambda user_id: pointer)
+    monkeypatch.setattr(plans.plan_service, "get_latest_plan",
+                        lambda user_id, plan_id=None: reads.append(user_id) or ("plan-1", PLAN))
+    app.dependency_overrides[get_current_user] = lambda: {"id": "u1"}
+    try:
+        return TestClient(app).get("/api/v1/plans/latest", headers=headers or {}), reads
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_latest_sets_etag_and_compresses(monkeypatch):
+    response, reads = request_latest(monkeypatch, headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'W/"plan-1.{plans.plan_service.plan_version(PLAN)}"'
+    assert response.headers["content-encoding"] in ("gzip", "br")
+    assert response.json()["summary"]["plan"][0]["meals"][0]["name"] == "Plato 0"
+
+    again, _ = request_latest(monkeypatch, headers={"If-None-Match": response.headers["etag"]})
+    assert again.status_code == 304
+    assert again.content == b""
+
+
+def test_unchanged_plan_is_answered_from_the_pointer(monkeypatch):
+    version = plans.plan_service.plan_version(PLAN)
+
+    response, reads = request_latest(monkeypatch, ("plan-1", version),
+                                     {"If-None-Match": f'"other", W/"plan-1.{version}"'})
+    assert response.status_code == 304
+    assert reads == []
+
+    # A meal swap since the client's copy, possibly on another worker: full read
+    response, reads = request_latest(monkeypatch, ("plan-1", "newer"), {"If-None-Match": f'W/"plan-1.old"'})
+    assert response.status_code == 200
+    assert reads == ["u1"]
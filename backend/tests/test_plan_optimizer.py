@@ -0,0 +1,61 @@
+import itertools
+
+import pytest
+
+from app.core.config import settings
+from app.models.user import UserBase
+from app.services import nutrition_engine, plan_optimizer
+from app.services.recipe_index import RecipeIndex
+
+
+def balanced_meal(name, meal_type, calories, ingredients=()):
+    # 25% protein, 50% carbs, 25% fats
+    return {"id": name, "name": name, "meal_type": meal_type, "calories": calories,
+            "protein": round(calories * 0.25 / 4), "carbs": round(calories * 0.50 / 4),
+            "fats": round(calories * 0.25 / 9), "ingredients": list(ingredients)}
+
+
+@pytest.fixture
+def catalog():
+    index = RecipeIndex()
+    sizes = itertools.cycle([0.9, 1.0, 1.1])
+    for meal_type, base in (("Breakfast", 450), ("Lunch", 630), ("Dinner", 540)):
+        for i in range(8):
+            index.add(balanced_meal(f"{meal_type} {i}", meal_type, round(base * next(sizes))))
+    index.add(balanced_meal("Lunch con quinua", "Lunch", 640, ["Quinua"]))
+    index.loaded = True
+    return index
+
+
+def test_builds_week_within_tolerance(catalog):
+    user = UserBase(email="a@test.com", variety_level="High", foods_like=["quinua"])
+    result = plan_optimizer.optimize_weekly_plan(user, 1800, index=catalog)
+
+    assert [day["day"] for day in result["plan"]] == plan_optimizer.WEEK_DAYS
+    names = [meal["name"] for day in result["plan"] for meal in day["meals"]]
+    assert len(names) == len(set(names))  # High variety: no repeats
+    assert "Lunch con quinua" in names
+    for day in result["plan"]:
+        assert abs(day["total_calories"] - 1800) <= 1800 * settings.PLAN_OPTIMIZER_CALORIE_TOLERANCE
+        assert [meal["meal_type"] for meal in day["meals"]] == ["Breakfast", "Lunch", "Dinner"]
+
+
+def test_low_variety_repeats_days(catalog):
+    user = UserBase(email="a@test.com", variety_level="Low")
+    plan = plan_optimizer.optimize_weekly_plan(user, 1800, index=catalog)["plan"]
+    assert plan[0]["meals"] == plan[2]["meals"]
+    assert plan[0]["meals"] != plan[1]["meals"]
+
+
+def test_returns_none_when_catalog_cannot_meet_targets(catalog):
+    assert plan_optimizer.optimize_weekly_plan(UserBase(email="a@test.com", diet_type="Keto"), 1800, index=catalog) is None
+    assert plan_optimizer.optimize_weekly_plan(UserBase(email="a@test.com"), 1800, index=RecipeIndex()) is None
+
+
+def test_local_first_strategy_skips_the_ai(monkeypatch, catalog):
+    monkeypatch.setattr(settings, "PLAN_STRATEGY", "local_first")
+    monkeypatch.setattr("app.services.recipe_index._index", catalog)
+    monkeypatch.setattr(nutrition_engine.ai_plan, "generate_ai_weekly_plan", lambda *args: pytest.fail("AI called"))
+
+    result = nutrition_engine.generate_weekly_plan(UserBase(email="a@test.com"))  # target 1845 kcal
+    assert len(result["plan"]) == 7
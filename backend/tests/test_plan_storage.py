@@ -0,0 +1,137 @@
+import copy
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import plan_service
+
+
+class StubStore:
+    """Path-keyed in-memory stand-in for the few Firestore calls plan_service makes."""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = []
+        self._ids = 0
+
+    def collection(self, name):
+        return StubCollection(self, (name,))
+
+    def batch(self):
+        store = self
+
+        class Batch:
+            def __init__(self):
+                self.ops = []
+
+            def set(self, ref, data, merge=False):
+                self.ops.append((ref.set, data, merge))
+
+            def update(self, ref, fields):
+                self.ops.append((lambda data, merge: ref.update(data), fields, False))
+
+            def commit(self):
+                for write, data, merge in self.ops:
+                    write(data, merge=merge)
+
+        return Batch()
+
+
+class StubCollection:
+    def __init__(self, store, path):
+        self.store, self.path = store, path
+
+    def document(self, doc_id=None):
+        if doc_id is None:
+            self.store._ids += 1
+            doc_id = f"plan{self.store._ids}"
+        return StubRef(self.store, self.path + (doc_id,))
+
+    def stream(self):
+        for path in list(self.store.docs):
+            if len(path) == len(self.path) + 1 and path[:-1] == self.path:
+                yield StubRef(self.store, path).get()
+
+
+class StubRef:
+    def __init__(self, store, path):
+        self.store, self.path, self.id = store, path, path[-1]
+
+    def collection(self, name):
+        return StubCollection(self.store, self.path + (name,))
+
+    def get(self):
+        data = self.store.docs.get(self.path)
+        return SimpleNamespace(id=self.id, exists=data is not None, reference=self,
+                               to_dict=lambda: copy.deepcopy(data))
+
+    def set(self, data, merge=False):
+        self.store.writes.append(self.path)
+        base = self.store.docs.get(self.path, {}) if merge else {}
+        self.store.docs[self.path] = {**base, **copy.deepcopy(data)}
+
+    def update(self, fields):
+        self.store.writes.append(self.path)
+        self.store.docs[self.path].update(copy.deepcopy(fields))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    stub = StubStore()
+    monkeypatch.setattr(plan_service, "get_db", lambda: stub)
+    monkeypatch.setattr(plan_service.user_service, "invalidate_user", lambda user_id: None)
+    monkeypatch.setattr(plan_service.recipe_index, "add_plan", lambda plan: 0)
+    return stub
+
+
+def make_result(days=3):
+    return {
+        "bmr": 1500, "tdee": 2000, "target_calories": 1800,
+        "plan": [
+            {"day": f"Day {i}", "total_calories": 500,
+             "meals": [{"id": f"m{i}", "name": f"Meal {i}", "meal_type": "Lunch", "calories": 500}]}
+            for i in range(days)
+        ],
+    }
+
+
+def test_save_splits_plan_into_day_documents(store):
+    plan_id = plan_service.save_plan("u1", make_result())
+
+    header = store.docs[("users", "u1", "meal_plans", plan_id)]
+    assert "plan" not in header
+    assert header["day_count"] == 3
+    assert store.docs[("users", "u1")]["latest_plan_id"] == plan_id
+    day = store.docs[("users", "u1", "meal_plans", plan_id, "plan_days", "01")]
+    assert day["day"] == "Day 1"
+
+    loaded_id, plan = plan_service.get_latest_plan("u1")
+    assert loaded_id == plan_id
+    assert [day["day"] for day in plan["plan"]] == ["Day 0", "Day 1", "Day 2"]
+
+
+def test_day_update_touches_only_that_day(store):
+    plan_id = plan_service.save_plan("u1", make_result())
+    _, plan = plan_service.get_latest_plan("u1")
+    store.writes.clear()
+
+    version = store.docs[("users", "u1")][plan_service.VERSION_FIELD]
+    plan["plan"][2]["meals"][0]["name"] = "Swapped"
+    plan_service.update_plan_day("u1", plan_id, plan, 2)
+
+    assert store.writes == [("users", "u1", "meal_plans", plan_id, "plan_days", "02"), ("users", "u1")]
+    assert store.docs[("users", "u1")][plan_service.VERSION_FIELD] != version
+    _, reloaded = plan_service.get_latest_plan("u1")
+    assert reloaded["plan"][2]["meals"][0]["name"] == "Swapped"
+    assert reloaded["plan"][1]["meals"][0]["name"] == "Meal 1"
+
+
+def test_legacy_single_document_plans_still_work(store):
+    store.docs[("users", "u1")] = {"latest_plan_id": "old"}
+    store.docs[("users", "u1", "meal_plans", "old")] = make_result(2)
+
+    _, plan = plan_service.get_latest_plan("u1")
+    plan["plan"][0]["meals"][0]["name"] = "Swapped"
+    plan_service.update_plan_day("u1", "old", plan, 0)
+
+    assert store.docs[("users", "u1", "meal_plans", "old")]["plan"][0]["meals"][0]["name"] == "Swapped"
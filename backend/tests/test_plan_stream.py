@@ -0,0 +1,89 @@
+import json
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_current_user
+from app.api.endpoints import plans
+from app.core.config import settings
+from app.main import app
+from app.services import ai_client, ai_plan, plan_cache
+
+def compact_day(*names):
+    return {"m": [{"n": name, "k": 600, "p": 30, "c": 60, "f": 20, "i": ["pan", "palta"], "r": 10} for name in names]}
+
+
+PLAN = {"d": [
+    compact_day("Pan con \"palta\" {casero}", "Lomo saltado", "Sopa"),
+    compact_day("Avena", "Ceviche", "Tacos"),
+] * 3 + [compact_day("Huevos", "Arroz con pollo", "Ensalada")]}
+
+
+def chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_parser_emits_each_day_as_it_completes():
+    parser = ai_plan.PlanStreamParser(array_key="d")
+    text = "```json\n" + json.dumps(PLAN, ensure_ascii=False) + "\n```"
+    emitted = []
+    for chunk in chunks(text):
+        emitted.extend(parser.feed(chunk))
+    assert emitted == PLAN["d"]
+
+
+def test_parser_ignores_nested_arrays_outside_plan():
+    parser = ai_plan.PlanStreamParser()
+    text = json.dumps({"notes": [{"day": "x"}], "plan": [{"day": "Lunes", "meals": []}]})
+    assert parser.feed(text) == [{"day": "Lunes", "meals": []}]
+
+
+def stream_plan(monkeypatch, save_plan):
+    async def generate_content_stream(**kwargs):
+        async def gen():
+            for chunk in chunks(json.dumps(PLAN)):
+                yield SimpleNamespace(text=chunk)
+        return gen()
+
+    fake = SimpleNamespace(aio=SimpleNamespace(models=SimpleNamespace(generate_content_stream=generate_content_stream)))
+    monkeypatch.setattr(ai_client, "_client", fake)
+    monkeypatch.setattr(plans.plan_service, "save_plan", save_plan)
+    app.dependency_overrides[get_current_user] = lambda: {"id": "u1", "email": "a@test.com", "gender": "Male"}
+    try:
+        response = TestClient(app).post("/api/v1/plans/generate/stream?user_id=u1")
+    finally:
+        app.dependency_overrides.clear()
+    return [block.split("\n") for block in response.text.strip().split("\n\n")]
+
+
+def test_stream_endpoint_sends_days_then_saves(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_CACHE_FIRESTORE", False)
+    monkeypatch.setattr(settings, "PUBLIC_BASE_URL", "https://api.fitia.test")
+    plan_cache.clear()
+    saved = {}
+
+    events = stream_plan(monkeypatch, lambda user_id, result: saved.setdefault("result", result) and "plan-1")
+    names = [lines[0].removeprefix("event: ") for lines in events]
+    assert names == ["start"] + ["day"] * 7 + ["done"]
+    first_day = json.loads(events[1][1].removeprefix("data: "))
+    assert first_day["day"] == "Lunes"
+    assert first_day["meals"][0]["name"] == 'Pan con "palta" {casero}'
+    assert first_day["meals"][0]["meal_type"] == "Breakfast"
+    assert first_day["meals"][0]["image"].startswith("https://api.fitia.test/api/v1/images/")
+    assert json.loads(events[-1][1].removeprefix("data: ")) == {"plan_id": "plan-1"}
+    assert len(saved["result"]["plan"]) == 7
+    plan_cache.clear()
+
+
+def test_failed_save_ends_the_stream_with_an_error(monkeypatch):
+    monkeypatch.setattr(settings, "PLAN_CACHE_FIRESTORE", False)
+    plan_cache.clear()
+
+    def save_plan(user_id, result):
+        raise RuntimeError("firestore unavailable")
+
+    events = stream_plan(monkeypatch, save_plan)
+    names = [lines[0].removeprefix("event: ") for lines in events]
+    assert names == ["start"] + ["day"] * 7 + ["error"]
+    assert json.loads(events[-1][1].removeprefix("data: ")) == {"detail": "Plan generation failed"}
+    plan_cache.clear()
@@ -0,0 +1,109 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import nutrition_engine, recipe_index
+from app.services.recipe_index import RecipeIndex
+
+
+def meal(name, meal_type, calories, ingredients=(), id=None):
+    return {"id": id or name, "name": name, "meal_type": meal_type, "calories": calories,
+            "ingredients": list(ingredients)}
+
+
+@pytest.fixture
+def index():
+    index = RecipeIndex()
+    index.add_plan({"plan": [
+        {"day": "Lunes", "meals": [
+            meal("Ceviche de pescado", "Lunch", 520, ["Pescado", "Limón"]),
+            meal("Pollo a la plancha con arroz", "Lunch", 560, ["Pollo", "Arroz"]),
+            meal("Lomo saltado", "Lunch", 900, ["Res", "Papas"]),
+            meal("Avena con plátano", "Breakfast", 400, ["Avena", "Plátano"]),
+            meal("Registrar Comida", "Dinner", 0),
+        ]},
+        {"day": "Martes", "meals": [meal("Pollo a la plancha con arroz", "Lunch", 560)]},
+    ]})
+    index.loaded = True
+    return index
+
+
+def test_deduplicates_and_skips_placeholders(index):
+    assert len(index) == 4
+
+
+def test_find_filters_by_type_calories_and_keywords(index):
+    assert index.find("lunch", 550, keywords=["pollos"])["name"] == "Pollo a la plancha con arroz"
+    assert index.find("Lunch", 550, keywords=["pescado"])["name"] == "Ceviche de pescado"
+    assert index.find("Lunch", 550, keywords=["res"]) is None  # outside ±15%
+    assert index.find("Lunch", 880, keywords=["res"])["name"] == "Lomo saltado"
+    assert index.find("Breakfast", 550) is None
+
+
+def test_find_excludes_current_meal(index):
+    found = index.find("Lunch", 530, exclude_names=["Ceviche de Pescado"])
+    assert found["name"] == "Pollo a la plancha con arroz"
+    assert index.find("Lunch", 530, exclude_ids=["Ceviche de pescado", "Pollo a la plancha con arroz"]) is None
+
+
+def test_update_latest_plan_meal_swaps_from_index(monkeypatch, index):
+    plan = {"plan": [{"day": "Lunes", "total_calories": 920, "meals": [
+        meal("Avena con plátano", "Breakfast", 400),
+        meal("Ceviche de pescado", "Lunch", 520),
+    ]}]}
+    updates = {}
+    monkeypatch.setattr(recipe_index, "_index", index)
+    monkeypatch.setattr("app.services.plan_service.get_latest_plan", lambda user_id, plan_id=None: ("p1", plan))
+    monkeypatch.setattr("app.services.plan_service.update_plan_day",
+                        lambda user_id, plan_id, plan, day_index: updates.update(plan=plan["plan"], day_index=day_index))
+
+    result = nutrition_engine.update_latest_plan_meal("u1", "Lunch", ["pollo"])
+
+    assert result["success"]
+    assert updates["day_index"] == 0
+    day = updates["plan"][0]
+    assert day["meals"][1]["name"] == "Pollo a la plancha con arroz"
+    assert day["total_calories"] == 960
+
+
+def test_find_skips_excluded_ingredients(index):
+    assert index.find("Lunch", 540, exclude_keywords=["pescado"])["name"] == "Pollo a la plancha con arroz"
+
+
+def test_find_respects_the_diet(index):
+    index.add(meal("Tofu salteado con arroz", "Lunch", 540, ["Tofu", "Arroz"]))
+    assert index.find("Lunch", 540, diet_type="Vegan")["name"] == "Tofu salteado con arroz"
+    assert index.find("Lunch", 540, keywords=["pollo"], diet_type="Vegan") is None
+    assert index.find("Lunch", 540, keywords=["pollo"], diet_type="Balanced") is not None
+
+
+class StubQuery:
+    def __init__(self, docs):
+        self.docs, self.filters = docs, []
+
+    def where(self, field, op, value):
+        self.filters.append((field, op, value))
+        return self
+
+    def limit(self, count):
+        return self
+
+    def stream(self):
+        for data in self.docs:
+            if all(op != "!=" or data.get(field) != value for field, op, value in self.filters):
+                yield SimpleNamespace(to_dict=lambda data=data: data)
+
+
+def test_load_reads_only_legacy_plan_documents(monkeypatch):
+    day = {"day": "Lunes", "meals": [meal("Ceviche de pescado", "Lunch", 520)]}
+    queries = {
+        "plan_days": StubQuery([day]),
+        # A new-layout header (no meals) and a legacy week in one document
+        "meal_plans": StubQuery([{"layout": "days", "day_count": 1},
+                                 {"plan": [{"day": "Lunes", "meals": [meal("Lomo saltado", "Lunch", 900)]}]}]),
+    }
+    monkeypatch.setattr("app.db.firebase.get_db", lambda: SimpleNamespace(collection_group=queries.get))
+
+    index = RecipeIndex()
+    assert recipe_index.load_from_firestore(index) == 2
+    assert queries["meal_plans"].filters == [("plan", "!=", None)]
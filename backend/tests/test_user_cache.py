@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import user_service
+
+
+class StubUsers:
+    """Just enough of a Firestore 'users' collection to count reads."""
+
+    def __init__(self):
+        self.docs = {"u1": {"email": "a@test.com", "name": "Ana"}}
+        self.reads = 0
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        stub = self
+
+        class Ref:
+            def get(self):
+                stub.reads += 1
+                data = stub.docs.get(doc_id)
+                return SimpleNamespace(exists=data is not None, to_dict=lambda: dict(data))
+
+            def set(self, data, merge=False):
+                stub.docs[doc_id] = {**stub.docs.get(doc_id, {}), **data}
+
+        return Ref()
+
+    def where(self, field, op, value):
+        self._email = value
+        return self
+
+    def limit(self, count):
+        return self
+
+    def stream(self):
+        self.reads += 1
+        return [SimpleNamespace(id=doc_id, to_dict=lambda data=data: dict(data))
+                for doc_id, data in self.docs.items() if data.get("email") == self._email]
+
+
+@pytest.fixture
+def users(monkeypatch):
+    stub = StubUsers()
+    monkeypatch.setattr(user_service, "get_db", lambda: stub)
+    user_service.clear_cache()
+    yield stub
+    user_service.clear_cache()
+
+
+def test_reads_are_cached_by_id_and_email(users):
+    assert user_service.get_user("u1")["name"] == "Ana"
+    assert user_service.get_user("u1")["name"] == "Ana"
+    assert user_service.get_user_by_email("a@test.com")["id"] == "u1"
+    assert users.reads == 1
+
+    stats = user_service.get_cache_stats()
+    assert stats["by_id_hits"] == 2
+    assert stats["max_staleness_seconds"] >= 0
+
+
+def test_returned_profiles_are_copies(users):
+    user_service.get_user("u1")["name"] = "Mutated"
+    assert user_service.get_user("u1")["name"] == "Ana"
+
+
+def test_update_invalidates(users):
+    user_service.get_user_by_email("a@test.com")
+    user_service.update_user("u1", {"name": "Ana María"})
+
+    assert user_service.get_user("u1")["name"] == "Ana María"
+    assert user_service.get_user_by_email("a@test.com")["name"] == "Ana María"
+    assert users.reads == 2
+
+
+def test_plan_pointer_is_read_fresh(users, monkeypatch):
+    from app.services import plan_service
+    monkeypatch.setattr(plan_service, "get_db", lambda: users)
+    users.docs["u1"].update({"latest_plan_id": "p1", plan_service.VERSION_FIELD: "v1"})
+    assert "latest_plan_id" not in user_service.get_user("u1")
+
+    # Another worker saves a plan; this one still has the profile cached
+    users.docs["u1"].update({"latest_plan_id": "p2", plan_service.VERSION_FIELD: "v2"})
+    assert plan_service.get_plan_pointer("u1") == ("p2", "v2")
@@ -15,6 +15,15 @@ const api = axios.create({
     baseURL: API_URL,
 });
 
+// Attach the JWT issued by /auth/login to every request
+api.interceptors.request.use((config) => {
+    const token = localStorage.getItem('token');
+    if (token) {
+        config.headers.Authorization = `Bearer ${token}`;
+    }
+    return config;
+});
+
 api.interceptors.response.use(
     (response) => response,
     (error) => {